@@ -1,9 +1,23 @@
+import numpy as np
 import pandas as pd
 import MeCab
-from sklearn.feature_extraction.text import TfidfVectorizer
 import os
-import matplotlib.pyplot as plt
-from collections import Counter 
+import argparse
+from functools import partial
+from plotting import pyplot, set_headless
+from csv_reader import detect_encoding, iter_csv_chunks
+from incremental_state import fingerprint
+from instrumentation import PipelineProfiler
+from morpheme_memo import MorphemeMemo
+from near_duplicates import DEFAULT_THRESHOLD, NearDuplicateIndex
+from text_memo import TextMemo
+from token_cache import dictionary_identity, get_token_cache
+from token_table import open_token_table
+from tfidf_utils import (TfidfStatistics, cosine_similarity_blocks, ngram_counts, save_tfidf_matrix,
+                         top_k_in_row, top_k_neighbors)
+from token_corpus import TokenCorpus
+from tokenize_pool import tokenize_reviews
+from title_pool import run_titles
 
 # 複数のレビューファイルの設定
 file_config = [
@@ -23,62 +37,129 @@ stop_words = {
     "感想", "点", "部分", "今回", "感じ", "思った", "ところ", "また" 
 }
 
-# MeCab Taggerの初期化
-try:
-    mecab = MeCab.Tagger() 
-except Exception as e:
-    print(f"MeCabの初期化に失敗しました: {e}")
-    exit()
+# MeCab Taggerと形態素解析結果のキャッシュ (他のスクリプトと共有) は、最初に使うときに初期化する
+# (モジュールを import しただけでは何も実行しない)
+mecab = None
+token_cache = None
 
-# Matplotlibの日本語設定
-plt.rcParams['font.family'] = 'Meiryo' 
-plt.rcParams['font.size'] = 12
+def get_mecab():
+    global mecab
+    if mecab is None:
+        try:
+            mecab = MeCab.Tagger()
+        except Exception as e:
+            print(f"MeCabの初期化に失敗しました: {e}")
+            exit()
+    return mecab
 
-# --- 2. ユーティリティ関数（データ読み込み・前処理） ---
+def get_cache():
+    global token_cache
+    if token_cache is None:
+        token_cache = get_token_cache()
+    return token_cache
 
-def force_read_csv(file_path):
-    """複数のエンコーディングを試してCSVを読み込む"""
-    encodings_to_try = ['utf-8', 'shift_jis', 'cp932', 'euc-jp']
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=encoding)
-            return df
-        except Exception:
-            continue
-    try:
-        df = pd.read_csv(file_path, encoding='utf-8', errors='ignore')
-        return df
-    except Exception:
-        return None
+# グラフの日本語設定 (グラフを描くときに反映する)
+CHART_RC = {'font.family': 'Meiryo', 'font.size': 12}
+
+# 作品ごとの棒グラフ・特徴語の表示と作品間の類似度ヒートマップを作る作品数の上限
+# (文書集合が大きい場合はCSVだけを出力する)
+CHART_MAX_TITLES = 60
+
+# 文書集合を指定した場合 (--documents / --inputs) の出現回数の保存先と出力ファイル名の接頭辞
+# (既定の作品の保存済み出現回数や結果を上書きしない)
+DOCUMENTS_STATE_DIR = os.path.join('results', 'state', 'tfidf_documents')
+DOCUMENTS_PREFIX = 'tfidf_documents'
+
+# 文書集合の設定CSVの必須列 (filter_col, filter_value 列は任意)
+DOCUMENT_COLUMNS = ('title', 'path', 'review_col')
+
+# 作品名は保存ファイル名 ({title}_counts.json, {title}_..._top10_features.png) に使うため、
+# パス区切りやWindowsでファイル名に使えない文字・名前を含む作品名は受け付けない
+UNSAFE_TITLE_CHARS = set('/\\<>:"|?*')
+RESERVED_TITLES = {'CON', 'PRN', 'AUX', 'NUL', *(f'COM{i}' for i in range(1, 10)), *(f'LPT{i}' for i in range(1, 10))}
+
+# 処理段階ごとの計測 (results/tfidf_timings.json に出力)
+profiler = PipelineProfiler('tfidf')
+
+# 形態素解析の対象品詞
+target_hinshi = ('名詞', '動詞', '形容詞', '感動詞')
+
+# --- 2. ユーティリティ関数（データ読み込み・前処理） ---
 
 def preprocess_text(text, mecab_tagger):
     """テキストを形態素解析し、名詞・動詞・形容詞・感動詞の原形を抽出"""
-    words = []
     if not isinstance(text, str) or len(text) < 2:
         return []
-        
-    target_hinshi = ('名詞', '動詞', '形容詞', '感動詞')
-    
+    # 同じ文面は1回だけ解析する
+    return list(text_memo.get(text, _preprocess_words, mecab_tagger))
+
+def _preprocess_words(text, mecab_tagger):
     try:
-        node = mecab_tagger.parseToNode(text)
+        # 品詞フィルタ済みの形態素をキャッシュ経由で取得
+        morphemes = get_cache().morphemes(mecab_tagger, text, target_hinshi)
     except Exception:
-        return []
+        return ()
 
-    while node:
-        features = node.feature.split(',')
-        hinshi = features[0]
-        
-        original_form_for_check = node.surface
-        if len(features) >= 7 and features[6] != '*':
-            original_form_for_check = features[6]
+    return tuple(select_words(morphemes))
 
-        surface_form = node.surface
-        
-        # NOTE: n-gram生成を外部で行うため、ここでは単語リストを生成する
-        if hinshi in target_hinshi and original_form_for_check not in stop_words and len(surface_form) > 1:
-            words.append(surface_form)
-        
-        node = node.next
+def preprocess_reviews(reviews, mecab_tagger, workers=1):
+    """複数のレビューをまとめて前処理する (workers > 1 でプロセス並列。同じ文面は1回だけ解析する)"""
+    targets = [i for i, text in enumerate(reviews) if isinstance(text, str) and len(text) >= 2]
+    target_texts = [reviews[i] for i in targets]
+
+    def compute(positions):
+        with profiler.stage('tokenize', items=len(positions)):
+            morphemes_list = tokenize_reviews([target_texts[p] for p in positions], mecab_tagger, target_hinshi,
+                                              workers=workers, cache=get_cache())
+        with profiler.stage('filter', items=len(positions)):
+            return [tuple(select_words(m)) if m is not None else () for m in morphemes_list]
+
+    processed = [[] for _ in reviews]
+    for i, words in zip(targets, text_memo.get_many(target_texts, compute)):
+        processed[i] = list(words)
+    return processed
+
+def preprocess_table(table, row_ids, texts):
+    """
+    トークン表 (token_table.TokenTable) から指定した行を取り出して前処理する。MeCabは呼ばない。
+    texts は各行の本文 (row_ids と同じ順)。同じ文面の行は1回だけ取り出す
+    """
+    # 文字列でない行はトークン表でも空のレビューになっている
+    targets = [i for i, text in enumerate(texts) if isinstance(text, str)]
+
+    def compute(positions):
+        with profiler.stage('filter', items=len(positions)):
+            return [tuple(select_words(m))
+                    for m in table.iter_select([row_ids[targets[p]] for p in positions], target_hinshi)]
+
+    processed = [[] for _ in row_ids]
+    for i, words in zip(targets, text_memo.get_many([texts[i] for i in targets], compute)):
+        processed[i] = list(words)
+    return processed
+
+def select_word(morpheme):
+    """1つの形態素から採用する単語 (ストップワードか1文字語なら None)"""
+    surface_form, hinshi, base_form, reading = morpheme
+    original_form_for_check = base_form or surface_form
+    if original_form_for_check not in stop_words and len(surface_form) > 1:
+        return surface_form
+    return None
+
+# 異なり形態素ごとの select_word の結果 (main の実行ごとに空にする)
+word_memo = MorphemeMemo(select_word)
+
+# 本文 → 前処理結果 の LRU メモ (作品をまたいで共有し、main の実行ごとに空にする)
+text_memo = TextMemo()
+
+def select_words(morphemes):
+    """形態素列からストップワードと1文字語を除いた表層形のリストを作る"""
+    # NOTE: n-gram生成を外部で行うため、ここでは単語リストを生成する
+    memo = word_memo
+    words = []
+    for morpheme in morphemes:
+        word = memo[morpheme]
+        if word is not None:
+            words.append(word)
     return words
 
 def generate_ngrams(token_list, n_gram=1):
@@ -92,56 +173,246 @@ def generate_ngrams(token_list, n_gram=1):
 
 
 def extract_feature_words(terms, tfidfs, i, n):
-    # tfidfsは密行列（toarray()後）
-    tfidf_array = tfidfs[i]
-    top_n_idx = tfidf_array.argsort()[-n:][::-1]
+    # tfidfsは疎行列（CSR）のまま受け取り、i行目の非ゼロ要素から上位n件を部分選択する
+    top_n_idx, top_n_scores = top_k_in_row(tfidfs, i, n)
     words = [terms[idx] for idx in top_n_idx]
-    scores = [tfidf_array[idx] for idx in top_n_idx]
+    scores = list(top_n_scores)
     return list(zip(words, scores))
-def main():
+
+
+def write_title_similarity(tfidfs, titles, n_neighbors, matrix_path, neighbors_path):
+    """
+    作品間のコサイン類似度の行列 (matrix_path) と、作品ごとに類似度の高い上位 n_neighbors 作品
+    (neighbors_path) をCSVに書き出す。類似度はブロックごとに計算して書き出すので、作品数が
+    数千でも n×n の行列全体は持たない。ヒートマップ用に、作品数が CHART_MAX_TITLES 以下の
+    場合だけ行列全体 (numpy配列) を返す (それ以外は None)。
+    """
+    keep_matrix = len(titles) <= CHART_MAX_TITLES
+    blocks = []
+    neighbor_rows = []
+    for start, block in cosine_similarity_blocks(tfidfs):
+        block_titles = titles[start:start + len(block)]
+        pd.DataFrame(block, index=pd.Index(block_titles, name='Game_Title'), columns=titles).to_csv(
+            matrix_path, mode='w' if start == 0 else 'a', header=start == 0, encoding='utf-8')
+
+        neighbor_idx, neighbor_sims = top_k_neighbors(block, start, n_neighbors)
+        for title, idx, sims in zip(block_titles, neighbor_idx, neighbor_sims):
+            # 共通する語が1つもない作品 (類似度0) は近傍に含めない
+            ranked = [(titles[j], sim) for j, sim in zip(idx, sims) if sim > 0]
+            for rank, (neighbor, sim) in enumerate(ranked, start=1):
+                neighbor_rows.append((title, rank, neighbor, sim))
+        if keep_matrix:
+            blocks.append(block)
+
+    pd.DataFrame(neighbor_rows, columns=['Game_Title', 'Rank', 'Neighbor_Title', 'Cosine_Similarity']).to_csv(
+        neighbors_path, index=False, encoding='utf-8')
+    return np.vstack(blocks) if keep_matrix and blocks else None
+
+
+def load_documents(config_path):
+    """
+    文書集合の設定CSVを読み込み、file_config と同じ形式のリストを返す。
+    列は title, path, review_col (必須) と filter_col, filter_value (任意)。filter_col を指定した行は、
+    CSVのその列の値が filter_value (文字列として比較) に一致するレビューだけを1つの文書とする
+    (同じCSVをバージョン別・月別などに分けて比べる場合)。
+    """
+    df = pd.read_csv(config_path, encoding=detect_encoding(config_path) or 'utf-8', dtype=str,
+                     keep_default_na=False)
+    missing = [col for col in DOCUMENT_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"列 {', '.join(repr(col) for col in missing)} が {config_path} に見つかりません。")
+
+    documents = []
+    for row in df.to_dict('records'):
+        config = {key: row[key].strip() for key in DOCUMENT_COLUMNS}
+        if row.get('filter_col', '').strip():
+            config['filter_col'] = row['filter_col'].strip()
+            config['filter_value'] = row.get('filter_value', '')
+        documents.append(config)
+    return check_documents(documents, config_path)
+
+
+def documents_from_paths(paths, review_col):
+    """CSVのパスのリストから、ファイル名 (拡張子なし) を作品名とする file_config 形式のリストを作る"""
+    documents = [{'title': os.path.splitext(os.path.basename(path))[0], 'path': path, 'review_col': review_col}
+                 for path in paths]
+    return check_documents(documents, '--inputs')
+
+
+def is_safe_title(title):
+    """作品名をそのまま結果のファイル名に使えるか (ディレクトリの外を指さず、Windowsでも作れるか)"""
+    if not title or title != title.strip() or title.endswith('.') or '..' in title:
+        return False
+    if any(c in UNSAFE_TITLE_CHARS or ord(c) < 32 for c in title):
+        return False
+    return title.split('.')[0].upper() not in RESERVED_TITLES
+
+
+def check_documents(documents, source):
+    """
+    文書集合が空でなく、作品名がファイル名に使えて重複せず、CSVがすべて存在することを確かめる
+    (問題があれば ValueError)
+    """
+    if not documents:
+        raise ValueError(f"{source} に文書が1件もありません。")
+    missing = [config['path'] for config in documents if not os.path.isfile(config['path'])]
+    if missing:
+        raise ValueError(f"{source} のCSV {', '.join(repr(p) for p in missing)} が見つかりません。")
+    titles = [config['title'] for config in documents]
+    unsafe = [title for title in titles if not is_safe_title(title)]
+    if unsafe:
+        raise ValueError(f"{source} の作品名 {', '.join(repr(t) for t in unsafe)} はファイル名に使えません "
+                         f"(/ \\ .. や < > : \" | ? * などを含まない名前にしてください)。")
+    duplicated = sorted({title for title in titles if titles.count(title) > 1})
+    if duplicated:
+        raise ValueError(f"{source} の作品名 {', '.join(repr(t) for t in duplicated)} が重複しています。")
+    return documents
+
+
+def input_signature(config, dedup_threshold=None):
+    """CSVのサイズ・更新日時と前処理の設定 (行の絞り込みを含む) から、作品の入力を識別する文字列を作る"""
+    try:
+        stat = os.stat(config['path'])
+    except OSError:
+        return None
+    # 重複除去・絞り込みなしの場合は従来と同じ文字列にする (保存済みの出現回数をそのまま使えるように)
+    dedup = () if dedup_threshold is None else (('dedup', dedup_threshold),)
+    row_filter = () if not config.get('filter_col') else (('filter', config['filter_col'], config['filter_value']),)
+    return fingerprint(config['path'], config['review_col'], stat.st_size, stat.st_mtime_ns,
+                       stop_words, target_hinshi, dictionary_identity(get_mecab()), *dedup, *row_filter)
+
+
+def count_title_ngrams(config, workers=1, dedup_threshold=None):
+    """
+    1作品分のCSVを前処理してN-gramの出現回数を数える (作品ごとの並行処理の単位)。
+    dedup_threshold を指定すると、類似度がそれ以上のレビューは最初の1件だけを数える。
+    config に filter_col がある場合は、その列の値が filter_value の行だけを数える (load_documents を参照)。
+    CSVを開けない場合は空の出現回数を返す。
+    """
+    title = config['title']
+    path = config['path']
+    review_col = config['review_col']
+    filter_col = config.get('filter_col')
+    usecols = [review_col] if filter_col in (None, review_col) else [review_col, filter_col]
+    dtype = {filter_col: str} if filter_col else None
+
+    print(f"\n==================== {title} の前処理を開始 ====================")
+    profiler.set_title(title)
+    text_memo.reset_stats()
+    
+    # 形態素解析はトークン表として行い、他の分析と共有する (まだ表に無い行だけをチャンクごとに解析して加える)
+    table = open_token_table(path, review_col, get_mecab())
+    if table is None:
+        # CSVが無い作品は他のスクリプトと同じく飛ばし、出現回数0の作品として扱う
+        print(f"⚠️ {title} はCSVを開けないため、レビュー0件として扱います。")
+        return ngram_counts(TokenCorpus.from_token_lists([]))
+
+    # 重複・類似レビューの判定はチャンクをまたいで行う
+    duplicates = NearDuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+
+    def title_reviews():
+        # レビュー列 (と絞り込みの列) だけをチャンクごとに読み込み、ファイル全体をメモリに載せない
+        for chunk in profiler.timed_iter('load', iter_csv_chunks(path, usecols=usecols, dtype=dtype)):
+            if filter_col:
+                # 行番号はCSV全体のまま残るので、トークン表は絞り込み方の違う文書の間でも共有できる
+                chunk = chunk[chunk[filter_col] == config['filter_value']]
+            raw_reviews = chunk[review_col]
+            chunk_reviews = raw_reviews.astype(str).str.strip().replace('nan', '')
+            selected = chunk_reviews[chunk_reviews.str.len() > 1]
+            if duplicates is not None:
+                with profiler.stage('dedup', items=len(selected)):
+                    selected = selected[[duplicates.add(text) is None for text in selected]]
+
+            # フィルタリング (チャンクの行番号はCSV全体の行番号と一致する)
+            if table is not None:
+                selected_raw = raw_reviews.loc[selected.index]
+                with profiler.stage('tokenize', items=len(selected)):
+                    table.ensure(selected_raw, get_mecab(), workers=workers, cache=get_cache())
+                processed_reviews = preprocess_table(table, selected.index.tolist(), selected_raw.tolist())
+            else:
+                processed_reviews = preprocess_reviews(selected.tolist(), get_mecab(), workers=workers)
+
+            with profiler.stage('ngram', items=len(processed_reviews)):
+                chunk_ngrams = [generate_ngrams(review, n_gram=1) for review in processed_reviews]
+            yield from chunk_ngrams
+
+    # 作品の全レビューを語彙番号のコーパスとして持つ (単語文字列の巨大なリストを作らない)
+    corpus = TokenCorpus.from_token_lists(title_reviews())
+    if table is not None and table.modified:
+        table.save()
+    
+    with profiler.stage('count', items=len(corpus.token_ids)):
+        counts = ngram_counts(corpus)
+    print(f"✅ {title} のN-gram出現回数を数えました。（総単語数: {len(corpus.token_ids)}）")
+    print(f"♻️ {title}: 前処理 {text_memo.summary()}。")
+    if duplicates is not None:
+        print(f"🔁 {title}: 重複・類似レビュー {duplicates.n_duplicates} / {duplicates.n_added} 件 "
+              f"({duplicates.duplicate_rate():.1%}) を除いて数えました。")
+    return counts
+
+
+def main(workers=1, save_matrix=False, rebuild=False, title_workers=1, charts=True, headless=False,
+         dedup_threshold=None, similarity=False, n_neighbors=5, documents=None):
+    """
+    charts=False の場合は棒グラフを作らない (matplotlib を読み込まない)。
+    headless=True の場合は画面を使わずに描画してファイルに保存する。
+    dedup_threshold を指定すると、重複・類似レビューを1件として数える (count_title_ngrams を参照)。
+    similarity=True の場合は作品間のコサイン類似度と、作品ごとの類似作品上位 n_neighbors 件も出力する。
+    documents (file_config と同じ形式のリスト) を指定すると、file_config の代わりにその文書集合を比べる。
+    その場合の保存済み出現回数と結果のファイル名は既定の作品とは別にする (DOCUMENTS_PREFIX)。
+    """
     print("TF-IDFを用いた作品間特徴語抽出を開始します...")
+    set_headless(headless)
+    # ストップワードを編集した場合に備え、形態素ごとの判定結果は実行ごとに作り直す
+    word_memo.clear()
+    text_memo.clear()
 
     if not os.path.exists('results'):
         os.makedirs('results')
 
-    titles = [c['title'] for c in file_config]
-    combined_reviews_by_title = {}
+    if documents is None:
+        configs = file_config
+        prefix = 'tfidf'
+        stats = TfidfStatistics()
+    else:
+        configs = documents
+        prefix = DOCUMENTS_PREFIX
+        stats = TfidfStatistics(DOCUMENTS_STATE_DIR)
+        print(f"✅ 指定された {len(configs)} 件の文書を比べます。")
+    titles = [c['title'] for c in configs]
+    show_titles = len(titles) <= CHART_MAX_TITLES
+
+    # 作品ごとの出現回数と文書頻度 (results/state/tfidf/ か tfidf_documents/)。CSVが変わった作品だけ数え直す
+    stats.retain([] if rebuild else titles)
    
-    for config in file_config:
+    pending = []
+    for config in configs:
         title = config['title']
-        path = config['path']
-        review_col = config['review_col']
-        
-        print(f"\n==================== {title} の前処理を開始 ====================")
-        
-        df = force_read_csv(path)
-        df_game = df.copy()
-        df_game = df_game.rename(columns={review_col: 'Original_Review'})
-        df_game['Original_Review'] = df_game['Original_Review'].astype(str).str.strip().replace('nan', '')
-        df_game = df_game[df_game['Original_Review'].str.len() > 1]
-        game_reviews = df_game['Original_Review'].tolist()
-        
-        # 形態素解析とフィルタリング
-        processed_reviews = [preprocess_text(review, mecab) for review in game_reviews]
-        
-        all_ngrams = []
-        for review in processed_reviews:
-             # TF-IDFのために、n-gram生成（単語リストをスペース区切り文字列に戻す）
-            all_ngrams.extend(generate_ngrams(review, n_gram=1)) 
-            
-        combined_reviews_by_title[title] = " ".join(all_ngrams)
-        print(f"✅ {title} のレビュー結合体を作成しました。（総単語数: {len(all_ngrams)}）")
-
-    document_list = [combined_reviews_by_title[title] for title in titles]
-    
-    tfidf_vectorizer = TfidfVectorizer(
-        min_df = 0.0, 
-        ngram_range=(1, 2) 
-    )
+        signature = input_signature(config, dedup_threshold)
+        if signature is not None and stats.is_current(title, signature):
+            print(f"\n✅ {title} は前回から変更がないため、保存済みの出現回数を使います。")
+            continue
+        pending.append((config, signature))
+
+    # 作品ごとの数え上げは互いに独立なので、title_workers > 1 なら作品単位で並行に実行する
+    # (プロセスの入れ子を避けるため、その場合の形態素解析は各作品の中では並列化しない)
+    count_workers = workers if title_workers <= 1 else 1
+    counted = run_titles(partial(count_title_ngrams, workers=count_workers, dedup_threshold=dedup_threshold),
+                         [config for config, _ in pending], concurrency=title_workers)
+    for (config, signature), counts in zip(pending, counted):
+        stats.set_title(config['title'], counts, signature)
+
+    stats.save()
+    profiler.set_title(None)
+
+    # 保存済みの出現回数と文書頻度からIDFを計算し直す (min_df=0.0, ngram_range=(1, 2) 相当)
+    with profiler.stage('vectorize', items=len(titles)):
+        # 密行列にするとbigramでメモリが溢れるため、CSRのまま扱う
+        tfidfs, terms = stats.tfidf_matrix(titles)
 
-    tfidf_matrix = tfidf_vectorizer.fit_transform(document_list)
-    terms = tfidf_vectorizer.get_feature_names_out()
-    tfidfs = tfidf_matrix.toarray()
+    if save_matrix:
+        save_tfidf_matrix(f'results/{prefix}_matrix', tfidfs, terms)
+        print(f"✅ TF-IDF行列を疎行列のまま 'results/{prefix}_matrix.npz' に保存しました。")
 
     print("\n==================== 📈 TF-IDF行列の計算完了 ====================")
     print(f"✅ 分析対象のN-gram数は {len(terms)} 種類です。")
@@ -153,40 +424,105 @@ def main():
     print(f"\n==================== 🗝️ 作品別 特徴語ランキング (上位{n_features}語) ====================")
     
     for i, title in enumerate(titles):
-        feature_words_scores = extract_feature_words(terms, tfidfs, i, n_features)
+        with profiler.stage('score', items=1):
+            feature_words_scores = extract_feature_words(terms, tfidfs, i, n_features)
         
         df_feature = pd.DataFrame(feature_words_scores, columns=['Feature_Word_Ngram', 'TFIDF_Score'])
         df_feature['Game_Title'] = title
         df_feature['Rank'] = range(1, len(df_feature) + 1)
         all_feature_data.append(df_feature)
         
-        print(f"\n--- {title} の特徴語 ---")
-        print(df_feature[['Rank', 'Feature_Word_Ngram', 'TFIDF_Score']].head(10))
+        if show_titles:
+            print(f"\n--- {title} の特徴語 ---")
+            print(df_feature[['Rank', 'Feature_Word_Ngram', 'TFIDF_Score']].head(10))
 
     # 全結果を統合してCSV出力
     df_all_features = pd.concat(all_feature_data, ignore_index=True)
-    output_path = 'results/tfidf_key_feature_words.csv'
-    df_all_features.to_csv(output_path, index=False, encoding='utf-8')
+    output_path = f'results/{prefix}_key_feature_words.csv'
+    with profiler.stage('write_csv', items=len(df_all_features)):
+        df_all_features.to_csv(output_path, index=False, encoding='utf-8')
     
     print(f"\n✅ 全作品の特徴語（上位{n_features}語）を '{output_path}' に保存しました。")
+
+    similarity_matrix = None
+    if similarity:
+        print("\n==================== 🔗 作品間の類似度 (コサイン類似度) ====================")
+        similarity_path = f'results/{prefix}_title_similarity.csv'
+        neighbors_path = f'results/{prefix}_title_neighbors.csv'
+        with profiler.stage('similarity', items=len(titles)):
+            similarity_matrix = write_title_similarity(tfidfs, titles, n_neighbors, similarity_path, neighbors_path)
+        print(f"✅ 作品間の類似度行列を '{similarity_path}' に、"
+              f"類似作品 (上位{n_neighbors}件) を '{neighbors_path}' に保存しました。")
   
-    for title in titles:
-        df_plot = df_all_features[df_all_features['Game_Title'] == title].head(10)
+    if charts:
+        plt = pyplot(CHART_RC)
+        if not show_titles:
+            print(f"⚠️ 作品数が {CHART_MAX_TITLES} を超えるため、作品ごとの棒グラフは作りません。")
+        for title in titles if show_titles else []:
+            df_plot = df_all_features[df_all_features['Game_Title'] == title].head(10)
         
-        plt.figure(figsize=(10, 6))
-        # TF-IDFスコアに基づいて棒グラフを作成
-        plt.barh(df_plot['Feature_Word_Ngram'], df_plot['TFIDF_Score'], color='#4682B4')
-        plt.title(f'{title} を最も特徴づける単語 (TF-IDF Top 10)', fontsize=14)
-        plt.xlabel('TF-IDF Score')
-        plt.ylabel('単語 / N-gram')
-        # グラフを逆順にして、長い単語も表示可能にする
-        plt.gca().invert_yaxis() 
-        plt.tight_layout()
-        plt.savefig(f'results/{title}_tfidf_top10_features.png')
-        plt.close()
-        print(f"✅ {title} のTF-IDF棒グラフを保存しました。")
+            with profiler.stage('chart', items=1):
+                plt.figure(figsize=(10, 6))
+                # TF-IDFスコアに基づいて棒グラフを作成
+                plt.barh(df_plot['Feature_Word_Ngram'], df_plot['TFIDF_Score'], color='#4682B4')
+                plt.title(f'{title} を最も特徴づける単語 (TF-IDF Top 10)', fontsize=14)
+                plt.xlabel('TF-IDF Score')
+                plt.ylabel('単語 / N-gram')
+                # グラフを逆順にして、長い単語も表示可能にする
+                plt.gca().invert_yaxis() 
+                plt.tight_layout()
+                plt.savefig(f'results/{title}_{prefix}_top10_features.png')
+                plt.close()
+            print(f"✅ {title} のTF-IDF棒グラフを保存しました。")
+
+        if similarity and similarity_matrix is None:
+            print(f"⚠️ 作品数が {CHART_MAX_TITLES} を超えるため、類似度のヒートマップは作りません。")
+        elif similarity:
+            with profiler.stage('chart', items=1):
+                size = max(6, 0.4 * len(titles) + 2)
+                plt.figure(figsize=(size + 1, size))
+                plt.imshow(similarity_matrix, cmap='viridis', vmin=0, vmax=1)
+                plt.colorbar(label='Cosine Similarity')
+                plt.xticks(range(len(titles)), titles, rotation=90)
+                plt.yticks(range(len(titles)), titles)
+                plt.title('作品間の類似度 (TF-IDF コサイン類似度)', fontsize=14)
+                plt.tight_layout()
+                plt.savefig(f'results/{prefix}_title_similarity_heatmap.png')
+                plt.close()
+            print("✅ 作品間の類似度ヒートマップを保存しました。")
+
+    profiler.print_summary()
+    report_path = profiler.write_report()
+    print(f"✅ 処理時間の計測結果を '{report_path}' に保存しました。")
 
     print("\n--- 全処理を完了しました ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='TF-IDFを用いた作品間特徴語抽出')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析に使うプロセス数')
+    parser.add_argument('--save-matrix', action='store_true', help='TF-IDF行列を疎行列のまま保存する')
+    parser.add_argument('--rebuild', action='store_true', help='保存済みの出現回数を使わず、全作品を数え直す')
+    parser.add_argument('--title-workers', type=int, default=1, help='作品を並行して処理するプロセス数')
+    parser.add_argument('--no-charts', action='store_true', help='グラフを作らない (matplotlib を読み込まない)')
+    parser.add_argument('--headless', action='store_true', help='画面を使わずにグラフを描画してファイルに保存する')
+    parser.add_argument('--dedup', type=float, nargs='?', const=DEFAULT_THRESHOLD, default=None, metavar='THRESHOLD',
+                        help=f'類似度 THRESHOLD (省略時 {DEFAULT_THRESHOLD}) 以上の重複・類似レビューを1件として数える')
+    parser.add_argument('--similarity', action='store_true', help='作品間のコサイン類似度の行列とヒートマップを出力する')
+    parser.add_argument('--neighbors', type=int, default=5, help='--similarity で作品ごとに出力する類似作品の数')
+    inputs = parser.add_mutually_exclusive_group()
+    inputs.add_argument('--documents', metavar='FILE',
+                        help='比べる文書集合の設定CSV (title, path, review_col 列。任意で filter_col, filter_value 列)')
+    inputs.add_argument('--inputs', nargs='+', metavar='CSV', help='比べるレビューCSV (ファイル名を作品名とする)')
+    parser.add_argument('--review-col', default='レビュー', help='--inputs のCSVのレビュー列名')
+    args = parser.parse_args()
+    documents = None
+    try:
+        if args.documents:
+            documents = load_documents(args.documents)
+        elif args.inputs:
+            documents = documents_from_paths(args.inputs, args.review_col)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    main(workers=args.workers, save_matrix=args.save_matrix, rebuild=args.rebuild, title_workers=args.title_workers,
+         charts=not args.no_charts, headless=args.headless, dedup_threshold=args.dedup,
+         similarity=args.similarity, n_neighbors=args.neighbors, documents=documents)
\ No newline at end of file
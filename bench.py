@@ -0,0 +1,430 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import types
+
+# ==========================================
+# 主要関数のマイクロベンチマーク
+# ==========================================
+# 決定的な合成レビューコーパスを作り、各スクリプトのホットな関数のスループット
+# (件/秒) を測る。MeCab が入っていない環境でも動くよう、合成コーパスの語彙だけを
+# 知っている代替トークナイザを MeCab モジュールとして差し込める。
+# 結果はコミットごとに results/bench/<コミット>.json へ保存し、--compare で
+# 以前の結果と比べてスループットの低下を検出する (低下があれば終了コード 1)。
+#
+#   python bench.py                                   # 代替トークナイザで計測
+#   python bench.py --tokenizer mecab                 # 本物のMeCabで計測
+#   python bench.py --compare results/bench/abc1234.json
+
+DEFAULT_REVIEWS = 2000
+DEFAULT_SEED = 0
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10  # 10% 以上遅くなったら低下とみなす
+
+# ==========================================
+# 1. 合成レビューコーパス
+# ==========================================
+# (表層形, 品詞, 読み)。評価語群・感情辞書・ストップワードに当たる語を混ぜておく。
+ASPECT_NOUNS = [
+    ('展開', '名詞', 'テンカイ'), ('結末', '名詞', 'ケツマツ'), ('クライマックス', '名詞', 'クライマックス'),
+    ('ストーリー', '名詞', 'ストーリー'), ('流れ', '名詞', 'ナガレ'), ('構成', '名詞', 'コウセイ'),
+    ('シナリオ', '名詞', 'シナリオ'), ('伏線', '名詞', 'フクセン'), ('キャラクター', '名詞', 'キャラクター'),
+    ('キャラ', '名詞', 'キャラ'), ('主人公', '名詞', 'シュジンコウ'), ('仲間', '名詞', 'ナカマ'),
+    ('ライバル', '名詞', 'ライバル'), ('先生', '名詞', 'センセイ'), ('絆', '名詞', 'キズナ'),
+    ('友情', '名詞', 'ユウジョウ'), ('テーマ', '名詞', 'テーマ'), ('成長', '名詞', 'セイチョウ'),
+    ('冒険', '名詞', 'ボウケン'), ('探索', '名詞', 'タンサク'), ('旅', '名詞', 'タビ'),
+    ('フィールド', '名詞', 'フィールド'), ('世界観', '名詞', 'セカイカン'), ('舞台', '名詞', 'ブタイ'),
+]
+OTHER_NOUNS = [
+    ('ゲーム', '名詞', 'ゲーム'), ('ポケモン', '名詞', 'ポケモン'), ('今回', '名詞', 'コンカイ'),
+    ('本作', '名詞', 'ホンサク'), ('マップ', '名詞', 'マップ'), ('バグ', '名詞', 'バグ'),
+    ('ストレス', '名詞', 'ストレス'), ('感動', '名詞', 'カンドウ'), ('没入感', '名詞', 'ボツニュウカン'),
+    ('矛盾', '名詞', 'ムジュン'), ('最高', '名詞', 'サイコウ'), ('最悪', '名詞', 'サイアク'),
+    ('名作', '名詞', 'メイサク'), ('納得', '名詞', 'ナットク'), ('不満', '名詞', 'フマン'),
+    ('退屈', '名詞', 'タイクツ'), ('丁寧', '名詞', 'テイネイ'), ('ジム', '名詞', 'ジム'),
+    ('移動', '名詞', 'イドウ'), ('作業', '名詞', 'サギョウ'), ('雰囲気', '名詞', 'フンイキ'),
+]
+PREDICATES = [
+    ('面白い', '形容詞', 'オモシロイ'), ('楽しい', '形容詞', 'タノシイ'), ('熱い', '形容詞', 'アツイ'),
+    ('可愛い', '形容詞', 'カワイイ'), ('薄い', '形容詞', 'ウスイ'), ('浅い', '形容詞', 'アサイ'),
+    ('弱い', '形容詞', 'ヨワイ'), ('つまらない', '形容詞', 'ツマラナイ'), ('物足りない', '形容詞', 'モノタリナイ'),
+    ('良い', '形容詞', 'ヨイ'), ('深い', '形容詞', 'フカイ'), ('悪い', '形容詞', 'ワルイ'),
+    ('泣ける', '動詞', 'ナケル'), ('引き込まれる', '動詞', 'ヒキコマレル'), ('する', '動詞', 'スル'),
+    ('思った', '動詞', 'オモッタ'), ('感じる', '動詞', 'カンジル'), ('進む', '動詞', 'ススム'),
+    ('ある', '動詞', 'アル'), ('なる', '動詞', 'ナル'),
+]
+# 複数の形態素にまたがる辞書語 (ヒョウカデキナイ, キタイハズレ)
+PHRASES = [
+    [('評価', '名詞', 'ヒョウカ'), ('できない', '動詞', 'デキナイ')],
+    [('期待', '名詞', 'キタイ'), ('外れ', '名詞', 'ハズレ')],
+]
+PARTICLES = [
+    ('は', '助詞', 'ハ'), ('が', '助詞', 'ガ'), ('の', '助詞', 'ノ'), ('を', '助詞', 'ヲ'),
+    ('に', '助詞', 'ニ'), ('も', '助詞', 'モ'), ('と', '助詞', 'ト'), ('けど', '助詞', 'ケド'),
+]
+ADVERBS = [
+    ('とても', '副詞', 'トテモ'), ('かなり', '副詞', 'カナリ'), ('少し', '副詞', 'スコシ'),
+    ('ああ', '感動詞', 'アア'),
+]
+AUXILIARIES = [('です', '助動詞', 'デス'), ('だった', '助動詞', 'ダッタ'), ('ました', '助動詞', 'マシタ')]
+PUNCTUATION = [('、', '記号', '、'), ('。', '記号', '。'), ('！', '記号', '！')]
+
+NOUNS = ASPECT_NOUNS + OTHER_NOUNS
+# 出現頻度に偏りを持たせる (Zipf 風)
+NOUN_WEIGHTS = [1.0 / (rank + 1) for rank in range(len(NOUNS))]
+
+VOCABULARY = (NOUNS + PREDICATES + [w for phrase in PHRASES for w in phrase]
+              + PARTICLES + ADVERBS + AUXILIARIES + PUNCTUATION)
+
+
+def _sentence(rng):
+    words = []
+    for _ in range(rng.randint(1, 3)):
+        words.append(rng.choices(NOUNS, weights=NOUN_WEIGHTS)[0])
+        words.append(rng.choice(PARTICLES))
+    if rng.random() < 0.4:
+        words.append(rng.choice(ADVERBS))
+    if rng.random() < 0.05:
+        words.extend(rng.choice(PHRASES))
+    else:
+        words.append(rng.choice(PREDICATES))
+    if rng.random() < 0.3:
+        words.append(rng.choice(AUXILIARIES))
+    words.append(rng.choice(PUNCTUATION))
+    return ''.join(surface for surface, _, _ in words)
+
+
+def generate_corpus(n_reviews=DEFAULT_REVIEWS, seed=DEFAULT_SEED):
+    """同じ (件数, シード) なら常に同じレビューのリストを返す"""
+    rng = random.Random(seed)
+    reviews = []
+    for _ in range(n_reviews):
+        # 短いレビューが多く、ときどき長いレビューが混ざる分布にする
+        n_sentences = min(1 + int(rng.expovariate(0.35)), 30)
+        reviews.append(''.join(_sentence(rng) for _ in range(n_sentences)))
+    return reviews
+
+
+def corpus_checksum(reviews):
+    digest = hashlib.sha1()
+    for review in reviews:
+        digest.update(review.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+# ==========================================
+# 2. 代替トークナイザ (MeCab 互換の最小実装)
+# ==========================================
+# 合成コーパスの語彙で最長一致分割を行い、IPA辞書形式の素性文字列を返す。
+# 辞書側はカタカナで書かれているため、原形 (7番目) にも読みを入れる。
+# 語彙に無い文字列は文字種ごとにまとめて未知語 (名詞) とする。
+
+class _Node:
+    __slots__ = ('surface', 'feature', 'next')
+
+    def __init__(self, surface, feature):
+        self.surface = surface
+        self.feature = feature
+        self.next = None
+
+
+class _DictionaryInfo:
+    filename = 'bench-stand-in.dic'
+    charset = 'utf-8'
+    version = 1
+    next = None
+
+    def __init__(self, size):
+        self.size = size
+
+
+def _char_class(ch):
+    code = ord(ch)
+    if 0x3040 <= code <= 0x309F:
+        return 'hiragana'
+    if 0x30A0 <= code <= 0x30FF:
+        return 'katakana'
+    if 0x4E00 <= code <= 0x9FFF:
+        return 'kanji'
+    return 'other'
+
+
+class StandInTagger:
+    def __init__(self, args=''):
+        self._entries = {}
+        for surface, pos, reading in VOCABULARY:
+            feature = f"{pos},*,*,*,*,*,{reading},{reading},{reading}"
+            self._entries.setdefault(surface[0], []).append((surface, feature))
+        for candidates in self._entries.values():
+            candidates.sort(key=lambda entry: -len(entry[0]))
+
+    def dictionary_info(self):
+        return _DictionaryInfo(len(VOCABULARY))
+
+    def _tokenize(self, text):
+        i = 0
+        while i < len(text):
+            for surface, feature in self._entries.get(text[i], ()):
+                if text.startswith(surface, i):
+                    yield surface, feature
+                    i += len(surface)
+                    break
+            else:
+                char_class = _char_class(text[i])
+                j = i + 1
+                while j < len(text) and _char_class(text[j]) == char_class and text[j] not in self._entries:
+                    j += 1
+                yield text[i:j], "名詞,一般,*,*,*,*,*"
+                i = j
+
+    def parseToNode(self, text):
+        head = _Node('', 'BOS/EOS,*,*,*,*,*,*,*,*')
+        tail = head
+        for surface, feature in self._tokenize(text):
+            tail.next = _Node(surface, feature)
+            tail = tail.next
+        tail.next = _Node('', 'BOS/EOS,*,*,*,*,*,*,*,*')
+        return head
+
+    def parse(self, text):
+        lines = [f"{surface}\t{feature}" for surface, feature in self._tokenize(text)]
+        return '\n'.join(lines + ['EOS', ''])
+
+
+def install_tokenizer(kind):
+    """
+    ベンチマークで使うトークナイザを決める。'stand-in' なら代替トークナイザを
+    MeCab モジュールとして登録する。'auto' は MeCab が使えなければ代替を使う。
+    """
+    if kind in ('auto', 'mecab'):
+        try:
+            import MeCab
+            MeCab.Tagger()
+            return 'mecab'
+        except Exception as e:
+            if kind == 'mecab':
+                print(f"MeCabの初期化に失敗しました: {e}")
+                sys.exit(1)
+    module = types.ModuleType('MeCab')
+    module.Tagger = StandInTagger
+    sys.modules['MeCab'] = module
+    return 'stand-in'
+
+
+# ==========================================
+# 3. ベンチマーク本体
+# ==========================================
+
+class _Uncached:
+    """キャッシュを通さず毎回解析する (キャッシュヒットを計測しないため)"""
+
+    def morphemes(self, tagger, text, target_pos=None):
+        from token_cache import parse_morphemes
+        return parse_morphemes(tagger, text, target_pos)
+
+    # tokenize_pool.tokenize_reviews から呼ばれる読み書きは何もしない
+    def make_key(self, text, tagger):
+        return None
+
+    def get(self, key):
+        return None
+
+    def put(self, key, morphemes):
+        pass
+
+    def flush(self):
+        pass
+
+
+def _time(func, repeat):
+    # 出力の多い関数もあるので、計測中の標準出力は捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()  # ウォームアップ
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def build_benchmarks(reviews):
+    """(名前, 関数, 1回あたりの処理件数) のリストを作る"""
+    # スクリプトは import 時に MeCab を初期化するので、トークナイザ決定後に読み込む
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    import MeCab
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    import TFIDF
+    import 共起
+    import 共起分析
+    import 感情
+    import 感情分析
+
+    from text_memo import TextMemo
+    uncached = _Uncached()
+    for module in (TFIDF, 共起分析, 感情分析):
+        module.token_cache = uncached
+        # 同じ入力を繰り返し計測するため、本文ごとのメモも無効にする
+        module.text_memo = TextMemo(max_entries=0)
+    tagger = MeCab.Tagger()
+
+    sentiment_analyzer = 感情.SentimentAnalyzer()
+    sentiment_analyzer.token_cache = uncached
+    sentiment_analyzer.text_memo = TextMemo(max_entries=0)
+    cooccurrence_analyzer = 共起.CooccurrenceAnalyzer()
+    cooccurrence_analyzer.token_cache = uncached
+
+    # 下流の関数に渡す入力は計測の外で一度だけ作る
+    tfidf_words = [TFIDF.preprocess_text(text, tagger) for text in reviews]
+    aspect_words = [共起分析.preprocess_text(text, tagger) for text in reviews]
+    sentiment_words = [感情分析.preprocess_text(text, tagger) for text in reviews]
+    token_sets = [cooccurrence_analyzer._get_tokens(text) for text in reviews]
+
+    documents = [' '.join(TFIDF.generate_ngrams(words, n_gram=1)) for words in tfidf_words]
+    vectorizer = TfidfVectorizer(min_df=0.0, ngram_range=(1, 2))
+    tfidfs = vectorizer.fit_transform(documents).tocsr()
+    terms = vectorizer.get_feature_names_out()
+
+    n = len(reviews)
+    return [
+        ('TFIDF.preprocess_text',
+         lambda: [TFIDF.preprocess_text(text, tagger) for text in reviews], n),
+        ('共起分析.preprocess_text',
+         lambda: [共起分析.preprocess_text(text, tagger) for text in reviews], n),
+        ('感情分析.preprocess_text',
+         lambda: [感情分析.preprocess_text(text, tagger) for text in reviews], n),
+        ('TFIDF.generate_ngrams',
+         lambda: [TFIDF.generate_ngrams(words, n_gram=2) for words in tfidf_words], n),
+        ('TFIDF.extract_feature_words',
+         lambda: [TFIDF.extract_feature_words(terms, tfidfs, i, 50) for i in range(tfidfs.shape[0])],
+         tfidfs.shape[0]),
+        ('感情分析.analyze_sentiment',
+         lambda: [感情分析.analyze_sentiment(words) for words in sentiment_words], n),
+        ('感情.SentimentAnalyzer.classify_review',
+         lambda: [sentiment_analyzer.classify_review(text) for text in reviews], n),
+        ('感情.SentimentAnalyzer.classify_batch',
+         lambda: sentiment_analyzer.classify_batch(reviews), n),
+        ('共起.CooccurrenceAnalyzer.calculate_sentiment_counts',
+         lambda: [cooccurrence_analyzer.calculate_sentiment_counts(tokens) for tokens in token_sets], n),
+        ('共起分析.calculate_co_occurrence_score',
+         lambda: 共起分析.calculate_co_occurrence_score(aspect_words), n),
+    ]
+
+
+def _git_commit():
+    # 実行時のカレントディレクトリではなく、このファイルのあるリポジトリのコミットを記録する
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True, cwd=repo_dir).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True, cwd=repo_dir).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except Exception:
+        return 'unknown'
+
+
+def run(n_reviews=DEFAULT_REVIEWS, seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT, tokenizer='stand-in', only=None):
+    tokenizer = install_tokenizer(tokenizer)
+    reviews = generate_corpus(n_reviews, seed)
+    print(f"🧪 合成コーパス: {len(reviews)} 件 / {sum(len(r) for r in reviews)} 文字 (トークナイザ: {tokenizer})")
+
+    results = []
+    for name, func, items in build_benchmarks(reviews):
+        if only and not any(pattern in name for pattern in only):
+            continue
+        times = _time(func, repeat)
+        best = min(times)
+        results.append({
+            'name': name,
+            'items': items,
+            'best_seconds': round(best, 6),
+            'median_seconds': round(statistics.median(times), 6),
+            'items_per_sec': round(items / best, 2) if best > 0 else None,
+        })
+        print(f"  {name:<52} {best * 1000:>9.2f} ms  {results[-1]['items_per_sec']:>12.1f} 件/秒")
+
+    return {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'tokenizer': tokenizer,
+        'corpus': {
+            'reviews': len(reviews),
+            'seed': seed,
+            'chars': sum(len(r) for r in reviews),
+            'sha1': corpus_checksum(reviews),
+        },
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """baseline と比べてスループットが threshold 以上落ちたベンチマーク名のリストを返す"""
+    if current['tokenizer'] != baseline['tokenizer'] or current['corpus']['sha1'] != baseline['corpus']['sha1']:
+        print("⚠️ トークナイザまたはコーパスが異なるため、比較結果は参考値です。")
+
+    print(f"\n==================== 📊 {baseline['commit']} → {current['commit']} ====================")
+    baseline_by_name = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        base = baseline_by_name.get(r['name'])
+        if base is None or not base['items_per_sec'] or not r['items_per_sec']:
+            print(f"  {r['name']:<52} (比較対象なし)")
+            continue
+        ratio = r['items_per_sec'] / base['items_per_sec']
+        mark = ''
+        if ratio < 1 - threshold:
+            mark = '  ⚠️ 低下'
+            regressions.append(r['name'])
+        print(f"  {r['name']:<52} {base['items_per_sec']:>12.1f} → {r['items_per_sec']:>12.1f} 件/秒 (x{ratio:.2f}){mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='主要関数のマイクロベンチマーク')
+    parser.add_argument('--reviews', type=int, default=DEFAULT_REVIEWS, help='合成レビューの件数')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='合成コーパスの乱数シード')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='各ベンチマークの計測回数 (最良値を採用)')
+    parser.add_argument('--tokenizer', choices=['stand-in', 'mecab', 'auto'], default='stand-in',
+                        help='stand-in: 代替トークナイザ (コミット間で比較しやすい) / mecab / auto')
+    parser.add_argument('--only', nargs='*', help='名前にこの文字列を含むベンチマークだけ実行する')
+    parser.add_argument('--output', help='結果JSONの保存先 (既定: results/bench/<コミット>.json)')
+    parser.add_argument('--compare', help='比較対象の結果JSON')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='この割合以上スループットが落ちたら低下とみなす')
+    args = parser.parse_args()
+
+    report = run(args.reviews, args.seed, args.repeat, args.tokenizer, args.only)
+
+    output = args.output or os.path.join('results', 'bench', f"{report['commit']}.json")
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 結果を保存しました: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️ スループットが低下したベンチマーク: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
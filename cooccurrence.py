@@ -0,0 +1,255 @@
+import numpy as np
+from scipy import sparse
+
+from token_corpus import TokenCorpus
+
+# ==========================================
+# 疎行列による共起集計
+# ==========================================
+# sv.py の共起分析は、レビューごとに単語の全ペアを二重ループで列挙して
+# 辞書に数えていたため、長いレビューで二乗オーダーに膨らんでいた。
+# ここでは 文書×単語 の出現回数行列 X を作り、共起数を X^T X から求める。
+# 単語 w, v (w != v) の共起数は「同じレビュー内で w と v が現れる位置の組の数」
+# = Σ_d c(d,w) * c(d,v) で、従来の二重ループと同じ値になる。
+# 同じ単語どうしの組 (w, w) は Σ_d c(d,w) * (c(d,w) - 1) / 2 となる。
+# X^T X は語彙のブロックごとに計算し、上位候補だけを残すのでメモリは一定に収まる。
+
+DEFAULT_BLOCK_SIZE = 2048  # 一度に X^T X を計算する語彙数
+
+
+def build_document_term_matrix(token_lists):
+    """
+    トークンリストのリスト (または token_corpus.TokenCorpus) から
+    文書×単語 の出現回数CSR行列と語彙リストを作る
+    """
+    if isinstance(token_lists, TokenCorpus):
+        return token_lists.document_term_matrix(), list(token_lists.vocabulary)
+
+    vocabulary = {}
+    indices = []
+    indptr = [0]
+    for tokens in token_lists:
+        for token in tokens:
+            indices.append(vocabulary.setdefault(token, len(vocabulary)))
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices), dtype=np.int64)
+    matrix = sparse.csr_matrix(
+        (data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(vocabulary)),
+    )
+    matrix.sum_duplicates()
+    # 語彙は初出順 (従来の辞書の挿入順と同じ)
+    return matrix, list(vocabulary)
+
+
+def _top_k(counts, rows, cols, k):
+    """件数の多い順に上位k件を部分選択 (argpartition) で取り出す"""
+    if len(counts) > k:
+        idx = np.argpartition(-counts, k - 1)[:k]
+        counts, rows, cols = counts[idx], rows[idx], cols[idx]
+    # 同数の場合は語彙の初出順で並べる
+    order = np.lexsort((cols, rows, -counts))
+    return counts[order], rows[order], cols[order]
+
+
+def top_cooccurring_pairs(doc_term_matrix, terms, top_n=10, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    共起数の多い単語ペアを上位 top_n 件返す。
+    戻り値は [((単語1, 単語2), 共起数), ...] で、ペア内の単語は辞書順に並べる。
+    """
+    X = sparse.csr_matrix(doc_term_matrix)
+    n_terms = X.shape[1]
+    if n_terms == 0 or top_n <= 0:
+        return []
+
+    Xt = X.T.tocsr()
+
+    # 同じ単語どうしの組: Σ c(c-1)/2
+    squared = np.asarray(X.multiply(X).sum(axis=0)).ravel()
+    totals = np.asarray(X.sum(axis=0)).ravel()
+    diag_counts = ((squared - totals) // 2).astype(np.int64)
+    diag_terms = np.nonzero(diag_counts)[0]
+    best_counts, best_rows, best_cols = _top_k(
+        diag_counts[diag_terms], diag_terms.astype(np.int64), diag_terms.astype(np.int64), top_n
+    )
+
+    # 異なる単語の組: X^T X の上三角を語彙ブロックごとに計算
+    for start in range(0, n_terms, block_size):
+        stop = min(start + block_size, n_terms)
+        block = (Xt[start:stop] @ X).tocoo()
+        rows = block.row.astype(np.int64) + start
+        mask = block.col > rows
+        if not mask.any():
+            continue
+        counts = np.concatenate([best_counts, block.data[mask].astype(np.int64)])
+        cand_rows = np.concatenate([best_rows, rows[mask]])
+        cand_cols = np.concatenate([best_cols, block.col[mask].astype(np.int64)])
+        best_counts, best_rows, best_cols = _top_k(counts, cand_rows, cand_cols, top_n)
+
+    pairs = []
+    for count, i, j in zip(best_counts, best_rows, best_cols):
+        pair = tuple(sorted((terms[i], terms[j])))
+        pairs.append((pair, int(count)))
+    return pairs
+
+
+# ==========================================
+# 窓内共起と関連度指標
+# ==========================================
+# 共起数そのものは頻出語どうしのペアが上位を占めるため、関連度の指標で順位を付ける。
+#   window=None : レビュー単位。N = レビュー数、f(x) = x を含むレビュー数、
+#                 f(x,y) = x と y を両方含むレビュー数
+#   window=k    : 距離 k 以内 (間に k-1 語まで) の位置の組を数える。長いレビューでも
+#                 ペア数はトークン数×k に収まる。組は両方向に数え、N = 全組数、
+#                 f(x) = x を含む組の数 (行和)、f(x,y) = 組 (x,y) の数
+# とし、2×2 分割表 (k11 = f(x,y), k12 = f(x) - k11, k21 = f(y) - k11, k22 = N - ...) から
+#   pmi     : log(k11 N / f(x) f(y))
+#   npmi    : pmi / -log(k11 / N)  (-1〜1)
+#   dice    : 2 k11 / (f(x) + f(y))
+#   jaccard : k11 / (f(x) + f(y) - k11)
+#   llr     : 対数尤度比 G² (Dunning)
+# を計算する。共起数が min_count 未満のペアは除く (PMI は低頻度語を過大評価するため)。
+# 計算は語彙のブロックごとに疎行列のまま行い、上位のペアだけを Python の値に戻す。
+
+ASSOCIATION_MEASURES = ('pmi', 'npmi', 'dice', 'jaccard', 'llr')
+
+
+def window_cooccurrence_matrix(corpus, window):
+    """語彙×語彙 の窓内共起数の対称CSR行列 (同じ語どうしの組は対角に2回分入る)"""
+    n_terms = len(corpus.vocabulary)
+    ids = np.asarray(corpus.token_ids, dtype=np.int64)
+    review = corpus.review_index()
+    matrix = sparse.csr_matrix((n_terms, n_terms), dtype=np.int64)
+    for distance in range(1, window + 1):
+        # distance だけ離れた位置の組のうち、同じレビュー内のもの
+        same = review[:-distance] == review[distance:]
+        left = ids[:-distance][same]
+        right = ids[distance:][same]
+        data = np.ones(2 * len(left), dtype=np.int64)
+        matrix = matrix + sparse.csr_matrix(
+            (data, (np.concatenate([left, right]), np.concatenate([right, left]))),
+            shape=(n_terms, n_terms),
+        )
+    return matrix
+
+
+def _xlogx_ratio(k, expected):
+    """k * log(k / expected) (k = 0 の項は 0)"""
+    result = np.zeros_like(k)
+    nonzero = k > 0
+    result[nonzero] = k[nonzero] * np.log(k[nonzero] / expected[nonzero])
+    return result
+
+
+def association_scores(measure, k11, fx, fy, total):
+    """共起数 k11・各語の頻度 fx, fy・総数 total の配列から関連度を計算する"""
+    k11 = np.asarray(k11, dtype=np.float64)
+    fx = np.asarray(fx, dtype=np.float64)
+    fy = np.asarray(fy, dtype=np.float64)
+    total = float(total)
+    if measure == 'pmi':
+        return np.log(k11 * total / (fx * fy))
+    if measure == 'npmi':
+        pmi = np.log(k11 * total / (fx * fy))
+        denominator = -np.log(k11 / total)
+        # 全体で常に共起する場合 (k11 = N) は最大値 1 とする
+        return np.divide(pmi, denominator, out=np.ones_like(pmi), where=denominator > 0)
+    if measure == 'dice':
+        return 2 * k11 / (fx + fy)
+    if measure == 'jaccard':
+        return k11 / (fx + fy - k11)
+    if measure == 'llr':
+        k12 = fx - k11
+        k21 = fy - k11
+        k22 = total - fx - fy + k11
+        not_x = total - fx
+        not_y = total - fy
+        return 2 * (_xlogx_ratio(k11, fx * fy / total) + _xlogx_ratio(k12, fx * not_y / total)
+                    + _xlogx_ratio(k21, not_x * fy / total) + _xlogx_ratio(k22, not_x * not_y / total))
+    raise ValueError(f"関連度の指標 '{measure}' には対応していません ({', '.join(ASSOCIATION_MEASURES)})。")
+
+
+def _top_scored(scores, counts, rows, cols, k):
+    """関連度の高い順に上位k件を部分選択で取り出す (同点は共起数の多い順、語彙の初出順)"""
+    if len(scores) > k:
+        idx = np.argpartition(-scores, k - 1)[:k]
+        scores, counts, rows, cols = scores[idx], counts[idx], rows[idx], cols[idx]
+    order = np.lexsort((cols, rows, -counts, -scores))
+    return scores[order], counts[order], rows[order], cols[order]
+
+
+def _top_per_row(scores, counts, rows, cols, k):
+    """行 (単語) ごとに関連度の高い上位k件を残す"""
+    order = np.lexsort((cols, -counts, -scores, rows))
+    scores, counts, rows, cols = scores[order], counts[order], rows[order], cols[order]
+    # 行の先頭からの順位
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    keep = rank < k
+    return scores[keep], counts[keep], rows[keep], cols[keep]
+
+
+def top_associations(token_lists, measure='pmi', window=None, min_count=2, top_n=10,
+                     per_word=False, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    関連度の高い単語ペアを返す。token_lists はトークンリストのリストか token_corpus.TokenCorpus
+    (window を指定する場合は語順が必要なので、集合ではなくリストを渡す)。
+    per_word=False: [((単語1, 単語2), 関連度, 共起数), ...] を上位 top_n 件 (ペア内は辞書順)
+    per_word=True : {単語: [(相手の単語, 関連度, 共起数), ...]} を単語ごとに上位 top_n 件
+    """
+    if measure not in ASSOCIATION_MEASURES:
+        raise ValueError(f"関連度の指標 '{measure}' には対応していません ({', '.join(ASSOCIATION_MEASURES)})。")
+    corpus = token_lists if isinstance(token_lists, TokenCorpus) else TokenCorpus.from_token_lists(token_lists)
+    terms = corpus.vocabulary
+    n_terms = len(terms)
+    if n_terms == 0 or top_n <= 0:
+        return {} if per_word else []
+
+    if window is None:
+        X = corpus.document_term_matrix(binary=True)
+        pair_source = X.T.tocsr()
+        right = X
+        freqs = np.asarray(X.sum(axis=0)).ravel()
+        total = X.shape[0]
+    else:
+        pair_source = window_cooccurrence_matrix(corpus, window)
+        right = None
+        freqs = np.asarray(pair_source.sum(axis=1)).ravel()
+        total = pair_source.sum()
+
+    empty = (np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    best = empty
+    kept = []
+    for start in range(0, n_terms, block_size):
+        stop = min(start + block_size, n_terms)
+        block = pair_source[start:stop]
+        if right is not None:
+            block = block @ right
+        block = block.tocoo()
+        rows = block.row.astype(np.int64) + start
+        cols = block.col.astype(np.int64)
+        counts = block.data.astype(np.int64)
+        # 同じ語どうしの組は除く。全体の上位では (x,y) と (y,x) を重複させない
+        mask = (counts >= min_count) & ((cols != rows) if per_word else (cols > rows))
+        if not mask.any():
+            continue
+        rows, cols, counts = rows[mask], cols[mask], counts[mask]
+        scores = association_scores(measure, counts, freqs[rows], freqs[cols], total)
+        if per_word:
+            # ブロックの各行は語彙全体との共起を含むので、ブロック内で単語ごとの上位が確定する
+            kept.append(_top_per_row(scores, counts, rows, cols, top_n))
+        else:
+            best = _top_scored(*(np.concatenate([b, c]) for b, c in zip(best, (scores, counts, rows, cols))), top_n)
+
+    if per_word:
+        result = {}
+        for scores, counts, rows, cols in kept:
+            for score, count, i, j in zip(scores.tolist(), counts.tolist(), rows.tolist(), cols.tolist()):
+                result.setdefault(terms[i], []).append((terms[j], score, count))
+        return result
+
+    pairs = []
+    for score, count, i, j in zip(*(a.tolist() for a in best)):
+        pairs.append((tuple(sorted((terms[i], terms[j]))), score, count))
+    return pairs
@@ -0,0 +1,102 @@
+import codecs
+
+import pandas as pd
+
+# ==========================================
+# レビューCSVの読み込み
+# ==========================================
+# 以前は各スクリプトに force_read_csv が重複しており、エンコーディングを
+# 1つずつ試すたびにCSV全体をパースしていた (cp932のファイルは最大3回)。
+# ここではファイル先頭のバイト列だけでエンコーディングを1回判定し、
+# 必要な列 (usecols) だけを読み込む。巨大なファイルは chunksize 行ずつ読める。
+
+ENCODINGS_TO_TRY = ['utf-8', 'shift_jis', 'cp932', 'euc-jp']
+SNIFF_BYTES = 1024 * 1024    # エンコーディング判定に使う先頭バイト数
+DEFAULT_CHUNK_ROWS = 50000   # チャンク読み込み時の1チャンクあたりの行数
+
+
+def detect_encoding(file_path, sniff_bytes=SNIFF_BYTES):
+    """ファイル先頭のバイト列を候補のエンコーディングで試しにデコードして判定する"""
+    with open(file_path, 'rb') as f:
+        prefix = f.read(sniff_bytes)
+
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    for encoding in ENCODINGS_TO_TRY:
+        # 末尾でマルチバイト文字が切れていてもエラーにしないよう、インクリメンタルデコーダを使う
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            decoder.decode(prefix, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def force_read_csv(file_path, usecols=None):
+    """
+    エンコーディングを判定してCSVを読み込む。usecols で読み込む列を絞れる。
+    読み込めない場合は None を返す。usecols の列がCSVに無い場合は、その列名を示す ValueError を送出する。
+    """
+    try:
+        encoding = detect_encoding(file_path)
+    except OSError:
+        return None
+
+    # 先頭では判定できなかった文字が後半にある場合に備え、残りの候補も順に試す
+    candidates = [e for e in ENCODINGS_TO_TRY if e != encoding]
+    if encoding is not None:
+        candidates.insert(0, encoding)
+
+    for encoding in candidates:
+        try:
+            return pd.read_csv(file_path, encoding=encoding, usecols=usecols)
+        except UnicodeDecodeError:
+            continue
+        except ValueError:
+            _check_columns(file_path, encoding, usecols)
+            return None
+        except Exception:
+            return None
+    try:
+        return pd.read_csv(file_path, encoding='utf-8', encoding_errors='ignore', usecols=usecols)
+    except ValueError:
+        _check_columns(file_path, 'utf-8', usecols)
+        return None
+    except Exception:
+        return None
+
+
+def _check_columns(file_path, encoding, usecols):
+    """usecols のうちCSVの見出しに無い列があれば、その列名を示す ValueError を送出する"""
+    if usecols is None:
+        return
+    try:
+        header = pd.read_csv(file_path, encoding=encoding, encoding_errors='ignore', nrows=0)
+    except Exception:
+        return
+    missing = [col for col in usecols if col not in header.columns]
+    if missing:
+        raise ValueError(f"列 {', '.join(repr(col) for col in missing)} が {file_path} に見つかりません。")
+
+
+def iter_csv_chunks(file_path, usecols=None, chunksize=DEFAULT_CHUNK_ROWS, dtype=None):
+    """
+    CSVを chunksize 行ずつのDataFrameとして順に返す。
+    ファイル全体をメモリに載せないので、数GBのレビューデータにも使える。
+    dtype は pd.read_csv と同じ (列ごとの型の指定)。
+    """
+    encoding = detect_encoding(file_path)
+    # 途中で読み直せないため、判定後に残ったデコードエラーは置換文字で受け流す
+    reader = pd.read_csv(
+        file_path,
+        encoding=encoding or 'utf-8',
+        encoding_errors='replace',
+        usecols=usecols,
+        dtype=dtype,
+        chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            yield chunk
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+
+# ==========================================
+# 追記されたレビューだけを処理するための状態保存
+# ==========================================
+# 作品ごとに「どこまでの行を処理したか (ウォーターマーク)」と集計値を
+# results/state/<スクリプト名>_state.json に保存する。次回の実行では
+# ウォーターマーク以降の行だけを形態素解析・スコア計算し、集計値に足し込む。
+#
+# 次の場合は作品単位で最初から計算し直す:
+#   - 処理済みの行 (ウォーターマークより前) の内容や列構成が変わった
+#   - 辞書・評価語群・MeCab辞書など、結果に影響する設定 (fingerprint) が変わった
+
+STATE_DIR = os.path.join('results', 'state')
+
+
+def fingerprint(*parts):
+    """辞書や設定から、状態が使い回せるかを判定するためのハッシュを作る"""
+    def normalize(value):
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+        if isinstance(value, (set, frozenset)):
+            return sorted(normalize(v) for v in value)
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    payload = json.dumps([normalize(p) for p in parts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _rows_digest(texts):
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(str(text).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class IncrementalState:
+    def __init__(self, name, config_fingerprint, state_dir=STATE_DIR):
+        self.path = os.path.join(state_dir, f'{name}_state.json')
+        self.fingerprint = config_fingerprint
+        self.titles = {}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    saved = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 状態ファイルを読み込めませんでした ({e})。最初から計算します。")
+                saved = {}
+            if saved.get('fingerprint') == config_fingerprint:
+                self.titles = saved.get('titles', {})
+            elif saved:
+                print("⚠️ 辞書または設定が変わったため、保存済みの集計を破棄して最初から計算します。")
+
+    def start_row(self, title, texts, columns):
+        """
+        texts: 全行のレビュー列 (文字列化したもの)、columns: CSVの列名リスト。
+        処理済みの行がそのまま残っていればウォーターマークを、そうでなければ 0 を返す。
+        """
+        entry = self.titles.get(title)
+        if entry is None:
+            return 0
+        watermark = entry['watermark']
+        if (list(columns) != entry['columns'] or len(texts) < watermark
+                or _rows_digest(texts[:watermark]) != entry['prefix_sha1']):
+            print(f"⚠️ {title}: 処理済みの行が変更されたため、最初から計算し直します。")
+            self.reset(title)
+            return 0
+        return watermark
+
+    def aggregates(self, title):
+        """保存済みの集計値 (無ければ None)"""
+        entry = self.titles.get(title)
+        return entry['aggregates'] if entry else None
+
+    def update(self, title, texts, columns, aggregates):
+        """全行を処理し終えた時点の集計値とウォーターマークを記録する"""
+        self.titles[title] = {
+            'watermark': len(texts),
+            'prefix_sha1': _rows_digest(texts),
+            'columns': list(columns),
+            'aggregates': aggregates,
+        }
+
+    def entry(self, title):
+        """作品の状態 (ウォーターマークと集計値) をそのまま返す (無ければ None)"""
+        return self.titles.get(title)
+
+    def restore(self, title, entry):
+        """
+        entry で取り出した状態を書き戻す (None なら作品の状態を消す)。
+        作品ごとに別プロセスで update した結果を、親プロセスの状態に反映するのに使う。
+        """
+        if entry is None:
+            self.titles.pop(title, None)
+        else:
+            self.titles[title] = entry
+
+    def reset(self, title=None):
+        if title is None:
+            self.titles = {}
+        else:
+            self.titles.pop(title, None)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # 書き込み途中で止まっても壊れた状態ファイルが残らないよう、置き換えで保存する
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'titles': self.titles}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,144 @@
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# ==========================================
+# 処理段階ごとの計測
+# ==========================================
+# CSV読み込み・形態素解析・フィルタリング・スコア計算・CSV書き出し・グラフ描画
+# のどこに時間がかかっているかを作品ごとに記録し、results/ にJSONで書き出す。
+# 同じ (作品, 段階) が複数回計測された場合 (チャンク読み込みなど) は合算する。
+
+# トークン単位のデバッグ出力を行う割合 (0 なら出力しない)
+# 環境変数 TOKEN_TRACE_RATE または set_trace_rate() で指定する
+_trace_rate = float(os.environ.get('TOKEN_TRACE_RATE', '0'))
+_trace_rng = random.Random(0)
+
+# プロセス内の計測器 (名前 → PipelineProfiler)。子プロセスの計測結果を親に合算するために使う
+_profilers = {}
+
+
+def set_trace_rate(rate):
+    """トークン単位のデバッグ出力を行う割合 (0〜1) を設定する"""
+    global _trace_rate
+    _trace_rate = max(0.0, min(1.0, rate))
+
+
+def should_trace():
+    """このトークンをデバッグ出力するかどうかをサンプリングで決める"""
+    return _trace_rate > 0 and _trace_rng.random() < _trace_rate
+
+
+class _Stage:
+    def __init__(self, items):
+        self.items = items
+
+
+class PipelineProfiler:
+    def __init__(self, name, output_dir='results'):
+        self.name = name
+        self.output_dir = output_dir
+        self.title = None
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._start = time.perf_counter()
+        self._records = {}
+        _profilers[name] = self
+
+    def set_title(self, title):
+        """以降の計測を記録する作品名を設定する"""
+        self.title = title
+
+    @contextmanager
+    def stage(self, name, items=None):
+        """
+        with profiler.stage('tokenize', items=len(reviews)): のように囲んだ区間を計測する。
+        件数が後で決まる場合は as で受け取ったオブジェクトの items に代入する。
+        """
+        stage = _Stage(items)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            self._add((self.title, name), elapsed, stage.items or 0, 1)
+
+    def timed_iter(self, name, iterable):
+        """イテラブルから1要素取り出すごとの時間を name の段階として計測する (件数は要素の長さ)"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                stage.items = len(item)
+            yield item
+
+    def _add(self, key, seconds, items, calls):
+        record = self._records.setdefault(key, {'seconds': 0.0, 'items': 0, 'calls': 0})
+        record['seconds'] += seconds
+        record['items'] += items
+        record['calls'] += calls
+
+    def report(self):
+        stages = []
+        for (title, name), record in self._records.items():
+            seconds = record['seconds']
+            stages.append({
+                'title': title,
+                'stage': name,
+                'seconds': round(seconds, 6),
+                'items': record['items'],
+                'items_per_sec': round(record['items'] / seconds, 2) if seconds > 0 and record['items'] else None,
+                'calls': record['calls'],
+            })
+        return {
+            'script': self.name,
+            'started_at': self.started_at,
+            'total_seconds': round(time.perf_counter() - self._start, 6),
+            'stages': stages,
+        }
+
+    def print_summary(self):
+        print(f"\n==================== ⏱️ 処理時間 ({self.name}) ====================")
+        for s in self.report()['stages']:
+            rate = f"{s['items_per_sec']:.1f} 件/秒" if s['items_per_sec'] else "-"
+            print(f"  {str(s['title']):<8} {s['stage']:<10} {s['seconds']:>9.3f} 秒  {s['items']:>9} 件  {rate}")
+
+    def write_report(self, path=None):
+        """計測結果をJSONで保存し、保存先のパスを返す"""
+        if path is None:
+            path = os.path.join(self.output_dir, f'{self.name}_timings.json')
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+def reset_all():
+    """このプロセスのすべての計測器の記録を消す (並行処理の子プロセスで作品ごとに呼ぶ)"""
+    for profiler in _profilers.values():
+        profiler._records = {}
+
+
+def export_all():
+    """このプロセスのすべての計測器の記録を、親プロセスへ渡せる形で返す"""
+    return {
+        name: [(key, record['seconds'], record['items'], record['calls']) for key, record in profiler._records.items()]
+        for name, profiler in _profilers.items()
+    }
+
+
+def merge_records(records):
+    """export_all で受け取った記録を、このプロセスの同名の計測器に合算する"""
+    for name, entries in records.items():
+        profiler = _profilers.get(name)
+        if profiler is None:
+            continue
+        for key, seconds, items, calls in entries:
+            profiler._add(tuple(key), seconds, items, calls)
@@ -0,0 +1,74 @@
+import numpy as np
+
+# ==========================================
+# トークン → レビュー番号 の転置インデックス
+# ==========================================
+# 評価語群ごとに全レビューを走査する代わりに、作品ごとに一度だけ
+# 「トークン → そのトークンを含むレビュー番号の昇順配列」を作っておき、
+# 評価語群の問い合わせはポスティングリストの和集合・積集合で答える。
+
+
+class InvertedIndex:
+    def __init__(self, token_sets):
+        """token_sets: レビューごとのトークン集合 (またはリスト) の列"""
+        postings = {}
+        n_docs = 0
+        for doc_id, tokens in enumerate(token_sets):
+            for token in set(tokens):
+                postings.setdefault(token, []).append(doc_id)
+            n_docs = doc_id + 1
+
+        self.n_docs = n_docs
+        # レビュー番号は昇順に追加しているので、そのまま配列にすればソート済み
+        self.postings = {token: np.asarray(ids, dtype=np.int32) for token, ids in postings.items()}
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        token_corpus.TokenCorpus から作る。語×レビュー の出現有無行列を転置するだけで、
+        各語のポスティングリストはその行列の行 (ソート済み) をそのまま使う。
+        """
+        index = cls.__new__(cls)
+        index.n_docs = len(corpus)
+        by_term = corpus.document_term_matrix(binary=True).T.tocsr()
+        by_term.sort_indices()
+        indptr, indices = by_term.indptr, by_term.indices.astype(np.int32)
+        index.postings = {
+            term: indices[indptr[i]:indptr[i + 1]]
+            for i, term in enumerate(corpus.vocabulary) if indptr[i + 1] > indptr[i]
+        }
+        return index
+
+    def __len__(self):
+        return len(self.postings)
+
+    def __contains__(self, token):
+        return token in self.postings
+
+    def lookup(self, token):
+        """トークンを含むレビュー番号の配列を返す"""
+        return self.postings.get(token, np.empty(0, dtype=np.int32))
+
+    def any_of(self, words):
+        """いずれかの語を含むレビュー番号 (和集合)"""
+        lists = [self.postings[w] for w in set(words) if w in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        if len(lists) == 1:
+            return lists[0]
+        return np.unique(np.concatenate(lists))
+
+    def all_of(self, words):
+        """すべての語を含むレビュー番号 (積集合)"""
+        words = set(words)
+        if not words:
+            return np.empty(0, dtype=np.int32)
+        lists = [self.lookup(w) for w in words]
+        # 短いリストから順に積を取ると早く空になる
+        lists.sort(key=len)
+        result = lists[0]
+        for ids in lists[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, ids, assume_unique=True)
+        return result
@@ -0,0 +1,91 @@
+# ==========================================
+# 感情辞書の複数パターン照合
+# ==========================================
+# 辞書には「ヒョウカデキナイ」「キタイハズレ」のように、MeCabでは複数の形態素に
+# 分かれる語が含まれている。形態素ごとに集合と照合するとこれらは一致しないため、
+# 辞書全体を1つの文字トライ (オートマトン) にまとめ、形態素列を1回走査して
+# 1形態素の語と複数形態素の語を同時に照合する。
+#
+# 各形態素は表層形・原形・読みのいずれでも遷移できる。照合は形態素の境界から
+# 始まり形態素の境界で終わるものだけを数える (単語の途中から始まる一致は拾わない)
+# ため、Aho-Corasick の失敗遷移は不要で、境界ごとに根から新しい照合を始める。
+# 一致が重なる場合は最左最長のものを採用し、同じ範囲ならラベルの登録順を優先する。
+
+
+class LexiconMatcher:
+    def __init__(self, lexicons):
+        """
+        lexicons: (ラベル, 語の集合) のリスト。先に書いたラベルほど優先される。
+        """
+        self.labels = []
+        self._goto = [{}]
+        self._output = [None]
+
+        for priority, (label, words) in enumerate(lexicons):
+            self.labels.append(label)
+            for word in words:
+                if not word:
+                    continue
+                state = 0
+                for ch in word:
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto.append({})
+                        self._output.append(None)
+                        self._goto[state][ch] = nxt
+                    state = nxt
+                # 同じ語が複数の辞書にある場合は先に登録したラベルを使う
+                if self._output[state] is None:
+                    self._output[state] = (priority, label, word)
+
+    def _walk(self, state, text):
+        goto = self._goto
+        for ch in text:
+            state = goto[state].get(ch)
+            if state is None:
+                return None
+        return state
+
+    def find(self, stream, standalone=None):
+        """
+        stream: 形態素ごとの候補文字列 (表層形・原形・読みなど) の集合のリスト。
+                空集合や None は照合の区切りになる (ストップワードなど)。
+        standalone: 形態素ごとに、その形態素1つだけの一致を数えてよいかどうか。
+                    None ならすべて数える。
+        戻り値: (開始位置, 終了位置, ラベル, 辞書語) のリスト。重なりはない。
+        """
+        matches = []
+        active = []
+        for pos, alternatives in enumerate(stream):
+            next_active = []
+            if alternatives:
+                seen = set()
+                active.append((0, pos))
+                for state, start in active:
+                    for text in alternatives:
+                        if not text:
+                            continue
+                        nxt = self._walk(state, text)
+                        if nxt is None or (nxt, start) in seen:
+                            continue
+                        seen.add((nxt, start))
+                        next_active.append((nxt, start))
+                        output = self._output[nxt]
+                        if output is None:
+                            continue
+                        if start == pos and standalone is not None and not standalone[pos]:
+                            continue
+                        priority, label, word = output
+                        matches.append((start, pos + 1, priority, label, word))
+            active = next_active
+
+        # 最左最長で重ならない一致を選ぶ
+        matches.sort(key=lambda m: (m[0], -m[1], m[2]))
+        selected = []
+        cursor = 0
+        for start, end, priority, label, word in matches:
+            if start >= cursor:
+                selected.append((start, end, label, word))
+                cursor = end
+        return selected
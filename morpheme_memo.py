@@ -0,0 +1,28 @@
+# ==========================================
+# 形態素ごとの判定結果のメモ
+# ==========================================
+# レビューのコーパスは同じ形態素の繰り返しがほとんどなので、
+# 「候補集合を作る → ストップワード・感情辞書と照合する」処理を形態素ごとに毎回行わず、
+# 異なり形態素ごとに1回だけ計算して辞書に覚えておく。2回目以降は辞書を1回引くだけになる。
+#
+# 判定結果はストップワードや感情辞書に依存するため、メモは実行ごと (main や
+# 分析クラスの作成ごと) に作り直すか clear() する。辞書を編集した場合も同様。
+
+DEFAULT_MAX_ENTRIES = 500000  # これを超えたら一度空にする (メモリの上限)
+
+
+class MorphemeMemo(dict):
+    def __init__(self, compute, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        compute: キー (形態素 (表層形, 品詞, 原形, 読み) や MeCab の素性文字列) を受け取り、
+        結果を返す関数。memo[キー] で結果を引く (無ければ compute で計算して覚える)。
+        """
+        super().__init__()
+        self.compute = compute
+        self.max_entries = max_entries
+
+    def __missing__(self, key):
+        if len(self) >= self.max_entries:
+            self.clear()
+        value = self[key] = self.compute(key)
+        return value
@@ -0,0 +1,153 @@
+import zlib
+
+import numpy as np
+
+# ==========================================
+# MinHash + LSH による重複・類似レビューの検出
+# ==========================================
+# 収集したレビューCSVにはコピー&ペーストされたレビューや、ほぼ同じ文面のレビューが多く、
+# 同じ内容を何度も形態素解析・集計すると感情の分布やTF-IDFが偏る。
+# ここではレビューを先頭から順に見て、それより前の「代表レビュー」と類似しているかを判定する。
+#
+#   1. 空白を除いた文字 n-gram (shingle_size 文字) の集合を作る
+#   2. num_perm 個のハッシュ関数 (a * h + b) mod P の最小値を並べた MinHash 署名を作る
+#      (2つの署名で値が一致する割合は、n-gram 集合の Jaccard 係数の推定値になる)
+#   3. 署名を bands 個の帯に分け、どれかの帯が完全に一致する代表レビューだけを候補にする (LSH)
+#   4. 候補のうち署名の一致率が threshold 以上のものがあれば重複とする
+#
+# 候補の探索はバケットを引くだけなので、全体としてほぼレビュー数に比例する時間で終わる。
+# 全く同じ文面 (空白を除いて一致) は署名を作らずに辞書で判定する。
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 64
+DEFAULT_SHINGLE_SIZE = 5
+_PRIME = (1 << 31) - 1
+
+
+def choose_bands(num_perm, threshold):
+    """
+    帯の数 b と帯あたりの行数 r (b * r = num_perm) を、候補になる類似度の目安
+    (1 / b) ^ (1 / r) が threshold に最も近くなるように選ぶ
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        gap = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or gap < best[0]:
+            best = (gap, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM,
+                 shingle_size=DEFAULT_SHINGLE_SIZE, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)[:, None]
+        self._b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)[:, None]
+
+        self.n_added = 0
+        self.n_duplicates = 0
+        self._exact = {}       # 空白を除いた文面 → 代表レビューの番号
+        self._signatures = {}  # 代表レビューの番号 → MinHash 署名
+        self._buckets = {}     # (帯の番号, 帯の値) → 代表レビューの番号のリスト
+
+    def signature(self, text):
+        """空白を除いた文字 n-gram の MinHash 署名 (uint32 配列)"""
+        k = self.shingle_size
+        shingles = {text[i:i + k] for i in range(max(len(text) - k + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                             dtype=np.uint64, count=len(shingles)) % _PRIME
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def add(self, text):
+        """
+        text を追加し、それより前の類似した代表レビューの番号 (追加した順の 0 始まり) を返す。
+        類似したものが無ければ text を新しい代表として登録し、None を返す。
+        """
+        index = self.n_added
+        self.n_added += 1
+        normalized = ''.join(text.split()) if isinstance(text, str) else ''
+        if not normalized:
+            return None
+
+        representative = self._exact.get(normalized)
+        if representative is not None:
+            self.n_duplicates += 1
+            return representative
+
+        signature = self.signature(normalized)
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+        # 帯が一致した代表レビューのうち、署名の一致率が最も高いもの
+        best, best_similarity = None, 0.0
+        seen = set()
+        for key in keys:
+            for candidate in self._buckets.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                similarity = np.count_nonzero(self._signatures[candidate] == signature) / self.num_perm
+                if similarity >= self.threshold and similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+        if best is not None:
+            self.n_duplicates += 1
+            return best
+
+        self._exact[normalized] = index
+        self._signatures[index] = signature
+        for key in keys:
+            self._buckets.setdefault(key, []).append(index)
+        return None
+
+    def duplicate_rate(self):
+        return self.n_duplicates / self.n_added if self.n_added else 0.0
+
+
+def find_near_duplicates(texts, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM,
+                         shingle_size=DEFAULT_SHINGLE_SIZE):
+    """
+    各レビューの代表レビューの位置を返す (int64 配列。代表レビュー自身と文字列でないものは自分の位置)。
+    代表は類似したグループのうち最初に現れたレビュー。
+    """
+    index = NearDuplicateIndex(threshold, num_perm, shingle_size)
+    representatives = np.arange(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        representative = index.add(text)
+        if representative is not None:
+            representatives[i] = representative
+    return representatives
+
+
+def representative_mask(texts, threshold=DEFAULT_THRESHOLD, seen=()):
+    """
+    texts の各レビューが代表かどうか (それより前のレビューとも seen のレビューとも類似していないか) の
+    bool 配列を返す。追記分だけを解析する場合は、処理済みのレビューを元の順に seen に渡す。
+    """
+    index = NearDuplicateIndex(threshold)
+    for text in seen:
+        index.add(text)
+    return np.array([index.add(text) is None for text in texts], dtype=bool)
+
+
+def collapse_duplicates(texts, threshold=DEFAULT_THRESHOLD):
+    """
+    (代表レビューの位置の配列, 各レビューが何番目の代表に属するかの配列) を返す。
+    代表だけを解析した結果 results に対し、results[inverse] で全レビュー分に戻せる。
+    """
+    return np.unique(find_near_duplicates(texts, threshold), return_inverse=True)
+
+
+def appended_representatives(texts, n_seen, threshold=DEFAULT_THRESHOLD):
+    """
+    追記分 texts[n_seen:] の各レビューについて、代表レビューの texts での位置の配列を返す
+    (代表が処理済みのレビュー、つまり n_seen より前の位置になることもある)。
+    """
+    unique_positions, inverse = collapse_duplicates(texts, threshold)
+    return unique_positions[inverse[n_seen:]]
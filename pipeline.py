@@ -0,0 +1,234 @@
+import argparse
+import ast
+import os
+from functools import partial
+
+import MeCab
+
+import TFIDF
+import sv
+import 共起
+import 共起分析
+import 感情
+import 感情分析
+import token_table
+from plotting import set_headless
+from stage_graph import StageGraph
+from token_cache import dictionary_identity, get_token_cache
+from token_table import FORMAT_VERSION, load_token_table, table_path
+
+# ==========================================
+# 全スクリプトをまとめて実行する入口
+# ==========================================
+# 各スクリプトは 読み込み → 前処理 → 形態素解析 → スコア計算 → CSV → グラフ を
+# それぞれ最初から実行するが、形態素解析 (トークン表) はCSVの列ごとに共通なので、
+# ここでは
+#   tokenize:<CSV名>:<列名>  … トークン表の作成 (入力: CSVの内容ハッシュ・列名・MeCab辞書)
+#   TFIDF / 共起分析 / 感情分析 / 共起 / 感情 / sv … 各スクリプトの main
+#       (入力: スクリプト自身・CSVの内容ハッシュ・辞書・ストップワード・品詞フィルタ)
+# をステージとして宣言し、入力が変わったステージだけを実行する (stage_graph.StageGraph)。
+# 例えば 感情.py の NEGATIVE_WORDS_SET を編集すると 感情 ステージだけが実行され、
+# 形態素解析は保存済みのトークン表を使うので MeCab は呼ばれない。
+# どのステージの入力にも、そのスクリプトが import するこのディレクトリのモジュール
+# (token_cache.py, lexicon_matcher.py, tfidf_utils.py など) の内容ハッシュを含める。
+# CSVが無い作品は、各スクリプトを直接実行した場合と同じくその作品だけを飛ばし、
+# スクリプトのステージ自体は実行する。
+#
+# 使い方:
+#   python pipeline.py                 # 古いステージをすべて実行
+#   python pipeline.py 感情 共起        # 指定したステージ (と依存先) だけ
+#   python pipeline.py --list          # 各ステージが最新かどうかを表示
+#   python pipeline.py --force TFIDF   # 入力が変わっていなくても実行
+#
+# バッチ実行用なので、グラフは常に画面を使わずにファイルへ保存する (headless)。
+
+
+def _script_path(module):
+    return os.path.abspath(module.__file__)
+
+
+def local_modules(module):
+    """
+    module のファイルと、それが (関数の中の遅延 import も含めて) 読み込む
+    このディレクトリのモジュールのファイルのパスを、間接的なものも含めて返す。
+    """
+    base = os.path.dirname(_script_path(module))
+    found = set()
+    pending = [_script_path(module)]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.add(path)
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                candidate = os.path.join(base, name.split('.')[0] + '.py')
+                if os.path.exists(candidate):
+                    pending.append(candidate)
+    return sorted(found)
+
+
+def _tokenize_stage_name(config):
+    # file_config のパスは Windows 形式なので、どちらの区切り文字でもファイル名を取り出す
+    file_name = os.path.basename(config['path'].replace('\\', '/'))
+    return f"tokenize:{file_name}:{config['review_col']}"
+
+
+def _run_tokenize(path, column, workers):
+    # CSVが無い・読めない作品は、各スクリプトがその作品だけを飛ばすので、ここでも失敗にしない
+    if not os.path.exists(path):
+        print(f"⚠️ {path} が見つからないため、トークン表を作りません (この作品は各スクリプトで飛ばされます)。")
+        return True
+    table = load_token_table(path, column, MeCab.Tagger(), workers=workers, cache=get_token_cache())
+    if table is None:
+        print(f"⚠️ {path} のトークン表を作れませんでした (この作品は各スクリプトで飛ばされます)。")
+        return True
+    print(f"✅ トークン表を保存しました ({len(table)} 行): {table_path(path, column)}")
+    return True
+
+
+def build_graph(workers=1, title_workers=1, charts=True):
+    graph = StageGraph()
+    dictionary = dictionary_identity(MeCab.Tagger())
+
+    def code_hashes(module):
+        # スクリプトと、それが読み込むこのディレクトリのモジュールの内容ハッシュ
+        return {os.path.basename(path): graph.file_hash(path) for path in local_modules(module)}
+
+    # --- トークン表 (CSVの列ごとに1つ、全スクリプトで共有) ---
+    script_configs = {
+        'TFIDF': TFIDF.file_config,
+        '共起分析': 共起分析.file_config,
+        '感情分析': 感情分析.file_config,
+        '共起': 共起.file_config,
+        '感情': 感情.file_config,
+    }
+    tokenize_code = code_hashes(token_table)
+    for configs in script_configs.values():
+        for config in configs:
+            name = _tokenize_stage_name(config)
+            if name in graph.stages:
+                continue
+            csv_hash = graph.file_hash(config['path'])
+            graph.add(
+                name,
+                partial(_run_tokenize, config['path'], config['review_col'], workers),
+                inputs={'csv': csv_hash, 'column': config['review_col'], 'dictionary': dictionary,
+                        'format': FORMAT_VERSION, 'code': tokenize_code},
+                # CSVが無い場合は表も作られない (CSVが置かれるとハッシュが変わって実行し直す)
+                outputs=[table_path(config['path'], config['review_col'])] if csv_hash is not None else [],
+            )
+
+    def script_inputs(module, configs, **lexicons):
+        inputs = {
+            'script': code_hashes(module),
+            'csv': {config['title']: graph.file_hash(config['path']) for config in configs},
+            'charts': charts,
+        }
+        inputs.update(lexicons)
+        return inputs
+
+    def title_outputs(configs, pattern):
+        # CSVが無い作品は飛ばされて出力も作られないので、CSVがある作品の出力だけを確認する
+        return [pattern.format(title=config['title']) for config in configs if os.path.exists(config['path'])]
+
+    def tokenize_deps(configs):
+        return sorted({_tokenize_stage_name(config) for config in configs})
+
+    # --- 各スクリプト ---
+    graph.add(
+        'TFIDF',
+        partial(TFIDF.main, workers=workers, title_workers=title_workers, charts=charts, headless=True),
+        inputs=script_inputs(TFIDF, TFIDF.file_config,
+                             stop_words=TFIDF.stop_words, target_pos=TFIDF.target_hinshi),
+        deps=tokenize_deps(TFIDF.file_config),
+        outputs=['results/tfidf_key_feature_words.csv'],
+    )
+    graph.add(
+        '共起分析',
+        partial(共起分析.main, workers=workers, title_workers=title_workers, charts=charts, headless=True),
+        inputs=script_inputs(共起分析, 共起分析.file_config, stop_words=共起分析.stop_words,
+                             aspects=共起分析.evaluation_aspects, target_pos=共起分析.target_hinshi),
+        deps=tokenize_deps(共起分析.file_config),
+        outputs=['results/aspect_scores_summary_optimized.csv'],
+    )
+    graph.add(
+        '感情分析',
+        partial(感情分析.main, workers=workers, title_workers=title_workers, charts=charts, headless=True),
+        inputs=script_inputs(感情分析, 感情分析.file_config, stop_words=感情分析.stop_words,
+                             positive_words=感情分析.positive_words, negative_words=感情分析.negative_words,
+                             target_pos=感情分析.target_hinshi),
+        deps=tokenize_deps(感情分析.file_config),
+        outputs=title_outputs(感情分析.file_config, 'results/{title}_sentiment_analysis_results.csv'),
+    )
+    # 共起.py / 感情.py は追記分だけを解析するモードで実行する
+    # (辞書が変わった場合は、各スクリプトの状態ファイルが自動で作り直される)
+    graph.add(
+        '共起',
+        partial(共起.main, workers=workers, incremental=True, title_workers=title_workers,
+                charts=charts, headless=True),
+        inputs=script_inputs(共起, 共起.file_config, aspects=共起.ASPECTS,
+                             positive_words=共起.POSITIVE_WORDS_SET, negative_words=共起.NEGATIVE_WORDS_SET,
+                             stop_words=共起.STOP_WORDS, target_pos=共起.TARGET_POS),
+        deps=tokenize_deps(共起.file_config),
+        outputs=['results/cooccurrence_scores_final.csv'],
+    )
+    graph.add(
+        '感情',
+        partial(感情.main, workers=workers, incremental=True, title_workers=title_workers,
+                charts=charts, headless=True),
+        inputs=script_inputs(感情, 感情.file_config,
+                             positive_words=感情.POSITIVE_WORDS_SET, negative_words=感情.NEGATIVE_WORDS_SET,
+                             stop_words=感情.STOP_WORDS, target_pos=感情.TARGET_POS),
+        deps=tokenize_deps(感情.file_config),
+        outputs=title_outputs(感情.file_config, 'results/{title}_sentiment_details.csv'),
+    )
+    # sv.py はトークン表を使わず、レビューごとに形態素解析キャッシュを引く
+    graph.add(
+        'sv',
+        partial(sv.main, charts=charts, headless=True),
+        inputs={'script': code_hashes(sv), 'csv': graph.file_hash(sv.file_path),
+                'charts': charts, 'positive_words': sv.positive_words,
+                'negative_words': sv.negative_words, 'stop_words': sv.stop_words},
+        outputs=['scenario_evaluation_results.csv'],
+    )
+    return graph
+
+
+def main(targets=None, workers=1, title_workers=1, charts=True, force=False, list_only=False):
+    set_headless(True)
+    graph = build_graph(workers=workers, title_workers=title_workers, charts=charts)
+    # ファイルの内容ハッシュは記録しておき、次回は更新日時が変わったファイルだけ読み直す
+    graph.save()
+
+    if list_only:
+        for name, current in graph.status(targets):
+            mark = '✅ 最新' if current else '🔄 要実行'
+            print(f"  {mark}  {name}")
+        return
+
+    executed, failed = graph.run(targets, force=force)
+    print(f"\n--- パイプライン完了: 実行 {len(executed)} ステージ / 失敗 {len(failed)} ステージ ---")
+    for name in failed:
+        print(f"  ⚠️ {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='全スクリプトを、入力が変わったステージだけ実行する')
+    parser.add_argument('stages', nargs='*', help='実行するステージ (省略時はすべて。依存先も実行する)')
+    parser.add_argument('--list', action='store_true', help='各ステージが最新かどうかを表示して終了する')
+    parser.add_argument('--force', action='store_true', help='入力が変わっていないステージも実行する')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析に使うプロセス数')
+    parser.add_argument('--title-workers', type=int, default=1, help='作品を並行して処理するプロセス数')
+    parser.add_argument('--no-charts', action='store_true', help='グラフを作らない (matplotlib を読み込まない)')
+    args = parser.parse_args()
+    main(targets=args.stages or None, workers=args.workers, title_workers=args.title_workers,
+         charts=not args.no_charts, force=args.force, list_only=args.list)
@@ -0,0 +1,44 @@
+import sys
+
+# ==========================================
+# グラフ描画 (matplotlib) の遅延読み込み
+# ==========================================
+# matplotlib の import には時間がかかり、GUIバックエンドの初期化も伴うため、
+# 各スクリプトは起動時に読み込まず、グラフを描く段階で初めて pyplot() を呼ぶ。
+# グラフを作らない実行 (--no-charts) では matplotlib は一度も読み込まれない。
+#
+# headless (--headless) の場合は画面を使わない Agg バックエンドで描画してファイルに保存し、
+# show() はウィンドウを開かない。バッチ実行がGUIの表示待ちで止まらない。
+
+_headless = False
+
+
+def set_headless(headless=True):
+    """画面を使わずに描画するかどうかを設定する (pyplot() を最初に呼ぶ前に設定する)"""
+    global _headless
+    _headless = headless
+
+
+def is_headless():
+    return _headless
+
+
+def pyplot(rc=None):
+    """
+    matplotlib.pyplot を読み込んで返す。rc ({'font.family': ..., 'font.size': ...} など) を
+    指定するとグラフ描画の設定に反映する。
+    """
+    import matplotlib
+    if _headless and 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    if rc:
+        plt.rcParams.update(rc)
+    return plt
+
+
+def show():
+    """描画したグラフを画面に表示する。headless の場合や、グラフを描いていない場合は何もしない"""
+    if _headless or 'matplotlib.pyplot' not in sys.modules:
+        return
+    sys.modules['matplotlib.pyplot'].show()
@@ -0,0 +1,125 @@
+import hashlib
+import heapq
+import math
+
+import numpy as np
+
+# ==========================================
+# 固定メモリの頻出要素推定 (ストリーミング集計用)
+# ==========================================
+# 数百万件のレビューの単語・共起ペアを Counter で数えると、語彙やペアの数だけ
+# メモリが増え続ける。ここでは上限つきのメモリで上位の要素だけを追跡する。
+#
+# SpaceSaving (Metwally et al.): 最大 capacity 個の要素のカウンタだけを持つ。
+#   満杯のときに新しい要素が来たら、最小カウンタの要素を追い出し、その値を引き継ぐ。
+#   推定値は常に真の値以上で、過大分は要素ごとの error 以下 (error ≤ 総数 / capacity)。
+#   したがって 真の値 は [count - error, count] に必ず入る。
+# Count-Min (Cormode & Muthukrishnan): depth 行 × width 列 のカウンタ表。
+#   推定値は常に真の値以上で、確率 1 - e^-depth 以上で 過大分 ≤ (e / width) × 総数。
+#   SpaceSaving の上限と合わせて min(count, Count-Min の推定値) を上限に使う。
+
+
+class SpaceSaving:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        # (カウンタ, 要素) の最小ヒープ。加算のたびには更新せず、取り出すときに古い値なら入れ直す
+        self._heap = []
+
+    def add(self, item, weight=1):
+        """item の出現を weight 回 (正の整数) 数える"""
+        self.total += weight
+        counts = self.counts
+        if item in counts:
+            counts[item] += weight
+            return
+        if len(counts) < self.capacity:
+            counts[item] = weight
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (weight, item))
+            return
+
+        # 最小カウンタの要素を追い出し、その値を新しい要素の誤差として引き継ぐ
+        min_count, victim = self._pop_min()
+        del counts[victim]
+        del self.errors[victim]
+        counts[item] = min_count + weight
+        self.errors[item] = min_count
+        heapq.heappush(self._heap, (min_count + weight, item))
+
+    def _pop_min(self):
+        heap = self._heap
+        counts = self.counts
+        while True:
+            count, item = heapq.heappop(heap)
+            current = counts[item]
+            if current == count:
+                return count, item
+            # 加算済みの要素は現在の値で入れ直す (ヒープ上の値は常に実際の値以下)
+            heapq.heappush(heap, (current, item))
+
+    def min_count(self):
+        """追跡していない要素の真の出現回数の上限 (満杯でなければ 0)"""
+        if len(self.counts) < self.capacity or not self.counts:
+            return 0
+        count, item = self._pop_min()
+        heapq.heappush(self._heap, (count, item))
+        return count
+
+    def top(self, n, sketch=None):
+        """
+        推定値の大きい順に上位 n 件を [(要素, 下限, 上限), ...] で返す。
+        真の出現回数は必ず [下限, 上限] に入る (sketch (CountMinSketch) を渡すと、
+        その推定値も上限に使う。Count-Min も過小には推定しないので上限のままである)。
+        """
+        entries = []
+        for item, count in self.counts.items():
+            upper = count if sketch is None else min(count, sketch.estimate(item))
+            entries.append((item, count - self.errors[item], upper))
+        # 上限 (推定値) の大きい順、同じなら下限の大きい順に並べる
+        return heapq.nsmallest(n, entries, key=lambda e: (-e[2], -e[1], e[0]))
+
+    def error_bound(self):
+        """どの要素についても、推定値の過大分の上限 (総数 / capacity)"""
+        return self.total / self.capacity if self.capacity else 0.0
+
+
+class CountMinSketch:
+    def __init__(self, width=2 ** 16, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self._rows = np.arange(depth)
+
+    def _columns(self, item):
+        # 要素 (文字列または文字列のタプル) の64bitハッシュを2つに分け、二重ハッシュで各行の列を決める
+        key = item if isinstance(item, str) else '\0'.join(item)
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], 'little')
+        h2 = int.from_bytes(digest[4:], 'little') | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add_many(self, items, weights=None):
+        """複数の要素をまとめて数える (weights を省略すると各1回)"""
+        if not items:
+            return
+        columns = np.array([self._columns(item) for item in items], dtype=np.int64)
+        weights = np.ones(len(items), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        self.total += int(weights.sum())
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[:, row], weights)
+
+    def add(self, item, weight=1):
+        self.total += weight
+        self.table[self._rows, self._columns(item)] += weight
+
+    def estimate(self, item):
+        """item の出現回数の推定値 (真の値以上)"""
+        return int(self.table[self._rows, self._columns(item)].min())
+
+    def error_bound(self):
+        """(過大分の上限, その上限を超える確率) = ((e / width) × 総数, e^-depth)"""
+        return math.e / self.width * self.total, math.exp(-self.depth)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+
+from incremental_state import STATE_DIR, fingerprint
+
+# ==========================================
+# 入力のハッシュで最新かどうかを判定するステージグラフ
+# ==========================================
+# 各ステージは「入力 (CSVの内容ハッシュ・辞書・ストップワード・品詞フィルタなど)」と
+# 「依存するステージ」と「出力ファイル」を宣言する。ステージの鍵は
+#   入力のハッシュ + 依存ステージの鍵
+# で、前回成功したときの鍵と同じで出力ファイルも残っていれば、そのステージは実行しない。
+# 依存先の入力が変わると鍵も変わるので、下流のステージも実行される。
+# 実行に失敗した (例外を送出した、または False を返した) ステージは記録せず、
+# それに依存するステージも実行しない。前回の鍵は results/state/stages.json に保存する。
+
+MANIFEST_PATH = os.path.join(STATE_DIR, 'stages.json')
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class Stage:
+    def __init__(self, name, run, inputs=None, deps=(), outputs=()):
+        """
+        run: 引数なしで呼ぶ関数 (失敗したら False を返すか例外を送出する)。inputs: 結果に影響する値 (ハッシュを取る)。
+        deps: 先に実行するステージ名。outputs: 作られるはずのファイル (無ければ実行し直す)。
+        """
+        self.name = name
+        self.run = run
+        self.inputs = inputs or {}
+        self.deps = tuple(deps)
+        self.outputs = tuple(outputs)
+
+
+class StageGraph:
+    def __init__(self, manifest_path=MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self.stages = {}
+        self.manifest = {'stages': {}, 'files': {}}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, encoding='utf-8') as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ ステージの記録を読み込めませんでした ({e})。すべてのステージを実行します。")
+
+    def add(self, name, run, inputs=None, deps=(), outputs=()):
+        if name in self.stages:
+            raise ValueError(f"ステージ '{name}' は既に登録されています。")
+        self.stages[name] = Stage(name, run, inputs, deps, outputs)
+        return self.stages[name]
+
+    def file_hash(self, path):
+        """
+        ファイルの内容のハッシュ (無ければ None)。サイズと更新日時が前回と同じなら、
+        記録済みのハッシュを使い回して読み直さない。
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = os.path.abspath(path)
+        known = self.manifest['files'].get(key)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha1']
+
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        self.manifest['files'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                       'sha1': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def order(self, targets=None):
+        """targets (省略時はすべて) とその依存ステージを、依存先が先になる順に並べる"""
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name not in self.stages:
+                raise KeyError(f"ステージ '{name}' は登録されていません。")
+            if name in visiting:
+                raise ValueError(f"ステージ '{name}' の依存関係が循環しています。")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in (targets or self.stages):
+            visit(name)
+        return ordered
+
+    def _key(self, stage, keys):
+        return fingerprint(stage.inputs, [keys[dep] for dep in stage.deps])
+
+    def is_current(self, name, key):
+        stage = self.stages[name]
+        return (self.manifest['stages'].get(name) == key
+                and all(os.path.exists(path) for path in stage.outputs))
+
+    def status(self, targets=None):
+        """各ステージが最新かどうかを [(ステージ名, 最新なら True)] で返す (何も実行しない)"""
+        keys = {}
+        result = []
+        for name in self.order(targets):
+            keys[name] = self._key(self.stages[name], keys)
+            result.append((name, self.is_current(name, keys[name])))
+        return result
+
+    def run(self, targets=None, force=False):
+        """
+        古いステージだけを依存順に実行する。force=True なら targets (省略時はすべて) は
+        最新でも実行する (依存先は古い場合だけ実行する)。
+        (実行したステージ名のリスト, 失敗したステージ名のリスト) を返す。
+        """
+        keys = {}
+        executed = []
+        failed = []
+        forced = set(targets or self.stages) if force else set()
+        for name in self.order(targets):
+            stage = self.stages[name]
+            keys[name] = self._key(stage, keys)
+            if any(dep in failed for dep in stage.deps):
+                print(f"⚠️ {name}: 依存するステージが失敗したため実行しません。")
+                failed.append(name)
+                continue
+            if name not in forced and self.is_current(name, keys[name]):
+                print(f"⏭️ {name}: 入力が変わっていないためスキップします。")
+                continue
+
+            print(f"\n▶️ {name} を実行します...")
+            try:
+                ok = stage.run() is not False
+            except Exception as e:
+                print(f"エラー: ステージ {name} の実行に失敗しました: {e}")
+                ok = False
+            if not ok:
+                failed.append(name)
+                continue
+            # 入力の鍵は実行前に計算したものを記録する (実行中に入力が変わった場合は次回やり直す)
+            self.manifest['stages'][name] = keys[name]
+            self.save()
+            executed.append(name)
+        return executed, failed
+
+    def save(self):
+        directory = os.path.dirname(self.manifest_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -1,20 +1,38 @@
 import pandas as pd
 import MeCab
 import numpy as np
-from collections import Counter, defaultdict
-from sklearn.feature_extraction.text import TfidfVectorizer
-import matplotlib.pyplot as plt
+import argparse
+from collections import Counter
+from cooccurrence import ASSOCIATION_MEASURES, build_document_term_matrix, top_associations, top_cooccurring_pairs
+from csv_reader import force_read_csv, iter_csv_chunks
+from morpheme_memo import MorphemeMemo
+from plotting import pyplot, set_headless
+from sketches import CountMinSketch, SpaceSaving
+from text_memo import TextMemo
+from tfidf_utils import save_tfidf_matrix, top_k_in_row
+from token_cache import get_token_cache
 
 # --- 1. 準備と設定 ---
 
-# 日本語表示の設定 (Windows環境で利用可能なフォントを優先)
+# 日本語表示の設定 (Windows環境で利用可能なフォントを優先、グラフを描くときに反映する)
 # もしMeiryoでエラーが出る場合は 'Yu Gothic' や 'MS Gothic' を試してください。
-plt.rcParams['font.family'] = 'Meiryo' 
-plt.rcParams['font.size'] = 12
+CHART_RC = {'font.family': 'Meiryo', 'font.size': 12}
 
 # データの読み込みパス
 file_path = r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\ポケモンsvシナリオデータ.csv'
 
+# TF-IDF行列を疎行列のまま保存するかどうか (tfidf_matrix.npz / tfidf_matrix_terms.json)
+SAVE_TFIDF_MATRIX = False
+
+# レビュー本文が含まれる列名
+TEXT_COLUMN = 'シナリオ小文章'
+
+# ストリーミング集計 (--stream) で追跡する単語・ペアの最大数 (メモリはこれで一定になる)
+STREAM_CAPACITY = 10000
+
+# --stream で共起ペアを数える範囲 (前後 N 語以内)。レビュー全体の全ペアは語数の2乗に比例するため使わない
+STREAM_WINDOW = 5
+
 # 感情極性辞書（シナリオ評価に特化して強化）
 positive_words = {"素晴らしい", "感動的", "最高", "名作", "面白い", "良い", "良かった", "好き", "泣く", "神", "楽しい", "期待", "熱い", "カワイイ", "ツナガル", "タノシイ", "アツい", "テンカイ"}
 negative_words = {"弱い", "平凡", "残念", "陳腐", "最悪", "ストレス", "評価できない", "微妙", "つまらない", "不満", "悪い", "オクレ", "クソ","モンダイ", "ムリョウ", "ソガイ", "メンドウ", "サイアク", "コンナン", "ワルイ", "ナンイ"}
@@ -35,135 +53,54 @@ stop_words = {
     "ホカク", "シュルイ", "タチバ", "マチ", "イチ", "アタリ", "バアイ", "ジム"
 }
 
-# データの読み込み関数 (前回の回答でエンコーディングの問題は解決済みと仮定)
-def force_read_csv(file_path):
-    encodings_to_try = ['utf-8', 'shift_jis', 'cp932', 'euc-jp']
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=encoding)
-            return df
-        except Exception:
-            continue
-    try:
-        df = pd.read_csv(file_path, encoding='utf-8', errors='ignore')
-        return df
-    except Exception:
-        return None
 
-df = force_read_csv(file_path)
+def select_word(morpheme):
+    """1つの形態素から採用する単語 (対象外なら None)"""
+    surface_form, hinshi, base_form, reading = morpheme
+    # 1. ストップワードチェック用の原形 (多くの場合カタカナ) を取得
+    original_form_for_check = base_form or surface_form
 
-# レビュー本文が含まれる列名を明示的に指定
-TEXT_COLUMN = 'シナリオ小文章' 
+    # 抽出条件: 
+    # 1. 原形がストップワードに含まれないこと (カタカナの「スル」をこれで防ぐ)
+    # 2. 表面形 (元の表記) が1文字より長いこと
+    if original_form_for_check not in stop_words and len(surface_form) > 1:
+        return surface_form
+    return None
 
-if TEXT_COLUMN in df.columns:
-    game_reviews = df[TEXT_COLUMN].astype(str).tolist()
-    game_reviews = [r.replace('nan', '').strip() for r in game_reviews if r != 'nan' and r != '']
-    print(f"✅ シナリオ小文章列: '{TEXT_COLUMN}' を分析対象とします。")
-else:
-    print(f"🚨 エラー: データフレームに '{TEXT_COLUMN}' という列が見つかりません。")
-    raise ValueError(f"列 '{TEXT_COLUMN}' が見つかりません。")
 
-# --- MeCab Taggerの初期化 ---
-mecab = MeCab.Tagger() 
+# 異なり形態素ごとの select_word の結果 (main の実行ごとに空にする)
+word_memo = MorphemeMemo(select_word)
 
-def preprocess_text(text):
+# 本文 → 前処理結果 の LRU メモ (main の実行ごとに空にする)
+text_memo = TextMemo()
+
+
+def preprocess_text(text, mecab_tagger):
     """テキストを形態素解析し、名詞・動詞・形容詞・感動詞の原形を抽出"""
-    words = []
     if not isinstance(text, str) or len(text) < 2:
         return []
-        
-    try:
-        node = mecab.parseToNode(text)
-    except Exception:
-        return []
+    # 同じ文面は1回だけ解析する
+    return list(text_memo.get(text, _preprocess_words, mecab_tagger))
+
 
+def _preprocess_words(text, mecab_tagger):
+    words = []
     target_hinshi = ('名詞', '動詞', '形容詞', '感動詞')
+
+    try:
+        # 対象品詞 (名詞・動詞・形容詞・感動詞) の形態素をキャッシュ経由で取得
+        morphemes = get_token_cache().morphemes(mecab_tagger, text, target_hinshi)
+    except Exception:
+        return ()
     
-    while node:
-        features = node.feature.split(',')
-        hinshi = features[0]
+    memo = word_memo
+    for morpheme in morphemes:
+        word = memo[morpheme]
+        if word is not None:
+            words.append(word)
         
-        # 1. ストップワードチェック用の原形 (多くの場合カタカナ) を取得
-        original_form_for_check = node.surface
-        if len(features) >= 7 and features[6] != '*':
-            original_form_for_check = features[6]
+    return tuple(words)
 
-        # 2. 結果出力用の表面形（元の表記）を取得
-        surface_form = node.surface
-        
-        # 抽出条件: 
-        # 1. 対象品詞であること
-        # 2. 原形がストップワードに含まれないこと (カタカナの「スル」をこれで防ぐ)
-        # 3. 表面形が1文字より長いこと
-        if hinshi in target_hinshi and original_form_for_check not in stop_words and len(surface_form) > 1:
-            words.append(surface_form)
-        
-        node = node.next
-    return words
-
-processed_reviews = [preprocess_text(review) for review in game_reviews]
-tokenized_reviews_str = [" ".join(words) for words in processed_reviews] # 共起行列/TF-IDF用
-
-print("✅ 前処理結果 (形態素解析とフィルタリング) の最初の5件:")
-for i in range(min(5, len(processed_reviews))):
-    print(f"  シナリオレビュー {i+1}: {processed_reviews[i]}")
-print("-" * 50)
-
-
-# --- 3. 単語頻出度分析 (Word Frequency) ---
-
-all_words = [word for sublist in processed_reviews for word in sublist]
-word_counts = Counter(all_words)
-most_common = word_counts.most_common(20) # 頻出上位20単語
-print("✅ 単語頻出度分析 (上位20単語):")
-for word, count in most_common:
-    print(f"  {word}: {count}回")
-
-# 棒グラフで可視化
-if most_common:
-    words, counts = zip(*most_common)
-    plt.figure(figsize=(12, 6))
-    plt.bar(words, counts)
-    plt.title('単語頻出度 (Word Frequency)')
-    plt.xlabel('単語')
-    plt.ylabel('出現回数')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.savefig('word_frequency_bar_chart.png')
-    plt.close()
-    print("棒グラフを 'word_frequency_bar_chart.png' として保存しました。")
-else:
-    print("分析対象の単語がありませんでした。")
-
-print("-" * 50)
-
-
-# --- 4. 共起行列 (Co-occurrence Matrix) ---
-
-co_occurrence_counts = defaultdict(int)
-for words in processed_reviews:
-    for i in range(len(words)):
-        for j in range(i + 1, len(words)):
-            pair = tuple(sorted((words[i], words[j])))
-            co_occurrence_counts[pair] += 1
-
-top_n = 10
-sorted_co_occurrence = sorted(co_occurrence_counts.items(), key=lambda item: item[1], reverse=True)[:top_n]
-print(f"✅ 共起分析 (共起頻度の高い上位{top_n}ペア):")
-for (word1, word2), count in sorted_co_occurrence:
-    print(f"  {word1} - {word2}: {count}回")
-
-# TF-IDF行列の作成
-vectorizer = TfidfVectorizer(use_idf=True)
-tfidf_matrix = vectorizer.fit_transform(tokenized_reviews_str)
-feature_names = vectorizer.get_feature_names_out()
-tfidf_df = pd.DataFrame(tfidf_matrix.toarray(), columns=feature_names)
-print("\n✅ TF-IDF行列の最初の5行と5列 (データの一部):")
-print(tfidf_df.iloc[:5, :5])
-print("-" * 50)
-
-
-# --- 5. 感情分析 (Sentiment Analysis) ---
 
 def analyze_sentiment(words):
     """辞書ベースの感情分析"""
@@ -179,41 +116,227 @@ def analyze_sentiment(words):
         
     return sentiment, positive_score, negative_score
 
-results = []
-for i, words in enumerate(processed_reviews):
-    sentiment, pos_score, neg_score = analyze_sentiment(words)
-    results.append({
-        'Review_ID': i + 1,
-        'Original_Review': game_reviews[i],
-        'Sentiment': sentiment,
-        'Positive_Score': pos_score,
-        'Negative_Score': neg_score
-    })
-
-sentiment_df = pd.DataFrame(results)
-print("✅ 感情分析結果 (最初の5件):")
-print(sentiment_df.head())
-
-# 感情極性の分布を可視化
-sentiment_counts = sentiment_df['Sentiment'].value_counts()
-if not sentiment_counts.empty:
-    plt.figure(figsize=(6, 6))
-    plt.pie(sentiment_counts, labels=sentiment_counts.index, autopct='%1.1f%%', startangle=90, colors=['#66b3ff','#ff9999','#99ff99'])
-    plt.title('レビュー感情極性の分布')
-    plt.tight_layout()
-    plt.savefig('sentiment_distribution_pie_chart.png')
-    plt.close()
-    print("円グラフを 'sentiment_distribution_pie_chart.png' として保存しました。")
-else:
-    print("感情分析の対象データがありませんでした。")
-
-print("-" * 50)
-
-# 結果の統合とCSV書き出し
-output_df = df.copy()
-output_df = output_df.merge(sentiment_df, left_index=True, right_index=True, how='left')
-output_df['Processed_Words'] = pd.Series([processed_reviews[i] if i < len(processed_reviews) else [] for i in range(len(output_df))])
-
-output_filename = 'scenario_evaluation_results.csv'
-output_df.to_csv(output_filename, index=False, encoding='utf-8')
-print(f"✅ 分析結果を '{output_filename}' に書き出しました。")
\ No newline at end of file
+
+def main(charts=True, headless=False, save_matrix=SAVE_TFIDF_MATRIX, measure=None, window=None, min_count=2):
+    """
+    シナリオデータ1件を分析する。charts=False の場合はグラフを作らない (matplotlib を読み込まない)。
+    headless=True の場合は画面を使わずに描画してファイルに保存する。
+    measure ('pmi', 'npmi', 'dice', 'jaccard', 'llr') を指定すると、共起数に加えて関連度の高いペアも表示する
+    (window を指定すると前後 window 語以内の共起、省略時はレビュー単位。共起数 min_count 未満のペアは除く)。
+    """
+    set_headless(headless)
+    # ストップワードを編集した場合に備え、形態素ごとの判定結果は実行ごとに作り直す
+    word_memo.clear()
+    text_memo.clear()
+
+    df = force_read_csv(file_path)
+
+    if TEXT_COLUMN in df.columns:
+        game_reviews = df[TEXT_COLUMN].astype(str).tolist()
+        game_reviews = [r.replace('nan', '').strip() for r in game_reviews if r != 'nan' and r != '']
+        print(f"✅ シナリオ小文章列: '{TEXT_COLUMN}' を分析対象とします。")
+    else:
+        print(f"🚨 エラー: データフレームに '{TEXT_COLUMN}' という列が見つかりません。")
+        raise ValueError(f"列 '{TEXT_COLUMN}' が見つかりません。")
+
+    # --- MeCab Taggerの初期化 ---
+    mecab = MeCab.Tagger() 
+
+    processed_reviews = [preprocess_text(review, mecab) for review in game_reviews]
+    print(f"✅ 前処理: {text_memo.summary()}。")
+    tokenized_reviews_str = [" ".join(words) for words in processed_reviews] # 共起行列/TF-IDF用
+
+    print("✅ 前処理結果 (形態素解析とフィルタリング) の最初の5件:")
+    for i in range(min(5, len(processed_reviews))):
+        print(f"  シナリオレビュー {i+1}: {processed_reviews[i]}")
+    print("-" * 50)
+
+
+    # --- 3. 単語頻出度分析 (Word Frequency) ---
+
+    # コーパス全体を1つのリストに平らにせず、レビューごとに数える
+    word_counts = Counter()
+    for words in processed_reviews:
+        word_counts.update(words)
+    most_common = word_counts.most_common(20) # 頻出上位20単語
+    print("✅ 単語頻出度分析 (上位20単語):")
+    for word, count in most_common:
+        print(f"  {word}: {count}回")
+
+    # 棒グラフで可視化
+    if not most_common:
+        print("分析対象の単語がありませんでした。")
+    elif charts:
+        words, counts = zip(*most_common)
+        plt = pyplot(CHART_RC)
+        plt.figure(figsize=(12, 6))
+        plt.bar(words, counts)
+        plt.title('単語頻出度 (Word Frequency)')
+        plt.xlabel('単語')
+        plt.ylabel('出現回数')
+        plt.xticks(rotation=45, ha='right')
+        plt.tight_layout()
+        plt.savefig('word_frequency_bar_chart.png')
+        plt.close()
+        print("棒グラフを 'word_frequency_bar_chart.png' として保存しました。")
+
+    print("-" * 50)
+
+
+    # --- 4. 共起行列 (Co-occurrence Matrix) ---
+
+    # 文書×単語の疎行列から共起数を求め、上位ペアだけを部分選択で取り出す
+    doc_term_matrix, vocabulary = build_document_term_matrix(processed_reviews)
+
+    top_n = 10
+    sorted_co_occurrence = top_cooccurring_pairs(doc_term_matrix, vocabulary, top_n)
+    print(f"✅ 共起分析 (共起頻度の高い上位{top_n}ペア):")
+    for (word1, word2), count in sorted_co_occurrence:
+        print(f"  {word1} - {word2}: {count}回")
+
+    if measure:
+        scope = f"前後{window}語以内" if window else "レビュー単位"
+        associations = top_associations(processed_reviews, measure, window=window, min_count=min_count, top_n=top_n)
+        print(f"✅ 関連度 ({measure}, {scope}, 共起{min_count}回以上) の高い上位{top_n}ペア:")
+        for (word1, word2), score, count in associations:
+            print(f"  {word1} - {word2}: {score:.3f} (共起{count}回)")
+
+    # TF-IDF行列の作成 (scikit-learn はこの段階で初めて読み込む)
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(use_idf=True)
+    tfidf_matrix = vectorizer.fit_transform(tokenized_reviews_str)
+    feature_names = vectorizer.get_feature_names_out()
+    # 全体を密行列にせず、確認に使う部分だけを取り出す
+    tfidf_df = pd.DataFrame(tfidf_matrix[:5, :5].toarray(), columns=feature_names[:5])
+    print("\n✅ TF-IDF行列の最初の5行と5列 (データの一部):")
+    print(tfidf_df)
+
+    print("\n✅ 各レビューのTF-IDF上位語 (最初の5件):")
+    for i in range(min(5, tfidf_matrix.shape[0])):
+        top_idx, top_scores = top_k_in_row(tfidf_matrix, i, 5)
+        print(f"  シナリオレビュー {i+1}: " + ", ".join(f"{feature_names[j]}({s:.3f})" for j, s in zip(top_idx, top_scores)))
+
+    if save_matrix:
+        save_tfidf_matrix('tfidf_matrix', tfidf_matrix, feature_names)
+        print("TF-IDF行列を疎行列のまま 'tfidf_matrix.npz' として保存しました。")
+    print("-" * 50)
+
+
+    # --- 5. 感情分析 (Sentiment Analysis) ---
+
+    results = []
+    for i, words in enumerate(processed_reviews):
+        sentiment, pos_score, neg_score = analyze_sentiment(words)
+        results.append({
+            'Review_ID': i + 1,
+            'Original_Review': game_reviews[i],
+            'Sentiment': sentiment,
+            'Positive_Score': pos_score,
+            'Negative_Score': neg_score
+        })
+
+    sentiment_df = pd.DataFrame(results)
+    print("✅ 感情分析結果 (最初の5件):")
+    print(sentiment_df.head())
+
+    # 感情極性の分布を可視化
+    sentiment_counts = sentiment_df['Sentiment'].value_counts()
+    if sentiment_counts.empty:
+        print("感情分析の対象データがありませんでした。")
+    elif charts:
+        plt = pyplot(CHART_RC)
+        plt.figure(figsize=(6, 6))
+        plt.pie(sentiment_counts, labels=sentiment_counts.index, autopct='%1.1f%%', startangle=90, colors=['#66b3ff','#ff9999','#99ff99'])
+        plt.title('レビュー感情極性の分布')
+        plt.tight_layout()
+        plt.savefig('sentiment_distribution_pie_chart.png')
+        plt.close()
+        print("円グラフを 'sentiment_distribution_pie_chart.png' として保存しました。")
+
+    print("-" * 50)
+
+    # 結果の統合とCSV書き出し
+    output_df = df.copy()
+    output_df = output_df.merge(sentiment_df, left_index=True, right_index=True, how='left')
+    output_df['Processed_Words'] = pd.Series([processed_reviews[i] if i < len(processed_reviews) else [] for i in range(len(output_df))])
+
+    output_filename = 'scenario_evaluation_results.csv'
+    output_df.to_csv(output_filename, index=False, encoding='utf-8')
+    print(f"✅ 分析結果を '{output_filename}' に書き出しました。")
+
+
+def review_pairs(words, window=STREAM_WINDOW):
+    """
+    1件のレビューで、前後 window 語以内に現れる2語の共起ペア (辞書順のタプル) と組の数。
+    ペアの数は語数 × window 以下に収まる。
+    """
+    pairs = Counter()
+    for i, word in enumerate(words):
+        for other in words[i + 1:i + 1 + window]:
+            pairs[(word, other) if word <= other else (other, word)] += 1
+    return pairs
+
+
+def stream_frequencies(path=file_path, top_n=20, capacity=STREAM_CAPACITY, window=STREAM_WINDOW):
+    """
+    CSVを少しずつ読みながら、単語頻出度と共起ペアの上位を固定メモリで推定する。
+    語彙やペアの数によらず、メモリは capacity と Count-Min の表の大きさで決まる。
+    共起ペアは前後 window 語以内のものを数える (レビュー全体の正確な共起数は通常のモードで求める)。
+    """
+    mecab = MeCab.Tagger()
+    words = SpaceSaving(capacity)
+    pairs = SpaceSaving(capacity)
+    word_sketch = CountMinSketch()
+    pair_sketch = CountMinSketch()
+
+    n_reviews = 0
+    for chunk in iter_csv_chunks(path, usecols=[TEXT_COLUMN]):
+        for review in chunk[TEXT_COLUMN]:
+            if not isinstance(review, str) or not review.strip():
+                continue
+            n_reviews += 1
+            tokens = preprocess_text(review.strip(), mecab)
+            token_counts = Counter(tokens)
+            for word, count in token_counts.items():
+                words.add(word, count)
+            word_sketch.add_many(list(token_counts), list(token_counts.values()))
+            review_pair_counts = review_pairs(tokens, window)
+            for pair, count in review_pair_counts.items():
+                pairs.add(pair, count)
+            pair_sketch.add_many(list(review_pair_counts), list(review_pair_counts.values()))
+
+    print(f"✅ ストリーミング集計: {n_reviews} 件のレビューを処理しました (追跡する要素数の上限 {capacity})。")
+    print(f"✅ 単語頻出度 (上位{top_n}単語, 真の回数は [下限, 上限] の範囲):")
+    for word, lower, upper in words.top(top_n, word_sketch):
+        print(f"  {word}: {upper}回 [{lower}, {upper}]")
+    print(f"✅ 共起分析 (前後{window}語以内, 上位{top_n}ペア, 真の回数は [下限, 上限] の範囲):")
+    for (word1, word2), lower, upper in pairs.top(top_n, pair_sketch):
+        print(f"  {word1} - {word2}: {upper}回 [{lower}, {upper}]")
+
+    # 表示していない要素も含めた誤差の上限
+    for name, summary, sketch in (("単語", words, word_sketch), ("ペア", pairs, pair_sketch)):
+        bound, probability = sketch.error_bound()
+        print(f"  {name}: 追跡外の要素は {summary.min_count()} 回以下 / "
+              f"SpaceSaving の過大分 ≤ {summary.error_bound():.1f} / "
+              f"Count-Min の過大分 ≤ {bound:.1f} (確率 {1 - probability:.3f} 以上)")
+    return words, pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='シナリオデータの単語頻出度・共起・TF-IDF・感情分析')
+    parser.add_argument('--save-matrix', action='store_true', help='TF-IDF行列を疎行列のまま保存する')
+    parser.add_argument('--no-charts', action='store_true', help='グラフを作らない (matplotlib を読み込まない)')
+    parser.add_argument('--headless', action='store_true', help='画面を使わずにグラフを描画してファイルに保存する')
+    parser.add_argument('--measure', choices=ASSOCIATION_MEASURES, help='共起ペアを関連度 (PMI など) でも順位付けする')
+    parser.add_argument('--window', type=int, default=None,
+                        help=f'関連度の共起を前後 N 語以内に限る (省略時はレビュー単位。--stream では省略時 {STREAM_WINDOW})')
+    parser.add_argument('--min-count', type=int, default=2, help='関連度を計算するペアの最小共起数')
+    parser.add_argument('--stream', action='store_true',
+                        help='CSVを少しずつ読み、単語頻出度と共起ペアの上位だけを固定メモリで推定する (他の分析は行わない)')
+    parser.add_argument('--capacity', type=int, default=STREAM_CAPACITY, help='--stream で追跡する単語・ペアの最大数')
+    args = parser.parse_args()
+    if args.stream:
+        stream_frequencies(capacity=args.capacity, window=args.window if args.window is not None else STREAM_WINDOW)
+    else:
+        main(charts=not args.no_charts, headless=args.headless, save_matrix=SAVE_TFIDF_MATRIX or args.save_matrix,
+             measure=args.measure, window=args.window, min_count=args.min_count)
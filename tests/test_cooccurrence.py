@@ -0,0 +1,133 @@
+import math
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from cooccurrence import (ASSOCIATION_MEASURES, association_scores, build_document_term_matrix,
+                          top_associations, top_cooccurring_pairs, window_cooccurrence_matrix)
+from token_corpus import TokenCorpus
+
+REVIEWS = [
+    ['冒険', '世界', '広い', '冒険', '楽しい'],
+    ['世界', '広い', '探索', '楽しい'],
+    ['バグ', '多い', '最悪'],
+    ['冒険', '楽しい', 'バグ'],
+    ['世界', '広い'],
+    ['最悪', 'バグ', '多い', 'バグ'],
+    [],
+]
+
+
+# 2×2 分割表: k11 = 10, f(x) = 20, f(y) = 30, N = 100 (k12 = 10, k21 = 20, k22 = 60)
+HAND_COMPUTED = {
+    'pmi': math.log(10 * 100 / (20 * 30)),
+    'npmi': math.log(10 * 100 / (20 * 30)) / -math.log(10 / 100),
+    'dice': 2 * 10 / (20 + 30),
+    'jaccard': 10 / (20 + 30 - 10),
+    # 期待値は 6, 14, 24, 56
+    'llr': 2 * (10 * math.log(10 / 6) + 10 * math.log(10 / 14) + 20 * math.log(20 / 24) + 60 * math.log(60 / 56)),
+}
+
+
+@pytest.mark.parametrize('measure', ASSOCIATION_MEASURES)
+def test_association_scores_on_hand_computed_table(measure):
+    assert association_scores(measure, [10], [20], [30], 100)[0] == pytest.approx(HAND_COMPUTED[measure])
+
+
+def test_llr_matches_g_test():
+    stats = pytest.importorskip('scipy.stats')
+    g, _, _, _ = stats.chi2_contingency([[10, 10], [20, 60]], correction=False, lambda_='log-likelihood')
+    assert association_scores('llr', [10], [20], [30], 100)[0] == pytest.approx(g)
+
+
+def test_npmi_is_one_when_always_cooccurring():
+    assert association_scores('npmi', [5], [5], [5], 5)[0] == 1.0
+
+
+def test_unknown_measure_is_rejected():
+    with pytest.raises(ValueError):
+        association_scores('chi2', [1], [1], [1], 1)
+    with pytest.raises(ValueError):
+        top_associations(REVIEWS, measure='chi2')
+
+
+def brute_force_window_pairs(reviews, window):
+    """距離 window 以内の位置の組を両方向に数える"""
+    counts = Counter()
+    for tokens in reviews:
+        for i in range(len(tokens)):
+            for j in range(i + 1, min(i + window + 1, len(tokens))):
+                counts[tokens[i], tokens[j]] += 1
+                counts[tokens[j], tokens[i]] += 1
+    return counts
+
+
+@pytest.mark.parametrize('window', [1, 2, 3])
+def test_window_matrix_matches_brute_force(window):
+    corpus = TokenCorpus.from_token_lists(REVIEWS)
+    matrix = window_cooccurrence_matrix(corpus, window).toarray()
+    terms = corpus.vocabulary
+    expected = np.zeros_like(matrix)
+    for (x, y), count in brute_force_window_pairs(REVIEWS, window).items():
+        expected[terms.index(x), terms.index(y)] = count
+    np.testing.assert_array_equal(matrix, expected)
+
+
+def brute_force_associations(reviews, measure, window, min_count):
+    """分割表の定義どおりに全ペアの関連度を計算する"""
+    if window is None:
+        sets = [set(tokens) for tokens in reviews]
+        pair_counts = Counter(pair for s in sets for pair in combinations(sorted(s), 2))
+        freqs = Counter(word for s in sets for word in s)
+        total = len(reviews)
+    else:
+        directed = brute_force_window_pairs(reviews, window)
+        pair_counts = Counter({(x, y): c for (x, y), c in directed.items() if x < y})
+        freqs = Counter()
+        for (x, y), c in directed.items():
+            freqs[x] += c
+        total = sum(directed.values())
+    return {pair: (association_scores(measure, [k], [freqs[pair[0]]], [freqs[pair[1]]], total)[0], k)
+            for pair, k in pair_counts.items() if k >= min_count}
+
+
+@pytest.mark.parametrize('measure', ASSOCIATION_MEASURES)
+@pytest.mark.parametrize('window', [None, 2])
+def test_top_associations_match_brute_force(measure, window):
+    expected = brute_force_associations(REVIEWS, measure, window, min_count=1)
+    # ブロックをまたぐ場合も同じ結果になる
+    for block_size in (1, 3, 1000):
+        result = top_associations(REVIEWS, measure=measure, window=window, min_count=1,
+                                  top_n=len(expected), block_size=block_size)
+        assert {pair: count for pair, score, count in result} == {p: k for p, (s, k) in expected.items()}
+        for pair, score, count in result:
+            assert score == pytest.approx(expected[pair][0])
+        scores = [score for pair, score, count in result]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_min_count_and_per_word():
+    result = top_associations(REVIEWS, measure='dice', min_count=2, top_n=1, per_word=True)
+    expected = brute_force_associations(REVIEWS, 'dice', None, min_count=2)
+    assert all(count >= 2 for partners in result.values() for _, _, count in partners)
+    for word, partners in result.items():
+        best = max(score for pair, (score, k) in expected.items() if word in pair)
+        assert len(partners) == 1 and partners[0][1] == pytest.approx(best)
+
+
+def test_top_cooccurring_pairs_match_double_loop():
+    # 従来の sv.py と同じく、レビュー内の位置の全組を数える (同じ語どうしの組も含む)
+    expected = Counter()
+    for tokens in REVIEWS:
+        for i in range(len(tokens)):
+            for j in range(i + 1, len(tokens)):
+                expected[tuple(sorted((tokens[i], tokens[j])))] += 1
+
+    matrix, terms = build_document_term_matrix(REVIEWS)
+    for block_size in (1, 4, 2048):
+        pairs = top_cooccurring_pairs(matrix, terms, top_n=len(expected), block_size=block_size)
+        assert dict(pairs) == dict(expected)
+        counts = [count for _, count in pairs]
+        assert counts == sorted(counts, reverse=True)
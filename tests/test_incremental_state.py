@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from incremental_state import IncrementalState, fingerprint
+
+
+def test_fingerprint_ignores_set_order_but_not_contents():
+    assert fingerprint({'ア', 'イ', 'ウ'}, ('名詞',)) == fingerprint({'ウ', 'イ', 'ア'}, ('名詞',))
+    assert fingerprint({'ア', 'イ'}, ('名詞',)) != fingerprint({'ア', 'イ', 'ウ'}, ('名詞',))
+    assert fingerprint({'ア'}, ('名詞',)) != fingerprint({'ア'}, ('名詞', '動詞'))
+
+
+def make_state(tmp_path, config_fingerprint='fp'):
+    return IncrementalState('test', config_fingerprint, state_dir=str(tmp_path))
+
+
+def test_appended_rows_start_after_the_watermark(tmp_path):
+    state = make_state(tmp_path)
+    state.update('A', ['一', '二'], ['text'], {'reviews': 2})
+    state.save()
+
+    state = make_state(tmp_path)
+    assert state.start_row('A', ['一', '二', '三'], ['text']) == 2
+    assert state.aggregates('A') == {'reviews': 2}
+
+
+@pytest.mark.parametrize('texts, columns', [
+    (['一', '変更', '三'], ['text']),   # 処理済みの行が変わった
+    (['一'], ['text']),                 # 行が減った
+    (['一', '二', '三'], ['text', 'x']),  # 列構成が変わった
+])
+def test_changed_prefix_restarts_from_zero(tmp_path, texts, columns):
+    state = make_state(tmp_path)
+    state.update('A', ['一', '二'], ['text'], {'reviews': 2})
+    assert state.start_row('A', texts, columns) == 0
+    assert state.aggregates('A') is None
+
+
+def test_changed_fingerprint_discards_saved_titles(tmp_path):
+    state = make_state(tmp_path)
+    state.update('A', ['一'], ['text'], {'reviews': 1})
+    state.save()
+
+    assert make_state(tmp_path, 'fp').aggregates('A') == {'reviews': 1}
+    assert make_state(tmp_path, 'other').aggregates('A') is None
+
+
+def test_restore_applies_entries_from_workers(tmp_path):
+    worker = make_state(tmp_path)
+    worker.update('A', ['一'], ['text'], {'reviews': 1})
+    parent = make_state(tmp_path)
+    parent.restore('A', worker.entry('A'))
+    assert parent.start_row('A', ['一', '二'], ['text']) == 1
+    parent.restore('A', None)
+    assert parent.entry('A') is None
+
+
+REVIEWS = [
+    '主人公の成長に感動した', 'バグが多くて最悪', 'キャラクターが可愛い', '展開がつまらない期待外れ',
+    '冒険の世界観が薄い', '主人公の成長に感動した', 'とても面白い最高のストーリーだった', '普通',
+    'バグが多くて最悪!', '評価できない', 'キャラクターが可愛い', '期待外れ',
+]
+
+
+@pytest.mark.parametrize('dedup_threshold', [None, 0.8])
+def test_sentiment_incremental_run_matches_full_run(tmp_path, monkeypatch, capsys, dedup_threshold):
+    pytest.importorskip('MeCab')
+    import 感情
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'results').mkdir()
+    analyzer = 感情.SentimentAnalyzer()
+    config = {'title': 'T', 'path': str(tmp_path / 'reviews.csv'), 'review_col': 'text'}
+
+    def run(reviews, state):
+        pd.DataFrame({'text': reviews}).to_csv(config['path'], index=False)
+        counts, entry = 感情.analyze_title(config, state, analyzer=analyzer, dedup_threshold=dedup_threshold)
+        state.restore('T', entry)
+        return counts, state.aggregates('T')
+
+    # 前半を処理してから後半を追記した場合と、全行を一度に処理した場合
+    details_path = tmp_path / 'results' / 'T_sentiment_details.csv'
+    incremental = IncrementalState('sentiment', 'fp', state_dir=str(tmp_path / 'inc'))
+    run(REVIEWS[:6], incremental)
+    capsys.readouterr()
+    counts, aggregates = run(REVIEWS, incremental)
+    assert '処理済み 6 行をスキップ' in capsys.readouterr().out
+    details = pd.read_csv(details_path, encoding='utf-8-sig')
+
+    details_path.unlink()
+    full_counts, full_aggregates = run(REVIEWS, IncrementalState('sentiment', 'fp', state_dir=str(tmp_path / 'full')))
+    assert aggregates == full_aggregates
+    assert counts.to_dict() == full_counts.to_dict()
+    pd.testing.assert_frame_equal(details, pd.read_csv(details_path, encoding='utf-8-sig'))
+    if dedup_threshold is not None:
+        # 同じ文面のレビューは1件として数える
+        assert full_aggregates['reviews'] < len(REVIEWS)
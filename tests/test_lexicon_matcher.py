@@ -0,0 +1,56 @@
+from lexicon_matcher import LexiconMatcher
+
+
+def stream_of(*morphemes):
+    """形態素ごとの候補集合の列 (None は区切り)"""
+    return [None if m is None else {m} for m in morphemes]
+
+
+def labels(matches):
+    return [(start, end, label) for start, end, label, word in matches]
+
+
+def test_single_and_multi_morpheme_words():
+    matcher = LexiconMatcher([('Positive', {'カンドウ'}), ('Negative', {'ヒョウカデキナイ'})])
+    matches = matcher.find(stream_of('カンドウ', 'シタ', 'ヒョウカ', 'デキナイ'))
+    assert labels(matches) == [(0, 1, 'Positive'), (2, 4, 'Negative')]
+
+
+def test_match_must_start_at_a_morpheme_boundary():
+    matcher = LexiconMatcher([('Positive', {'イイ'})])
+    assert matcher.find(stream_of('カワイイ')) == []
+    assert labels(matcher.find(stream_of('カワ', 'イイ'))) == [(1, 2, 'Positive')]
+
+
+def test_match_must_end_at_a_morpheme_boundary():
+    matcher = LexiconMatcher([('Positive', {'カワイ'}), ('Negative', {'ヒョウカデ'})])
+    assert matcher.find(stream_of('カワイイ')) == []
+    assert matcher.find(stream_of('ヒョウカ', 'デキナイ')) == []
+
+
+def test_separator_breaks_multi_morpheme_match():
+    matcher = LexiconMatcher([('Negative', {'キタイハズレ'})])
+    assert matcher.find(stream_of('キタイ', None, 'ハズレ')) == []
+    assert matcher.find([{'キタイ'}, set(), {'ハズレ'}]) == []
+
+
+def test_leftmost_longest_and_label_priority():
+    matcher = LexiconMatcher([('Positive', {'キタイ', 'サイコウ'}), ('Negative', {'キタイハズレ', 'サイコウ'})])
+    # 長い一致が優先され、重なる短い一致は数えない
+    assert labels(matcher.find(stream_of('キタイ', 'ハズレ'))) == [(0, 2, 'Negative')]
+    # 同じ語が両方の辞書にある場合は先に登録したラベル
+    assert labels(matcher.find(stream_of('サイコウ'))) == [(0, 1, 'Positive')]
+
+
+def test_standalone_only_limits_single_morpheme_matches():
+    matcher = LexiconMatcher([('Positive', {'スキ', 'スキダ'})])
+    assert matcher.find(stream_of('スキ'), standalone=[False]) == []
+    # 複数形態素の一致は、先頭の形態素が standalone でなくても数える
+    assert labels(matcher.find(stream_of('スキ', 'ダ'), standalone=[False, False])) == [(0, 2, 'Positive')]
+
+
+def test_any_alternative_of_a_morpheme_can_match():
+    matcher = LexiconMatcher([('Positive', {'タノシイ'})])
+    # 表層形・原形・読みのどれかが辞書語に一致すればよい
+    stream = [{'楽しかっ', '楽しい', 'タノシイ'}]
+    assert matcher.find(stream) == [(0, 1, 'Positive', 'タノシイ')]
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from near_duplicates import (NearDuplicateIndex, appended_representatives, choose_bands, collapse_duplicates,
+                             find_near_duplicates, representative_mask)
+
+HIRAGANA = [chr(c) for c in range(ord('ぁ'), ord('ゖ'))]
+
+
+def random_texts(n, length, seed):
+    rng = np.random.default_rng(seed)
+    return [''.join(rng.choice(HIRAGANA, length)) for _ in range(n)]
+
+
+def edit(text, n_edits, rng):
+    """ランダムな位置の文字を n_edits 個置き換える"""
+    chars = list(text)
+    for pos in rng.choice(len(chars), n_edits, replace=False):
+        chars[pos] = 'ア'
+    return ''.join(chars)
+
+
+def shingle_jaccard(a, b, k=5):
+    sa = {a[i:i + k] for i in range(len(a) - k + 1)}
+    sb = {b[i:i + k] for i in range(len(b) - k + 1)}
+    return len(sa & sb) / len(sa | sb)
+
+
+@pytest.mark.parametrize('num_perm, threshold', [(64, 0.8), (64, 0.5), (128, 0.9), (60, 0.7)])
+def test_choose_bands_splits_the_signature(num_perm, threshold):
+    bands, rows = choose_bands(num_perm, threshold)
+    assert bands * rows == num_perm
+
+
+def test_signature_agreement_estimates_jaccard():
+    index = NearDuplicateIndex()
+    rng = np.random.default_rng(1)
+    errors = []
+    for base in random_texts(40, 120, seed=2):
+        other = edit(base, int(rng.integers(1, 15)), rng)
+        estimate = np.mean(index.signature(base) == index.signature(other))
+        errors.append(estimate - shingle_jaccard(base, other))
+    # 署名の一致率は Jaccard 係数の不偏推定 (64 個の平均なので1組の誤差は ±0.1 程度)
+    assert abs(np.mean(errors)) < 0.03
+    assert np.mean(np.abs(errors)) < 0.1
+
+
+def test_lsh_recall_and_false_positives():
+    rng = np.random.default_rng(3)
+    originals = random_texts(300, 200, seed=4)
+    copies = [edit(text, 2, rng) for text in originals]
+    assert min(shingle_jaccard(a, b) for a, b in zip(originals, copies)) >= 0.9
+
+    representatives = find_near_duplicates(originals + copies)
+    n = len(originals)
+    # 無関係なレビューどうしは重複にしない
+    np.testing.assert_array_equal(representatives[:n], np.arange(n))
+    # Jaccard 係数 0.9 以上の複製はほぼすべて元のレビューに結び付く
+    recall = np.mean(representatives[n:] == np.arange(n))
+    assert recall >= 0.95
+
+
+def test_exact_duplicates_ignore_whitespace_and_non_strings():
+    texts = ['主人公の成長に感動した', ' 主人公の 成長に感動した\n', None, '', 'バグが多くて最悪']
+    np.testing.assert_array_equal(find_near_duplicates(texts), [0, 0, 2, 3, 4])
+
+
+def test_representative_mask_with_seen_matches_one_shot():
+    rng = np.random.default_rng(5)
+    originals = random_texts(50, 150, seed=6)
+    texts = originals + [edit(t, 2, rng) for t in originals[::3]] + random_texts(20, 150, seed=7)
+    rng.shuffle(texts)
+    full = representative_mask(texts)
+    # 前半を処理済みとして後半だけを判定しても、一度に判定した結果と同じになる
+    half = len(texts) // 2
+    np.testing.assert_array_equal(representative_mask(texts[half:], seen=texts[:half]), full[half:])
+
+
+def test_collapse_duplicates_inverse_restores_all_rows():
+    texts = ['同じ文面のレビュー', '別のレビューです', '同じ文面のレビュー', '別のレビューです', '三つ目']
+    unique_positions, inverse = collapse_duplicates(texts)
+    np.testing.assert_array_equal(unique_positions, [0, 1, 4])
+    assert [texts[unique_positions[i]] for i in inverse] == texts
+
+
+def test_appended_representatives_point_into_processed_rows():
+    texts = ['同じ文面のレビュー', '別のレビューです', '三つ目', '同じ文面のレビュー', '新しいレビュー', '三つ目']
+    # 追記分 (3番目以降) の代表は、処理済みの行のこともある
+    np.testing.assert_array_equal(appended_representatives(texts, 3), [0, 4, 2])
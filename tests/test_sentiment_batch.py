@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+MeCab = pytest.importorskip('MeCab')
+
+import 感情
+from text_memo import TextMemo
+from token_cache import TokenCache
+from token_table import TokenTable
+
+REVIEWS = [
+    '主人公の成長に感動した', 'バグが多くて最悪', '展開がつまらない期待外れ', 'とても面白い最高のストーリーだった',
+    '評価できない', '普通', None, '', '主人公の成長に感動したがバグが多くて最悪', 'バグが多くて最悪',
+    'キャラクターが可愛い', '冒険の世界観が薄い', 'とても面白い最高のストーリーだった',
+]
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    # 既定の形態素解析キャッシュ (cache/) をリポジトリに作らない
+    monkeypatch.chdir(tmp_path)
+    analyzer = 感情.SentimentAnalyzer()
+    analyzer.token_cache = TokenCache(':memory:')
+    return analyzer
+
+
+def per_review(analyzer):
+    """1件ずつ classify_review で分類した結果 (メモを使わない)"""
+    analyzer.text_memo = TextMemo(max_entries=0)
+    results = [analyzer.classify_review(text) for text in REVIEWS]
+    analyzer.text_memo = TextMemo()
+    return results
+
+
+def as_rows(pos_counts, neg_counts, codes):
+    return [(int(p), int(n), 感情.SENTIMENT_LABELS[c]) for p, n, c in zip(pos_counts, neg_counts, codes)]
+
+
+@pytest.mark.parametrize('batch_size', [1, 4, 10000])
+def test_classify_batch_matches_classify_review(analyzer, batch_size):
+    expected = per_review(analyzer)
+    assert any(label != 'Neutral' for _, _, label in expected)
+    assert as_rows(*analyzer.classify_batch(REVIEWS, batch_size=batch_size)) == expected
+    # 長さの分からないイテラブルでも同じ
+    assert as_rows(*analyzer.classify_batch(iter(REVIEWS), batch_size=batch_size)) == expected
+
+
+def test_classify_batch_from_token_table_matches(analyzer):
+    expected = per_review(analyzer)
+    morphemes = [analyzer.token_cache.morphemes(analyzer.tagger, t) if isinstance(t, str) else None for t in REVIEWS]
+    table = TokenTable.from_morphemes(morphemes)
+    result = analyzer.classify_batch(REVIEWS, batch_size=5, table=table, row_ids=list(range(len(REVIEWS))))
+    assert as_rows(*result) == expected
+    # 同じ文面は1回だけ照合する
+    assert analyzer.text_memo.misses == len({t for t in REVIEWS if isinstance(t, str)})
+
+
+def test_analyze_dataset_adds_columns(analyzer):
+    expected = per_review(analyzer)
+    df = pd.DataFrame({'text': REVIEWS, 'other': np.arange(len(REVIEWS))})
+    result = analyzer.analyze_dataset(df, 'text')
+    assert list(df.columns) == ['text', 'other']
+    assert list(zip(result['Pos_Count'], result['Neg_Count'], result['Sentiment'])) == expected
+
+
+def test_analyze_title_dedup_writes_every_row(analyzer, tmp_path):
+    from incremental_state import IncrementalState
+
+    texts = ['主人公の成長に感動した', 'バグが多くて最悪', '主人公の成長に感動した', 'キャラクターが可愛い',
+             'バグが多くて最悪']
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'レビュー': texts}).to_csv(path, index=False)
+    (tmp_path / 'results').mkdir()
+    config = {'title': 'T', 'path': str(path), 'review_col': 'レビュー'}
+    state = IncrementalState('sentiment', 'x', state_dir=str(tmp_path / 'state'))
+    counts, _ = 感情.analyze_title(config, state, analyzer=analyzer, dedup_threshold=0.9)
+
+    details = pd.read_csv(tmp_path / 'results' / 'T_sentiment_details.csv', encoding='utf-8-sig')
+    # 詳細CSVには全行が代表のラベル付きで残り、集計ではグループを1件として数える
+    assert details['レビュー'].tolist() == texts
+    assert details['Duplicate_Of'].isna().tolist() == [True, True, False, True, False]
+    assert details['Duplicate_Of'].dropna().astype(int).tolist() == [0, 1]
+    assert details['Sentiment'][2] == details['Sentiment'][0]
+    assert details['Sentiment'][4] == details['Sentiment'][1]
+    assert int(counts.sum()) == 3
@@ -0,0 +1,110 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from sketches import CountMinSketch, SpaceSaving
+
+
+def zipf_stream(n_items=2000, n_distinct=500, seed=0):
+    """頻度の偏ったストリーム (上位の語ほど多く現れる)"""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.3, n_items), n_distinct)
+    return [f'w{rank}' for rank in ranks]
+
+
+@pytest.mark.parametrize('capacity', [10, 50, 200])
+def test_space_saving_bounds_contain_true_counts(capacity):
+    stream = zipf_stream()
+    truth = Counter(stream)
+    sketch = SpaceSaving(capacity)
+    for item in stream:
+        sketch.add(item)
+
+    assert sketch.total == len(stream)
+    assert len(sketch.counts) <= capacity
+    for item, lower, upper in sketch.top(capacity):
+        assert lower <= truth[item] <= upper
+        assert upper - truth[item] <= sketch.error_bound()
+    # 追跡していない要素の真の回数は min_count 以下
+    for item, count in truth.items():
+        if item not in sketch.counts:
+            assert count <= sketch.min_count()
+    # 総数 / capacity を超える要素は必ず追跡されている
+    for item, count in truth.items():
+        if count > sketch.error_bound():
+            assert item in sketch.counts
+
+
+def test_space_saving_is_exact_below_capacity():
+    stream = zipf_stream(n_items=300, n_distinct=40)
+    sketch = SpaceSaving(capacity=100)
+    for item in stream:
+        sketch.add(item)
+    truth = Counter(stream)
+    assert sketch.min_count() == 0
+    assert {item: (lower, upper) for item, lower, upper in sketch.top(100)} == \
+        {item: (count, count) for item, count in truth.items()}
+
+
+def test_space_saving_weighted_add():
+    sketch = SpaceSaving(capacity=2)
+    for item, weight in [('a', 5), ('b', 3), ('c', 2), ('a', 1)]:
+        sketch.add(item, weight)
+    assert sketch.total == 11
+    assert sketch.top(1) == [('a', 6, 6)]
+    # c は b (3) を追い出して誤差 3 を引き継ぐ
+    assert sketch.top(2)[1] == ('c', 2, 5)
+
+
+def test_count_min_never_underestimates_and_respects_bound():
+    stream = zipf_stream(n_items=5000, n_distinct=2000)
+    truth = Counter(stream)
+    sketch = CountMinSketch(width=256, depth=4)
+    sketch.add_many(stream)
+
+    bound, probability = sketch.error_bound()
+    assert sketch.total == len(stream)
+    over = [sketch.estimate(item) - count for item, count in truth.items()]
+    assert min(over) >= 0
+    # 過大分が上限を超える要素の割合は e^-depth 程度 (余裕を見て2倍まで許す)
+    assert np.mean([o > bound for o in over]) <= 2 * probability
+
+
+def test_count_min_add_and_add_many_agree_for_pairs():
+    pairs = [('冒険', '楽しい'), ('バグ', '最悪'), ('冒険', '楽しい')]
+    one_by_one = CountMinSketch(width=64, depth=3)
+    for pair in pairs:
+        one_by_one.add(pair)
+    batched = CountMinSketch(width=64, depth=3)
+    batched.add_many(list(Counter(pairs)), list(Counter(pairs).values()))
+    np.testing.assert_array_equal(one_by_one.table, batched.table)
+    assert batched.estimate(('冒険', '楽しい')) >= 2
+
+
+def test_top_uses_count_min_as_upper_bound():
+    stream = zipf_stream()
+    truth = Counter(stream)
+    words = SpaceSaving(capacity=20)
+    count_min = CountMinSketch(width=1024, depth=4)
+    for item in stream:
+        words.add(item)
+    count_min.add_many(stream)
+    for item, lower, upper in words.top(20, count_min):
+        assert lower <= truth[item] <= upper <= words.counts[item]
+
+
+def test_review_pairs_are_windowed():
+    pytest.importorskip('MeCab')
+    import sv
+
+    words = ['冒険', '世界', '広い', '冒険', '楽しい', 'バグ']
+    for window in (1, 2, 10):
+        expected = Counter()
+        for i in range(len(words)):
+            for j in range(i + 1, min(i + 1 + window, len(words))):
+                expected[tuple(sorted((words[i], words[j])))] += 1
+        pairs = sv.review_pairs(words, window)
+        assert pairs == expected
+        assert sum(pairs.values()) <= len(words) * window
+    assert sv.review_pairs(words) == sv.review_pairs(words, sv.STREAM_WINDOW)
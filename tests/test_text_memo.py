@@ -0,0 +1,93 @@
+import pytest
+
+from text_memo import TextMemo, normalize_text
+
+
+def test_get_computes_each_normalized_text_once():
+    calls = []
+
+    def compute(text):
+        calls.append(text)
+        return len(text)
+
+    memo = TextMemo()
+    assert memo.get(' 冒険\n', compute) == 2
+    assert memo.get('冒険', compute) == 2
+    assert calls == ['冒険']
+    assert memo.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'entries': 1}
+
+
+def test_full_width_space_is_part_of_the_key():
+    # MeCab は全角空白を形態素にするので、正規化では除かない
+    assert normalize_text('　冒険 ') == '　冒険'
+
+
+def test_get_many_passes_first_positions_of_unseen_texts():
+    batches = []
+
+    def compute_many(positions):
+        batches.append(positions)
+        return [texts[p].upper() for p in positions]
+
+    memo = TextMemo()
+    memo.get('b', lambda text: 'memo')
+    texts = ['a', 'b', ' a', 'c', 'c\n']
+    assert memo.get_many(texts, compute_many) == ['A', 'memo', 'A', 'C', 'C']
+    assert batches == [[0, 3]]
+    # バッチ内の2回目以降の同じ文面はヒットとして数える
+    assert (memo.hits, memo.misses) == (3, 3)
+
+    memo.reset_stats()
+    assert memo.get_many(['c', 'a'], compute_many) == ['C', 'A']
+    assert batches == [[0, 3]]
+    assert '2 件のうち 0 件を解析しました' in memo.summary()
+
+
+def test_lru_eviction_and_disabled_memo():
+    memo = TextMemo(max_entries=2)
+    for text in ('a', 'b', 'a', 'c'):
+        memo.get(text, str.upper)
+    assert memo.stats()['entries'] == 2
+    memo.get('b', str.upper)
+    assert memo.misses == 4   # b は最も長く使われていなかったので捨てられている
+
+    disabled = TextMemo(max_entries=0)
+    assert disabled.get_many(['x', 'x'], lambda positions: ['X'] * len(positions)) == ['X', 'X']
+    assert disabled.stats()['entries'] == 0
+
+
+REVIEWS = [
+    '主人公の成長に感動した', 'バグが多くて最悪', '主人公の成長に感動した', ' バグが多くて最悪\n',
+    'キャラクターが可愛い', 'a', '', '冒険の世界観が薄い', 'キャラクターが可愛い',
+]
+
+
+@pytest.mark.parametrize('module_name', ['TFIDF', '共起分析', '感情分析'])
+def test_batch_preprocess_matches_per_text_path(tmp_path, monkeypatch, module_name):
+    MeCab = pytest.importorskip('MeCab')
+    import importlib
+    from token_cache import TokenCache
+    from token_table import TokenTable
+
+    module = importlib.import_module(module_name)
+    tagger = MeCab.Tagger()
+    monkeypatch.setattr(module, 'token_cache', TokenCache(':memory:'))
+
+    monkeypatch.setattr(module, 'text_memo', TextMemo(max_entries=0))
+    expected = [module.preprocess_text(text, tagger) for text in REVIEWS]
+
+    def as_lists(processed):
+        if hasattr(processed, 'vocabulary'):
+            return [[processed.vocabulary[i] for i in processed.ids(k)] for k in range(len(processed))]
+        return processed
+
+    monkeypatch.setattr(module, 'text_memo', TextMemo())
+    assert as_lists(module.preprocess_reviews(REVIEWS, tagger)) == expected
+    # 同じ文面は1回だけ解析する
+    assert module.text_memo.misses == len({t.strip(' \t\n') for t in REVIEWS if len(t) >= 2})
+
+    table = TokenTable.from_morphemes([module.get_cache().morphemes(tagger, text) for text in REVIEWS])
+    rows = [i for i, text in enumerate(REVIEWS) if len(text) >= 2]
+    monkeypatch.setattr(module, 'text_memo', TextMemo())
+    processed = as_lists(module.preprocess_table(table, rows, [REVIEWS[i] for i in rows]))
+    assert processed == [expected[i] for i in rows]
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('MeCab')
+
+import TFIDF
+
+
+@pytest.fixture
+def reviews_csv(tmp_path):
+    path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'text': ['冒険が楽しい', 'バグが多い'], 'version': [1, 2]}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_load_documents_reads_optional_filters(tmp_path, reviews_csv):
+    config_path = tmp_path / 'documents.csv'
+    pd.DataFrame({
+        'title': ['v1', 'v2', 'all'],
+        'path': [reviews_csv] * 3,
+        'review_col': ['text'] * 3,
+        'filter_col': ['version', 'version', ''],
+        'filter_value': ['1', '2', ''],
+    }).to_csv(config_path, index=False)
+
+    documents = TFIDF.load_documents(str(config_path))
+    assert documents == [
+        {'title': 'v1', 'path': reviews_csv, 'review_col': 'text', 'filter_col': 'version', 'filter_value': '1'},
+        {'title': 'v2', 'path': reviews_csv, 'review_col': 'text', 'filter_col': 'version', 'filter_value': '2'},
+        {'title': 'all', 'path': reviews_csv, 'review_col': 'text'},
+    ]
+    # 絞り込みが違えば別の入力、絞り込みなしは従来と同じ signature
+    signatures = [TFIDF.input_signature(config) for config in documents]
+    assert len(set(signatures)) == 3
+    assert signatures[2] == TFIDF.input_signature({'title': 'x', 'path': reviews_csv, 'review_col': 'text'})
+
+
+def test_documents_are_validated(tmp_path, reviews_csv):
+    config_path = tmp_path / 'documents.csv'
+    pd.DataFrame({'title': ['a'], 'path': [reviews_csv]}).to_csv(config_path, index=False)
+    with pytest.raises(ValueError, match='review_col'):
+        TFIDF.load_documents(str(config_path))
+    with pytest.raises(ValueError, match='重複'):
+        TFIDF.documents_from_paths([reviews_csv, reviews_csv], 'text')
+    with pytest.raises(ValueError, match='見つかりません'):
+        TFIDF.documents_from_paths([str(tmp_path / 'missing.csv')], 'text')
+    assert TFIDF.documents_from_paths([reviews_csv], 'text') == [
+        {'title': 'reviews', 'path': reviews_csv, 'review_col': 'text'}]
+
+
+@pytest.mark.parametrize('title', ['../outside', 'a/b', 'a\\b', 'a:b', 'what?', 'CON', 'nul.txt', 'end.', ' x', ''])
+def test_titles_unusable_as_file_names_are_rejected(reviews_csv, title):
+    documents = [{'title': title, 'path': reviews_csv, 'review_col': 'text'}]
+    with pytest.raises(ValueError, match='ファイル名に使えません'):
+        TFIDF.check_documents(documents, 'documents.csv')
+
+
+def test_ordinary_titles_are_accepted(reviews_csv):
+    documents = [{'title': title, 'path': reviews_csv, 'review_col': 'text'} for title in ('SV', '剣盾 v1.2', 'sm_usum')]
+    assert TFIDF.check_documents(documents, 'documents.csv') == documents
+
+
+def test_missing_csv_counts_as_empty_title(tmp_path):
+    config = {'title': 'none', 'path': str(tmp_path / 'missing.csv'), 'review_col': 'text'}
+    assert not TFIDF.count_title_ngrams(config)
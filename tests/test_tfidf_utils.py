@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from tfidf_utils import TfidfStatistics, cosine_similarity_blocks, ngram_counts, top_k_in_row, top_k_neighbors
+from token_corpus import TokenCorpus
+
+# 作品ごとの前処理済みレビュー (1文字語・大文字・記号を含む語は TfidfVectorizer の解析器で変わる)
+TITLES = {
+    'A': [['主人公', '成長', '感動'], ['キャラクター', '可愛い', 'Game'], ['主人公', '感動']],
+    'B': [['バグ', '多い', '最悪'], ['展開', 'つまらない', '期待', '外れ'], ['主人公', 'A', 'ab-cd']],
+    'C': [['世界観', '薄い'], [], ['冒険', '世界観', '楽しい', '冒険']],
+    'D': [['普通']],
+}
+
+
+def document(reviews):
+    """TFIDF.py の既定の実装と同じく、作品の全レビューの単語を空白区切りで1つの文書にする"""
+    return ' '.join(word for review in reviews for word in review)
+
+
+def statistics(titles, state_dir):
+    stats = TfidfStatistics(state_dir=state_dir)
+    for title, reviews in titles.items():
+        stats.set_title(title, ngram_counts(TokenCorpus.from_token_lists(reviews)), signature=title)
+    return stats
+
+
+def assert_matches_sklearn(stats, titles):
+    names = list(titles)
+    vectorizer = TfidfVectorizer(min_df=0.0, ngram_range=(1, 2))
+    expected = vectorizer.fit_transform([document(titles[name]) for name in names])
+    tfidfs, terms = stats.tfidf_matrix(names)
+    assert list(terms) == list(vectorizer.get_feature_names_out())
+    np.testing.assert_allclose(tfidfs.toarray(), expected.toarray(), atol=1e-12)
+
+
+@pytest.mark.parametrize('title', list(TITLES))
+def test_ngram_counts_match_count_vectorizer(title):
+    vectorizer = CountVectorizer(ngram_range=(1, 2))
+    row = vectorizer.fit_transform([document(TITLES[title])]).toarray()[0]
+    expected = {term: int(count) for term, count in zip(vectorizer.get_feature_names_out(), row)}
+    assert dict(ngram_counts(TokenCorpus.from_token_lists(TITLES[title]))) == expected
+
+
+def test_tfidf_matrix_matches_tfidf_vectorizer(tmp_path):
+    assert_matches_sklearn(statistics(TITLES, str(tmp_path)), TITLES)
+
+
+def test_updating_and_removing_titles_matches_recomputing(tmp_path):
+    stats = statistics(TITLES, str(tmp_path))
+    stats.save()
+
+    # 保存した統計を読み込み、1作品を差し替えて1作品を外す
+    changed = dict(TITLES)
+    changed['B'] = [['バグ', '少ない'], ['冒険', '楽しい']]
+    del changed['D']
+    stats = TfidfStatistics(state_dir=str(tmp_path))
+    assert stats.is_current('A', 'A') and not stats.is_current('A', 'other')
+    stats.set_title('B', ngram_counts(TokenCorpus.from_token_lists(changed['B'])), signature='B2')
+    stats.retain(list(changed))
+    assert_matches_sklearn(stats, changed)
+    assert_matches_sklearn(statistics(changed, str(tmp_path / 'fresh')), changed)
+
+
+def test_top_k_in_row_is_sorted_partial_selection():
+    rng = np.random.default_rng(0)
+    dense = rng.random((3, 20)) * (rng.random((3, 20)) > 0.5)
+    matrix = sparse.csr_matrix(dense)
+    for i in range(3):
+        idx, values = top_k_in_row(matrix, i, 5)
+        expected = np.sort(dense[i][dense[i] > 0])[::-1][:5]
+        np.testing.assert_allclose(values, expected)
+        np.testing.assert_allclose(dense[i][idx], values)
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 3, 512])
+def test_similarity_blocks_and_neighbors(tmp_path, block_size):
+    names = list(TITLES)
+    tfidfs, _ = statistics(TITLES, str(tmp_path)).tfidf_matrix(names)
+    expected = cosine_similarity(tfidfs)
+
+    starts = []
+    for start, block in cosine_similarity_blocks(tfidfs, block_size):
+        starts.append(start)
+        np.testing.assert_allclose(block, expected[start:start + len(block)], atol=1e-12)
+
+        idx, values = top_k_neighbors(block, start, 2)
+        for row in range(len(block)):
+            i = start + row
+            # 自分自身を除いた類似度の上位2件が降順に並ぶ
+            others = np.delete(expected[i], i)
+            assert i not in idx[row]
+            np.testing.assert_allclose(values[row], np.sort(others)[::-1][:2], atol=1e-12)
+            assert np.all(np.diff(values[row]) <= 0)
+    assert starts == list(range(0, len(names), block_size))
@@ -0,0 +1,53 @@
+from token_cache import TokenCache
+
+MORPHEMES = [('冒険', '名詞', '冒険', 'ボウケン'), ('が', '助詞', 'が', 'ガ')]
+
+
+def test_hits_and_puts_do_not_hold_the_write_lock(tmp_path):
+    path = str(tmp_path / 'tokens.sqlite3')
+    cache = TokenCache(path)
+    cache.put('a', MORPHEMES)
+    # flush 前でも自分の保存したものは読める
+    assert cache.get('a') == MORPHEMES
+    assert not cache.conn.in_transaction
+    cache.flush()
+
+    assert cache.get('a') == MORPHEMES
+    assert cache.get('b') is None
+    assert not cache.conn.in_transaction
+    # 別の接続からすぐに書き込める (読み出し側が書き込みロックを持っていない)
+    other = TokenCache(path)
+    other.put('b', MORPHEMES)
+    other.close()
+    assert cache.get('b') == MORPHEMES
+    cache.close()
+
+
+def test_flush_records_last_used(tmp_path):
+    path = str(tmp_path / 'tokens.sqlite3')
+    cache = TokenCache(path)
+    cache.put('a', MORPHEMES)
+    cache.flush()
+    before = cache.conn.execute("SELECT last_used FROM tokens WHERE key = 'a'").fetchone()[0]
+    cache.get('a')
+    cache.flush()
+    after = cache.conn.execute("SELECT last_used FROM tokens WHERE key = 'a'").fetchone()[0]
+    assert after >= before
+    assert cache.stats()['hits'] == 1
+    cache.close()
+
+
+def test_eviction_keeps_recently_used_entries(tmp_path):
+    cache = TokenCache(str(tmp_path / 'tokens.sqlite3'), max_bytes=10 ** 6)
+    for i in range(20):
+        cache.put(f'k{i}', MORPHEMES)
+    cache.flush()
+    cache.get('k0')
+    size = cache.total_bytes // 20
+    cache.max_bytes = size * 10
+    cache.put('new', MORPHEMES)
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.get('k0') == MORPHEMES
+    assert cache.get('new') == MORPHEMES
+    assert cache.get('k1') is None
+    cache.close()
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from token_cache import filter_pos
+from token_table import TokenTable, load_token_table, open_token_table
+
+
+def morpheme(surface, pos):
+    return (surface, pos, surface + '原', surface + 'ヨミ')
+
+
+MORPHEMES = [
+    [morpheme('冒険', '名詞'), morpheme('が', '助詞'), morpheme('楽しい', '形容詞')],
+    None,
+    [morpheme('バグ', '名詞'), morpheme('多い', '形容詞'), morpheme('!', '補助記号')],
+    [],
+    [morpheme('世界', '名詞'), morpheme('冒険', '名詞'), morpheme('広がる', '動詞')],
+    [morpheme('キャラ', '名詞')],
+]
+TARGET_POS = ('名詞', '動詞', '形容詞')
+
+
+def expected(target_pos=None):
+    return [filter_pos(m or [], target_pos) for m in MORPHEMES]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_partial_builds_match_full_build(seed):
+    rng = np.random.default_rng(seed)
+    table = TokenTable.empty()
+    # 行をばらばらの順・大きさのまとまりで加えても、一度に作った表と同じ内容になる
+    order = rng.permutation(len(MORPHEMES)).tolist()
+    while order:
+        size = int(rng.integers(1, 4))
+        batch, order = order[:size], order[size:]
+        assert table.missing(batch) == batch
+        table.add_reviews(batch, [MORPHEMES[i] for i in batch])
+
+    full = TokenTable.from_morphemes(MORPHEMES)
+    assert table.missing(range(len(MORPHEMES))) == []
+    for target_pos in (None, TARGET_POS):
+        assert table.select(target_pos=target_pos) == full.select(target_pos=target_pos) == expected(target_pos)
+
+
+def test_missing_rows_and_rows_beyond_the_table():
+    table = TokenTable.empty()
+    table.add_reviews([4, 1], [MORPHEMES[4], MORPHEMES[1]])
+    assert table.missing(range(6)) == [0, 2, 3, 5]
+    assert table.select([4, 1, 5]) == [MORPHEMES[4], [], []]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'table.npz')
+    table = TokenTable.empty(meta={'signature': 'x'}, path=path)
+    table.add_reviews([0, 2], [MORPHEMES[0], MORPHEMES[2]])
+    assert table.modified
+    table.save()
+    assert not table.modified
+
+    loaded = TokenTable.load(path)
+    assert loaded.meta['signature'] == 'x'
+    assert loaded.missing(range(3)) == [1]
+    assert loaded.select([0, 2], TARGET_POS) == [expected(TARGET_POS)[0], expected(TARGET_POS)[2]]
+
+
+def test_rows_added_after_save(tmp_path):
+    # 保存時にまとめた行と、その後のチャンクで追加した行を混ぜて取り出せる
+    path = str(tmp_path / 'table.npz')
+    table = TokenTable.empty(path=path)
+    table.add_reviews([5, 0], [MORPHEMES[5], MORPHEMES[0]])
+    table.add_reviews([2], [MORPHEMES[2]])
+    table.save()
+    table.add_reviews([4, 1, 3], [MORPHEMES[4], MORPHEMES[1], MORPHEMES[3]])
+    for target_pos in (None, TARGET_POS):
+        assert table.select(target_pos=target_pos) == expected(target_pos)
+    table.save()
+    assert TokenTable.load(path).select(target_pos=TARGET_POS) == expected(TARGET_POS)
+
+
+@pytest.fixture
+def tagger():
+    MeCab = pytest.importorskip('MeCab')
+    return MeCab.Tagger()
+
+
+REVIEWS = ['主人公の成長に感動した', 'バグが多くて最悪', 'キャラクターが可愛い', '冒険の世界観が薄い']
+
+
+def test_token_table_matches_direct_parse(tmp_path, tagger):
+    from token_cache import TokenCache, parse_morphemes
+
+    csv_path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'text': REVIEWS}).to_csv(csv_path, index=False)
+    texts = pd.read_csv(csv_path)['text']
+    cache = TokenCache(':memory:')
+    table_dir = str(tmp_path / 'tables')
+
+    # 一部の行だけを解析して保存し、次に残りの行を加える
+    table = load_token_table(str(csv_path), 'text', tagger, texts=texts.loc[[2, 0]], cache=cache, table_dir=table_dir)
+    assert table.missing(range(len(REVIEWS))) == [1, 3]
+    table = load_token_table(str(csv_path), 'text', tagger, texts=texts, cache=cache, table_dir=table_dir)
+    assert table.missing(range(len(REVIEWS))) == []
+    assert table.select() == [parse_morphemes(tagger, text) for text in REVIEWS]
+    assert table.select(target_pos=TARGET_POS) == [parse_morphemes(tagger, text, TARGET_POS) for text in REVIEWS]
+
+    # CSVが変わった場合は空の表から作り直す
+    pd.DataFrame({'text': REVIEWS + ['追加のレビュー']}).to_csv(csv_path, index=False)
+    assert open_token_table(str(csv_path), 'text', tagger, table_dir).missing(range(5)) == list(range(5))
+
+
+@pytest.mark.parametrize('content', [b'', b'PK\x03\x04truncated'])
+def test_corrupt_table_file_is_rebuilt(tmp_path, tagger, content):
+    from token_table import table_path
+
+    csv_path = tmp_path / 'reviews.csv'
+    pd.DataFrame({'text': REVIEWS}).to_csv(csv_path, index=False)
+    table_dir = str(tmp_path / 'tables')
+    table = load_token_table(str(csv_path), 'text', tagger, table_dir=table_dir)
+    # 保存が途中で止まった (空・途中までの) ファイル
+    with open(table.path, 'wb') as f:
+        f.write(content)
+    assert table.path == table_path(str(csv_path), 'text', table_dir)
+
+    table = open_token_table(str(csv_path), 'text', tagger, table_dir)
+    assert table.missing(range(len(REVIEWS))) == list(range(len(REVIEWS)))
+    table = load_token_table(str(csv_path), 'text', tagger, table_dir=table_dir)
+    assert table.missing(range(len(REVIEWS))) == []
+
+
+def test_concurrent_saves_leave_a_complete_table(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    path = str(tmp_path / 'table.npz')
+
+    def save(k):
+        table = TokenTable.empty(path=path)
+        table.add_reviews(range(k + 1), MORPHEMES[:k + 1])
+        table.save()
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(save, list(range(len(MORPHEMES))) * 4))
+    # どれか1つの保存内容がそのまま残り、一時ファイルは残らない
+    loaded = TokenTable.load(path)
+    assert loaded.select() == expected()[:len(loaded)]
+    assert [p.name for p in tmp_path.iterdir()] == ['table.npz']
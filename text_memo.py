@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+# ==========================================
+# レビュー本文ごとの結果の LRU メモ
+# ==========================================
+# シナリオの短い一文 (シナリオ一文・シナリオ文) は、同じ作品の別の行や別の作品に
+# 同じ文面で何度も現れる。レビュー単位の判定や前処理の結果を、正規化した本文
+# (前後の半角空白・タブ・改行を除いたもの) をキーにして覚えておき、同じ文は1回だけ解析する。
+# 1件ずつの get() と、バッチ処理用の get_many() (未知の文面だけをまとめて計算する) がある。
+# メモは1回の実行の中で作品をまたいで共有し、件数が上限を超えたら最も長く使われていない
+# ものから捨てる。結果はストップワードや感情辞書に依存するので、main の実行ごとに clear() する。
+# メモはプロセスごとに持つ (作品単位の並行処理では各プロセスが別々のメモを持つ)。
+# プロセスをまたいだ再利用は形態素解析結果のキャッシュ (token_cache) が受け持つ。
+
+DEFAULT_MAX_ENTRIES = 100000
+
+
+# MeCab が読み飛ばす空白文字。全角空白 (U+3000) や \r は形態素になるため除かない
+SKIPPED_WHITESPACE = ' \t\n'
+
+
+def normalize_text(text):
+    """メモのキーにする本文 (前後の半角空白・タブ・改行は形態素解析の結果に影響しない)"""
+    return text.strip(SKIPPED_WHITESPACE)
+
+
+class TextMemo:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        """max_entries=0 の場合は何も覚えない (毎回計算する)"""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, compute, *args):
+        """
+        正規化した text に対する結果を返す。覚えていなければ compute(正規化した text, *args) で
+        計算して覚える。結果は共有されるので、変更しない値 (タプルなど) を返す関数を渡す。
+        """
+        key = normalize_text(text)
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+
+        self.misses += 1
+        value = compute(key, *args)
+        self._store(key, value)
+        return value
+
+    def get_many(self, texts, compute_many):
+        """
+        texts (本文のリスト) の各本文に対する結果を同じ順のリストで返す。覚えていない文面は
+        重複を除き、texts の中で最初に現れる位置のリストとして compute_many にまとめて渡す。
+        compute_many はその位置と同じ順に結果のリストを返す関数 (結果は get と同じく共有される)。
+        バッチ内で2回目以降に現れる同じ文面はヒットとして数える。
+        """
+        entries = self._entries
+        results = [None] * len(texts)
+        pending = {}
+        for i, text in enumerate(texts):
+            key = normalize_text(text)
+            if key in entries:
+                entries.move_to_end(key)
+                results[i] = entries[key]
+            else:
+                pending.setdefault(key, []).append(i)
+
+        self.misses += len(pending)
+        self.hits += len(texts) - len(pending)
+        if pending:
+            values = compute_many([positions[0] for positions in pending.values()])
+            for (key, positions), value in zip(pending.items(), values):
+                for i in positions:
+                    results[i] = value
+                self._store(key, value)
+        return results
+
+    def _store(self, key, value):
+        if self.max_entries > 0:
+            entries = self._entries
+            entries[key] = value
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """ヒット数・ミス数だけを 0 に戻す (覚えている結果は残す。作品ごとの集計に使う)"""
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate, 'entries': len(self._entries)}
+
+    def summary(self):
+        """stats() を表示用の1文にしたもの"""
+        s = self.stats()
+        return (f"{s['hits'] + s['misses']} 件のうち {s['misses']} 件を解析しました "
+                f"(同じ文面の再利用 {s['hits']} 件, ヒット率 {s['hit_rate']:.1%})")
@@ -0,0 +1,241 @@
+import json
+import os
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+# ==========================================
+# 疎行列のままTF-IDFを扱うためのユーティリティ
+# ==========================================
+# bigramを含めると 文書×N-gram の密行列は簡単にメモリを使い切るため、
+# 特徴語の抽出や確認はCSR行列の行を直接読んで行う。
+
+
+def top_k_in_row(matrix, i, n):
+    """
+    CSR行列の i 行目から値の大きい上位 n 件の (列番号, 値) を降順で返す。
+    非ゼロ要素だけを argpartition で部分選択するので、行全体をソートしない。
+    """
+    matrix = sparse.csr_matrix(matrix)
+    start, end = matrix.indptr[i], matrix.indptr[i + 1]
+    indices = matrix.indices[start:end]
+    values = matrix.data[start:end]
+
+    if len(values) > n:
+        top = np.argpartition(-values, n - 1)[:n]
+        indices, values = indices[top], values[top]
+    order = np.argsort(-values, kind='stable')
+    return indices[order], values[order]
+
+
+def save_tfidf_matrix(path_prefix, matrix, terms):
+    """TF-IDF行列を密行列にせず、疎行列 (.npz) と語彙 (.json) のまま保存する"""
+    sparse.save_npz(f'{path_prefix}.npz', sparse.csr_matrix(matrix))
+    with open(f'{path_prefix}_terms.json', 'w', encoding='utf-8') as f:
+        json.dump(list(terms), f, ensure_ascii=False)
+
+
+def load_tfidf_matrix(path_prefix):
+    """save_tfidf_matrix で保存した (疎行列, 語彙リスト) を読み込む"""
+    matrix = sparse.load_npz(f'{path_prefix}.npz').tocsr()
+    with open(f'{path_prefix}_terms.json', encoding='utf-8') as f:
+        terms = json.load(f)
+    return matrix, terms
+
+
+# ==========================================
+# 文書 (作品) 間のコサイン類似度
+# ==========================================
+# 行をL2正規化したTF-IDF行列 X では、X @ X.T がそのままコサイン類似度の行列になる。
+# 文書が数千件あると n×n の行列全体は大きいので、block_size 行ずつ疎行列の積で計算し、
+# ブロックごとに書き出し・上位 k 件の抽出を済ませてから捨てる (メモリは block_size × n)。
+
+SIMILARITY_BLOCK_SIZE = 512
+
+
+def cosine_similarity_blocks(matrix, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    行をL2正規化した行列について、(開始行, その行から block_size 行分の類似度 (密行列)) を順に返す。
+    """
+    matrix = sparse.csr_matrix(matrix)
+    transposed = matrix.T.tocsr()
+    for start in range(0, matrix.shape[0], block_size):
+        block = matrix[start:start + block_size] @ transposed
+        yield start, block.toarray()
+
+
+def top_k_neighbors(block, start, k):
+    """
+    cosine_similarity_blocks のブロックの各行について、自分自身を除いた類似度の上位 k 件の
+    (列番号の配列, 類似度の配列) を返す (どちらも 行数 × k 以下、各行は降順)。
+    """
+    rows = np.arange(block.shape[0])
+    block = block.copy()
+    block[rows, start + rows] = -np.inf
+    k = min(k, block.shape[1] - 1)
+    if k <= 0:
+        empty = np.empty((block.shape[0], 0))
+        return empty.astype(np.int64), empty
+    top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def ngram_counts(corpus):
+    """
+    TokenCorpus の全レビューを空白区切りで1つの文書にまとめ、TfidfVectorizer(ngram_range=(1, 2))
+    の既定の解析器にかけたときと同じ unigram / bigram の出現回数 (Counter) を返す。
+    巨大な連結文字列は作らず、語彙ごとに解析器を1回だけ通して語彙番号の配列で数える。
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    # 解析器は空白をまたいでトークンを作らないので、連結文書のトークン列は
+    # 「各語を解析器にかけた結果」を並べたものと同じになる (1文字語の除去・小文字化など)
+    analyzer = TfidfVectorizer().build_analyzer()
+    normalized = {}
+    flat = []
+    lengths = np.zeros(len(corpus.vocabulary), dtype=np.int64)
+    for i, word in enumerate(corpus.vocabulary):
+        parts = analyzer(word)
+        lengths[i] = len(parts)
+        flat.extend(normalized.setdefault(p, len(normalized)) for p in parts)
+    starts = np.cumsum(lengths) - lengths
+    flat = np.asarray(flat, dtype=np.int64)
+    terms = list(normalized)
+
+    # 語彙番号の列を、解析後のトークン番号の列に展開する
+    token_ids = np.asarray(corpus.token_ids, dtype=np.int64)
+    per_token = lengths[token_ids]
+    offsets = np.repeat(starts[token_ids] - (np.cumsum(per_token) - per_token), per_token)
+    stream = flat[offsets + np.arange(len(offsets))] if len(offsets) else np.empty(0, dtype=np.int64)
+
+    counts = Counter()
+    unigram = np.bincount(stream, minlength=len(terms))
+    for i in np.nonzero(unigram)[0]:
+        counts[terms[i]] = int(unigram[i])
+    if len(stream) > 1:
+        keys, key_counts = np.unique(stream[:-1] * len(terms) + stream[1:], return_counts=True)
+        for key, count in zip(keys.tolist(), key_counts.tolist()):
+            first, second = divmod(key, len(terms))
+            counts[f'{terms[first]} {terms[second]}'] = count
+    return counts
+
+
+# ==========================================
+# 作品単位で更新できるTF-IDF統計
+# ==========================================
+# 作品ごとの N-gram 出現回数と、全作品での文書頻度 (その語を含む作品数) を
+# results/state/tfidf/ に保存しておく。ある作品のCSVが変わったときは、その作品だけを
+# 数え直して文書頻度を差し替え、IDF と TF-IDF は保存済みの出現回数から計算し直す。
+# TfidfVectorizer(ngram_range=(1, 2)) の既定設定 (smooth_idf, L2正規化) と同じ値になる。
+
+TFIDF_STATE_DIR = os.path.join('results', 'state', 'tfidf')
+
+
+class TfidfStatistics:
+    def __init__(self, state_dir=TFIDF_STATE_DIR):
+        self.state_dir = state_dir
+        self.signatures = {}
+        self.term_counts = {}
+        self.document_frequency = Counter()
+        self._dirty = set()
+
+        manifest_path = os.path.join(state_dir, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            for title, entry in manifest['titles'].items():
+                with open(os.path.join(state_dir, entry['file']), encoding='utf-8') as f:
+                    self.term_counts[title] = json.load(f)
+                self.signatures[title] = entry['signature']
+            with open(os.path.join(state_dir, 'document_frequency.json'), encoding='utf-8') as f:
+                self.document_frequency = Counter(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ 保存済みのTF-IDF統計を読み込めませんでした ({e})。全作品を数え直します。")
+            self.signatures = {}
+            self.term_counts = {}
+            self.document_frequency = Counter()
+
+    def is_current(self, title, signature):
+        """保存済みの出現回数が、同じ入力 (signature) から数えたものかどうか"""
+        return title in self.term_counts and self.signatures.get(title) == signature
+
+    def set_title(self, title, counts, signature):
+        """作品の出現回数を差し替え、文書頻度を更新する"""
+        self.remove_title(title)
+        counts = {term: int(count) for term, count in counts.items() if count > 0}
+        self.term_counts[title] = counts
+        self.signatures[title] = signature
+        self.document_frequency.update(counts.keys())
+        self._dirty.add(title)
+
+    def remove_title(self, title):
+        old = self.term_counts.pop(title, None)
+        self.signatures.pop(title, None)
+        if old is not None:
+            self.document_frequency.subtract(old.keys())
+            # 0 になった語は語彙から消す
+            self.document_frequency += Counter()
+
+    def retain(self, titles):
+        """titles に含まれない作品 (設定から外された作品) を統計から取り除く"""
+        for title in list(self.term_counts):
+            if title not in titles:
+                self.remove_title(title)
+
+    def tfidf_matrix(self, titles):
+        """
+        titles の順に並んだ (作品×N-gram のTF-IDF CSR行列, 語彙の配列) を返す。
+        語彙は TfidfVectorizer.get_feature_names_out() と同じく辞書順。
+        """
+        terms = np.array(sorted(self.document_frequency), dtype=object)
+        term_index = {term: i for i, term in enumerate(terms)}
+
+        indptr = [0]
+        indices = []
+        data = []
+        for title in titles:
+            counts = self.term_counts.get(title, {})
+            for term, count in counts.items():
+                indices.append(term_index[term])
+                data.append(count)
+            indptr.append(len(indices))
+        tf = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(titles), len(terms)),
+        )
+        tf.sort_indices()
+
+        # smooth_idf: idf = ln((1 + n) / (1 + df)) + 1
+        df = np.array([self.document_frequency[term] for term in terms], dtype=np.float64)
+        idf = np.log((1 + len(titles)) / (1 + df)) + 1
+        tfidf = tf.multiply(idf).tocsr()
+
+        # 行ごとにL2正規化
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        tfidf = sparse.diags(1.0 / norms) @ tfidf
+        return tfidf.tocsr(), terms
+
+    def save(self):
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        manifest = {'titles': {}}
+        for title in sorted(self.term_counts):
+            file_name = f'{title}_counts.json'
+            if title in self._dirty or not os.path.exists(os.path.join(self.state_dir, file_name)):
+                with open(os.path.join(self.state_dir, file_name), 'w', encoding='utf-8') as f:
+                    json.dump(self.term_counts[title], f, ensure_ascii=False)
+            manifest['titles'][title] = {'file': file_name, 'signature': self.signatures[title]}
+        with open(os.path.join(self.state_dir, 'document_frequency.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(self.document_frequency), f, ensure_ascii=False)
+        # 出現回数のファイルを書き終えてから目録を置き換える
+        tmp_path = os.path.join(self.state_dir, 'manifest.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(self.state_dir, 'manifest.json'))
+        self._dirty.clear()
@@ -0,0 +1,51 @@
+import contextlib
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+import plotting
+
+# ==========================================
+# 作品 (file_config の各要素) ごとの並行処理
+# ==========================================
+# 各作品の読み込み・形態素解析・スコア計算は、最後の比較グラフまで互いに独立している。
+# そこで作品ごとに別プロセスで実行し、ある作品がCSVを読んでいる間に別の作品の
+# 形態素解析を進める。全体の処理時間は、最も大きい作品の処理時間に近づく。
+# 結果と標準出力は作品ごとに集め、file_config の順に返す/表示するので、
+# 並行に実行しても出力の順序は逐次実行と同じになる。
+# 子プロセスは spawn で起動する (MeCab や SQLite の接続を fork で引き継がないため)。
+
+
+def _run_in_worker(process_title, item):
+    # 子プロセスはグラフをファイルに保存するだけで、画面には表示しない
+    plotting.set_headless(True)
+    instrumentation.reset_all()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = process_title(item)
+    return result, log.getvalue(), instrumentation.export_all()
+
+
+def run_titles(process_title, items, concurrency=1):
+    """
+    process_title(item) を items の各要素に対して実行し、結果を items と同じ順のリストで返す。
+    concurrency > 1 の場合は最大 concurrency 個のプロセスで並行に実行し、子プロセスで計測した
+    処理時間 (instrumentation.PipelineProfiler) は親プロセスの同名の計測器に合算する。
+    process_title はモジュールの最上位の関数 (または functools.partial) でなければならない。
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [process_title(item) for item in items]
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with ProcessPoolExecutor(max_workers=min(concurrency, len(items)), mp_context=context) as executor:
+        futures = [executor.submit(_run_in_worker, process_title, item) for item in items]
+        # 投入した順 (= file_config の順) に受け取り、ログもその順で表示する
+        for future in futures:
+            result, log, records = future.result()
+            print(log, end='')
+            instrumentation.merge_records(records)
+            results.append(result)
+    return results
@@ -0,0 +1,274 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import weakref
+
+from morpheme_memo import MorphemeMemo
+
+# ==========================================
+# 形態素解析結果のディスクキャッシュ
+# ==========================================
+# 全スクリプト (TFIDF.py, sv.py, 共起.py, 共起分析.py, 感情.py, 感情分析.py) が
+# 同じレビューを何度もMeCabに通さないよう、解析結果をSQLiteに保存して共有する。
+# キーは「レビュー本文のハッシュ + MeCab辞書の同一性」。値は全品詞の形態素の
+# (表層形, 品詞, 原形, 読み) のリストで、1つのレビューにつき1件だけ保存する。
+# 品詞フィルタは読み出したあとに適用するので、品詞フィルタの違うスクリプトや
+# トークン表 (token_table) の作成でも同じ保存内容を使い回す。
+# ストップワードや感情辞書による絞り込みもキャッシュの外 (各スクリプト側) で行うため、
+# 辞書を編集してもキャッシュは無効にならない。
+
+DEFAULT_CACHE_PATH = os.path.join('cache', 'tokens.sqlite3')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512MB を超えたら古いものから削除
+COMMIT_INTERVAL = 1000
+
+# 同じプロセス内では同じパスのキャッシュを1つの接続で共有する
+_shared_caches = {}
+
+
+def dictionary_identity(tagger):
+    """MeCab辞書の同一性を表す文字列 (ファイル名・サイズ・バージョン・文字コード)"""
+    parts = []
+    info = tagger.dictionary_info()
+    while info:
+        parts.append(f"{info.filename}:{info.size}:{info.version}:{info.charset}")
+        info = info.next
+    return '|'.join(parts)
+
+
+def _parse_feature(feature):
+    """MeCab の素性文字列から (品詞, 原形, 読み) を取り出す。原形・読みが '*' の場合は空文字"""
+    features = feature.split(',')
+    base = features[6] if len(features) > 6 and features[6] != '*' else ''
+    reading = features[7] if len(features) > 7 and features[7] != '*' else ''
+    return features[0], base, reading
+
+
+# 素性文字列 → (品詞, 原形, 読み)。同じ素性の形態素は split し直さない
+_feature_memo = MorphemeMemo(_parse_feature)
+
+# NOTE: 出力形式 (-F "%m\t%f[0]\t%f[6]\t%f[7]\n" など) で必要な項目だけを出力させ、
+# Tagger.parse の文字列を分割する方法も試したが、上の素性メモがあると parseToNode で
+# ノードをたどる方が速かった (MeCab 側の文字列整形の方が重い)。また複数のレビューを
+# 改行でつないで1回で解析すると、MeCab は全体を1文として扱うため、レビューの境目で
+# 分割結果が変わる (単独で解析した結果やキャッシュと一致しない)。
+# そのため1回の呼び出しで解析するのは1レビューとし、parse_many でまとめて処理する。
+
+
+def parse_morphemes(tagger, text, target_pos=None):
+    """
+    テキストを形態素解析し、(表層形, 品詞, 原形, 読み) のリストを返す。
+    原形・読みが '*' の場合は空文字。target_pos を指定するとその品詞のみ返す。
+    """
+    morphemes = []
+    node = tagger.parseToNode(text)
+    while node:
+        pos, base, reading = _feature_memo[node.feature]
+        if target_pos is None or pos in target_pos:
+            morphemes.append((node.surface, pos, base, reading))
+        node = node.next
+    return morphemes
+
+
+def filter_pos(morphemes, target_pos):
+    """(表層形, 品詞, 原形, 読み) のリストから target_pos の品詞だけを残す (None ならそのまま)"""
+    if target_pos is None or morphemes is None:
+        return morphemes
+    return [m for m in morphemes if m[1] in target_pos]
+
+
+def parse_many(tagger, texts, target_pos=None):
+    """
+    複数のレビューを parse_morphemes と同じ形式で解析し、入力順のリストを返す。
+    解析に失敗したレビューは None になる。
+    """
+    memo = _feature_memo
+    parse_to_node = tagger.parseToNode
+    results = []
+    for text in texts:
+        morphemes = []
+        append = morphemes.append
+        try:
+            node = parse_to_node(text)
+            while node:
+                pos, base, reading = memo[node.feature]
+                if target_pos is None or pos in target_pos:
+                    append((node.surface, pos, base, reading))
+                node = node.next
+        except Exception:
+            morphemes = None
+        results.append(morphemes)
+    return results
+
+
+class TokenCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        if path != ':memory:':
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Tagger → 辞書の同一性。id() をキーにすると、解放された Tagger の id が
+        # 別の Tagger に再利用されたときに別の辞書の値を返してしまうため、弱参照で持つ
+        self._identities = weakref.WeakKeyDictionary()
+        self._pending = 0
+        # 書き込みはメモリにためて flush でまとめて行う (読み出しは書き込みトランザクションの外で行い、
+        # 書き込みロックは flush の短いトランザクションの間だけ持つ)
+        self._touches = {}  # キー → 最終利用時刻 (ヒットしたもの)
+        self._writes = {}   # キー → (値, バイト数, 最終利用時刻) (新しく保存するもの)
+
+        # 複数スクリプトの同時実行に備え、WALモードでロック待ちを許容する。
+        # 書き込みは BEGIN IMMEDIATE で始め、他プロセスの書き込みと競合した場合に
+        # ロック待ちをせず即座に "database is locked" になるのを防ぐ
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level='IMMEDIATE')
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tokens_last_used ON tokens(last_used)")
+        self.conn.commit()
+        self.total_bytes = self._stored_bytes()
+
+        atexit.register(self.close)
+
+    def _identity(self, tagger):
+        # 辞書情報の取得は1つのTaggerにつき1回だけ行う
+        try:
+            identity = self._identities.get(tagger)
+        except TypeError:
+            # 弱参照を作れないオブジェクトは毎回求める
+            return dictionary_identity(tagger)
+        if identity is None:
+            identity = self._identities[tagger] = dictionary_identity(tagger)
+        return identity
+
+    def make_key(self, text, tagger):
+        """レビュー本文・辞書から内容アドレスのキーを作る (値は全品詞の形態素)"""
+        digest = hashlib.sha1()
+        digest.update(self._identity(tagger).encode('utf-8'))
+        digest.update(b'\0')
+        # 以前は品詞フィルタごとに保存しており、全品詞のキーは '*' だった (同じキーを使い続ける)
+        digest.update(b'*')
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        written = self._writes.get(key)
+        if written is not None:
+            value = written[0]
+            self._writes[key] = (value, written[1], time.time())
+        else:
+            row = self.conn.execute("SELECT value FROM tokens WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value = row[0]
+            # 最終利用時刻の更新は flush でまとめて書き込む
+            self._touches[key] = time.time()
+        self.hits += 1
+        self._tick()
+        return [tuple(m) for m in json.loads(value)]
+
+    def put(self, key, morphemes):
+        value = json.dumps(morphemes, ensure_ascii=False)
+        size = len(value.encode('utf-8'))
+        if key in self._writes:
+            self.total_bytes -= self._writes[key][1]
+        else:
+            old = self.conn.execute("SELECT size FROM tokens WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self.total_bytes -= old[0]
+        self._writes[key] = (value, size, time.time())
+        self._touches.pop(key, None)
+        self.total_bytes += size
+        if self.total_bytes > self.max_bytes:
+            self.flush()
+        else:
+            self._tick()
+
+    def morphemes(self, tagger, text, target_pos=None):
+        """キャッシュを経由して parse_morphemes を呼ぶ (read-through)"""
+        key = self.make_key(text, tagger)
+        morphemes = self.get(key)
+        if morphemes is None:
+            morphemes = parse_morphemes(tagger, text)
+            self.put(key, morphemes)
+        return filter_pos(morphemes, target_pos)
+
+    def _stored_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM tokens").fetchone()[0]
+
+    def _evict(self):
+        """最終利用が古いものから削除し、上限の9割まで減らす"""
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                "SELECT key, size FROM tokens ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            removed = []
+            for key, size in rows:
+                removed.append((key,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+            self.conn.executemany("DELETE FROM tokens WHERE key = ?", removed)
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """ためておいた保存と最終利用時刻の更新を1つのトランザクションで書き込む"""
+        if self.conn is not None and (self._writes or self._touches):
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO tokens (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                    [(key, value, size, last_used) for key, (value, size, last_used) in self._writes.items()],
+                )
+                self.conn.executemany(
+                    "UPDATE tokens SET last_used = ? WHERE key = ?",
+                    [(last_used, key) for key, last_used in self._touches.items()],
+                )
+                if self.total_bytes > self.max_bytes:
+                    # total_bytes はこのプロセスの書き込みしか反映しないので、
+                    # 他のプロセスも同じDBに書き込んでいる場合に備えてDB上の合計を読み直す
+                    self.total_bytes = self._stored_bytes()
+                    if self.total_bytes > self.max_bytes:
+                        self._evict()
+        self._writes = {}
+        self._touches = {}
+        self._pending = 0
+
+    def close(self):
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate, 'bytes': self.total_bytes}
+
+
+def get_token_cache(path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+    """プロセス内で共有されるTokenCacheを返す"""
+    cache = _shared_caches.get(path)
+    if cache is None or cache.conn is None:
+        cache = TokenCache(path, max_bytes)
+        _shared_caches[path] = cache
+    return cache
@@ -0,0 +1,136 @@
+import json
+import os
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+# ==========================================
+# 語彙番号で表したトークンコーパス (CSR形式)
+# ==========================================
+# 前処理済みのレビューを「str のリスト/集合のリスト」で持つと、1トークンあたり
+# 数十バイトかかり、100万件規模のコーパスではメモリが足りなくなる。
+# ここでは語彙を一度だけ登録し、
+#   token_ids: 全レビューのトークンを語彙番号で並べた int32 配列
+#   offsets:   レビュー i のトークンが token_ids[offsets[i]:offsets[i + 1]] にあることを示す int64 配列
+# の2つの配列で表す。保存は .npy (無圧縮) なので、np.load(mmap_mode='r') で
+# 複数のプロセスがコピーせずに同じコーパスを開ける。
+# NOTE: save / load はライブラリとしての機能で、各スクリプトはコーパスを保存しない。
+# コーパスの中身はスクリプトごとのストップワード・品詞フィルタで変わるため、スクリプト間で
+# 共有して保存するのは形態素解析の結果 (token_table) の方で、コーパスは実行ごとにそこから作る。
+# sv.py はトークン表を使わず、レビューごとに形態素解析キャッシュ (token_cache) から読む。
+
+TOKEN_IDS_FILE = 'token_ids.npy'
+OFFSETS_FILE = 'offsets.npy'
+VOCABULARY_FILE = 'vocabulary.json'
+
+
+class TokenCorpus:
+    def __init__(self, token_ids, offsets, vocabulary):
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.vocabulary = vocabulary
+        self._term_index = None
+
+    @classmethod
+    def from_token_lists(cls, token_lists, vocabulary=None):
+        """
+        トークン (str) のリスト/集合の列からコーパスを作る。token_lists はジェネレータでもよい。
+        語彙番号は初出順に振る。集合は並び順が不定なので語彙番号の昇順に並べて格納する。
+        """
+        term_index = {}
+        if vocabulary is not None:
+            term_index = {term: i for i, term in enumerate(vocabulary)}
+        token_ids = array('i')
+        offsets = array('q', [0])
+        for tokens in token_lists:
+            ids = [term_index.setdefault(t, len(term_index)) for t in tokens]
+            if isinstance(tokens, (set, frozenset)):
+                ids.sort()
+            token_ids.extend(ids)
+            offsets.append(len(token_ids))
+
+        corpus = cls(np.frombuffer(token_ids, dtype=np.int32) if token_ids else np.empty(0, dtype=np.int32),
+                     np.frombuffer(offsets, dtype=np.int64), list(term_index))
+        corpus._term_index = term_index
+        return corpus
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def ids(self, i):
+        """レビュー i のトークンの語彙番号 (配列のビュー)"""
+        return self.token_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def tokens(self, i):
+        """レビュー i のトークン (str) のリスト"""
+        vocabulary = self.vocabulary
+        return [vocabulary[t] for t in self.ids(i).tolist()]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.tokens(i)
+
+    @property
+    def term_index(self):
+        if self._term_index is None:
+            self._term_index = {term: i for i, term in enumerate(self.vocabulary)}
+        return self._term_index
+
+    def term_ids(self, words):
+        """words のうちコーパスの語彙にある語の語彙番号 (重複なし)"""
+        term_index = self.term_index
+        return np.array(sorted({term_index[w] for w in words if w in term_index}), dtype=np.int32)
+
+    def review_index(self):
+        """各トークンが何番目のレビューのものかを表す配列"""
+        return np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets))
+
+    def count_in(self, words):
+        """レビューごとに、words に含まれるトークンの数 (出現回数込み) を数える"""
+        mask = np.isin(self.token_ids, self.term_ids(words))
+        return np.bincount(self.review_index()[mask], minlength=len(self)).astype(np.int64)
+
+    def document_term_matrix(self, binary=False):
+        """レビュー×語彙 の出現回数 (binary=True なら出現有無) のCSR行列"""
+        data = np.ones(len(self.token_ids), dtype=np.int64)
+        matrix = sparse.csr_matrix((data, np.asarray(self.token_ids), np.asarray(self.offsets)),
+                                   shape=(len(self), len(self.vocabulary)))
+        matrix.sum_duplicates()
+        if binary:
+            matrix.data[:] = 1
+        return matrix
+
+    def incidence_matrix(self, lexicon):
+        """
+        レビュー×lexicon の出現有無 (0/1) のCSR行列。
+        lexicon は 語→列番号 の辞書で、コーパスに無い語の列は0になる。
+        """
+        term_index = self.term_index
+        pairs = [(term_index[w], col) for w, col in lexicon.items() if w in term_index]
+        projection = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int32), ([p[0] for p in pairs], [p[1] for p in pairs])),
+            shape=(len(self.vocabulary), len(lexicon)),
+        )
+        incidence = (self.document_term_matrix(binary=True) @ projection).tocsr()
+        incidence.data = (incidence.data > 0).astype(np.int32)
+        return incidence
+
+    def save(self, directory):
+        """memory-map で開ける形式 (.npy) で保存する"""
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        np.save(os.path.join(directory, TOKEN_IDS_FILE), np.asarray(self.token_ids, dtype=np.int32))
+        np.save(os.path.join(directory, OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        with open(os.path.join(directory, VOCABULARY_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """save で保存したコーパスを開く。mmap=True なら配列はファイルを直接参照する (読み取り専用)"""
+        mmap_mode = 'r' if mmap else None
+        token_ids = np.load(os.path.join(directory, TOKEN_IDS_FILE), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode=mmap_mode)
+        with open(os.path.join(directory, VOCABULARY_FILE), encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        return cls(token_ids, offsets, vocabulary)
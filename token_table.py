@@ -0,0 +1,343 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from csv_reader import iter_csv_chunks
+from token_cache import dictionary_identity
+from tokenize_pool import tokenize_reviews
+
+# ==========================================
+# 形態素解析済みコーパスの列指向トークン表
+# ==========================================
+# スクリプトごとに node.feature から取り出す項目 (表層形・原形・読み・品詞) が
+# 違うため、これまでは同じCSVでも解析結果を共有できなかった。
+# ここではCSVのレビュー列を全品詞で解析し、1形態素1行の表
+#   review_id (CSVの行番号), position (レビュー内の位置), surface, base, reading, pos
+# を列ごとの配列として cache/token_tables/ に圧縮保存する。文字列の列は
+# 語彙リストへの番号 (辞書符号化) で持つ。各分析はこの表を走査して
+# 必要な品詞・項目を取り出すだけで、MeCab を呼ばない。
+#
+# 表には解析済みの行だけが入っている (parsed)。各分析は自分が使う行 (前処理・重複除去・
+# 追記分の判定をしたあとの行) を、すでに読み込んだレビュー列ごと ensure に渡し、
+# まだ表に無い行だけを解析して追加する。CSVを読み直すことはなく、重複として除いた行や
+# 処理済みの行は解析しない。
+#
+# CSVのサイズ・更新日時・列名・MeCab辞書が変わった場合は空の表から作り直す
+# (作り直しでも、変わっていないレビューは token_cache のキャッシュに当たる)。
+
+TOKEN_TABLE_DIR = os.path.join('cache', 'token_tables')
+FORMAT_VERSION = 2
+STRING_COLUMNS = ('surface', 'base', 'reading', 'pos')
+
+
+def _encode_json(value):
+    return np.frombuffer(json.dumps(value, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_json(array):
+    return json.loads(array.tobytes().decode('utf-8'))
+
+
+class TokenTable:
+    def __init__(self, review_id, position, columns, vocabularies, n_reviews, meta=None, parsed=None, path=None):
+        """
+        review_id, position: 形態素ごとの int32 配列 (review_id の昇順)
+        columns: {'surface': 語彙番号の配列, 'base': ..., 'reading': ..., 'pos': ...}
+        vocabularies: {'surface': 語彙リスト, ...}
+        parsed: 行ごとに解析済みかどうかの bool 配列 (省略時はすべて解析済み)
+        path: save() の保存先
+        """
+        self.vocabularies = vocabularies
+        self.n_reviews = 0
+        self.meta = meta or {}
+        self.path = path
+        self.modified = False
+        self._lookups = {}
+        self._masks = {}
+        # 形態素の列は「追加したまとまり (ラン)」ごとに持つ。各ランの中は review_id の昇順で、
+        # 1つのレビューの形態素は必ず1つのランにまとまっている。レビューごとに
+        # (ランの番号, ラン内の開始・終了位置) を引けるので、追加のたびに表全体を並べ直さない
+        self._runs = []
+        self._parsed = np.zeros(0, dtype=bool)
+        self._run_of = np.zeros(0, dtype=np.int32)
+        self._start = np.zeros(0, dtype=np.int64)
+        self._end = np.zeros(0, dtype=np.int64)
+
+        self._reserve(n_reviews)
+        self.n_reviews = n_reviews
+        self._parsed[:n_reviews] = True if parsed is None else parsed
+        self._append_run(np.asarray(review_id, dtype=np.int32), np.asarray(position, dtype=np.int32),
+                         {name: np.asarray(columns[name], dtype=np.int32) for name in STRING_COLUMNS},
+                         np.flatnonzero(self._parsed[:n_reviews]))
+
+    @property
+    def parsed(self):
+        """行ごとに解析済みかどうかの bool 配列"""
+        return self._parsed[:self.n_reviews]
+
+    def __len__(self):
+        return self.n_reviews
+
+    def _reserve(self, n_reviews):
+        """行ごとの配列を n_reviews 行以上に広げる (チャンクごとの追加で毎回コピーしないよう倍々に確保する)"""
+        capacity = len(self._parsed)
+        if n_reviews <= capacity:
+            return
+        capacity = max(n_reviews, 2 * capacity, 1024)
+        grow = capacity - len(self._parsed)
+        self._parsed = np.concatenate([self._parsed, np.zeros(grow, dtype=bool)])
+        self._run_of = np.concatenate([self._run_of, np.full(grow, -1, dtype=np.int32)])
+        self._start = np.concatenate([self._start, np.zeros(grow, dtype=np.int64)])
+        self._end = np.concatenate([self._end, np.zeros(grow, dtype=np.int64)])
+
+    def _append_run(self, review_id, position, columns, rows):
+        """review_id の昇順に並んだ形態素の列を1つのランとして加え、rows の各行の範囲を記録する"""
+        run = len(self._runs)
+        self._runs.append({'review_id': review_id, 'position': position, **columns})
+        rows = np.asarray(rows, dtype=np.int64)
+        self._run_of[rows] = run
+        self._start[rows] = np.searchsorted(review_id, rows, side='left')
+        self._end[rows] = np.searchsorted(review_id, rows, side='right')
+
+    def _merged(self):
+        """全ランを review_id の昇順に並べた1つの列にまとめる (保存時に1回だけ行う)"""
+        if len(self._runs) == 1:
+            return self._runs[0]
+        review_id = np.concatenate([run['review_id'] for run in self._runs])
+        # 1つのレビューの形態素は1つのランにあるので、安定ソートでレビュー内の順序は保たれる
+        order = np.argsort(review_id, kind='stable')
+        return {key: np.concatenate([run[key] for run in self._runs])[order] for key in self._runs[0]}
+
+    def _lookup(self, name):
+        lookup = self._lookups.get(name)
+        if lookup is None:
+            lookup = self._lookups[name] = {value: i for i, value in enumerate(self.vocabularies[name])}
+        return lookup
+
+    @classmethod
+    def empty(cls, meta=None, path=None):
+        """解析済みの行が1つも無い表"""
+        columns = {name: np.zeros(0, dtype=np.int32) for name in STRING_COLUMNS}
+        vocabularies = {name: [] for name in STRING_COLUMNS}
+        return cls(np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), columns, vocabularies, 0,
+                   meta, np.zeros(0, dtype=bool), path)
+
+    @classmethod
+    def from_morphemes(cls, morphemes_list, meta=None):
+        """レビューごとの (表層形, 品詞, 原形, 読み) リストから表を作る (None は空のレビュー)"""
+        table = cls.empty(meta)
+        table.add_reviews(range(len(morphemes_list)), morphemes_list)
+        table.modified = False
+        return table
+
+    def missing(self, review_ids):
+        """review_ids のうち、まだ解析していない行"""
+        n = self.n_reviews
+        parsed = self._parsed
+        return [i for i in review_ids if i >= n or not parsed[i]]
+
+    def add_reviews(self, review_ids, morphemes_list):
+        """
+        まだ解析していない行 review_ids の (表層形, 品詞, 原形, 読み) リストを表に加える
+        (None は空のレビュー。解析済みの行は無視する)。既存の語彙番号は変えず、新しい語だけ語彙の末尾に足す。
+        追加した行は1つのランになり、既存の行は並べ直さない (コストは追加した形態素の数に比例する)。
+        """
+        pairs = [(i, morphemes) for i, morphemes in zip(review_ids, morphemes_list)
+                 if i >= self.n_reviews or not self._parsed[i]]
+        if not pairs:
+            return
+        lookups = {name: self._lookup(name) for name in STRING_COLUMNS}
+        vocabularies = self.vocabularies
+        ids = {name: [] for name in STRING_COLUMNS}
+        review_id = []
+        position = []
+        for i, morphemes in pairs:
+            for j, (surface, pos, base, reading) in enumerate(morphemes or ()):
+                review_id.append(i)
+                position.append(j)
+                for name, value in zip(STRING_COLUMNS, (surface, base, reading, pos)):
+                    lookup = lookups[name]
+                    index = lookup.get(value)
+                    if index is None:
+                        index = lookup[value] = len(vocabularies[name])
+                        vocabularies[name].append(value)
+                    ids[name].append(index)
+
+        # ランの中だけを review_id の昇順に並べる (同じ行の中の順序は保つ)
+        review_id = np.asarray(review_id, dtype=np.int32)
+        order = np.argsort(review_id, kind='stable')
+        rows = [i for i, _ in pairs]
+        n_reviews = max(self.n_reviews, max(rows) + 1)
+        self._reserve(n_reviews)
+        self.n_reviews = n_reviews
+        self._append_run(review_id[order], np.asarray(position, dtype=np.int32)[order],
+                         {name: np.asarray(ids[name], dtype=np.int32)[order] for name in STRING_COLUMNS}, rows)
+        self._parsed[rows] = True
+        self.modified = True
+
+    def ensure(self, texts, tagger, workers=1, cache=None):
+        """
+        texts (CSVの行番号をインデックスとするレビュー列の pandas.Series) のうち、まだ表に無い行を
+        全品詞で解析して加える。文字列でない行は空のレビューとして扱う。解析した行数を返す。
+        """
+        rows = self.missing(texts.index)
+        if not rows:
+            return 0
+        values = texts.loc[rows].tolist()
+        targets = [k for k, text in enumerate(values) if isinstance(text, str)]
+        parsed = tokenize_reviews([values[k] for k in targets], tagger, workers=workers, cache=cache)
+        morphemes_list = [None] * len(rows)
+        for k, morphemes in zip(targets, parsed):
+            morphemes_list[k] = morphemes
+        self.add_reviews(rows, morphemes_list)
+        return len(targets)
+
+    def _pos_mask(self, run, target_pos):
+        """ラン run の各形態素が target_pos の品詞かどうか (ランは変更しないので一度だけ求める)"""
+        key = (run, frozenset(target_pos))
+        mask = self._masks.get(key)
+        if mask is None:
+            pos_vocab = self.vocabularies['pos']
+            wanted = [i for i, pos in enumerate(pos_vocab) if pos in target_pos]
+            mask = self._masks[key] = np.isin(self._runs[run]['pos'], wanted)
+        return mask
+
+    def select(self, review_ids=None, target_pos=None):
+        """
+        指定したレビュー (省略時はすべて) の (表層形, 品詞, 原形, 読み) リストを順に返す。
+        target_pos を指定するとその品詞の形態素だけを返す。
+        """
+        return list(self.iter_select(review_ids, target_pos))
+
+    def iter_select(self, review_ids=None, target_pos=None):
+        """select と同じ内容を1レビューずつ返す (全レビュー分のリストを作らない)"""
+        if review_ids is None:
+            review_ids = range(self.n_reviews)
+        n = self.n_reviews
+        surface_vocab = self.vocabularies['surface']
+        base_vocab = self.vocabularies['base']
+        reading_vocab = self.vocabularies['reading']
+        pos_vocab = self.vocabularies['pos']
+
+        for i in review_ids:
+            run = self._run_of[i] if i < n else -1
+            if run < 0:
+                yield []
+                continue
+            columns = self._runs[run]
+            start, end = self._start[i], self._end[i]
+            if target_pos is None:
+                rows = slice(start, end)
+            else:
+                rows = np.nonzero(self._pos_mask(run, target_pos)[start:end])[0] + start
+            yield [
+                (surface_vocab[s], pos_vocab[p], base_vocab[b], reading_vocab[r])
+                for s, p, b, r in zip(columns['surface'][rows].tolist(), columns['pos'][rows].tolist(),
+                                      columns['base'][rows].tolist(), columns['reading'][rows].tolist())
+            ]
+
+    def save(self, path=None):
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # 追加したランはここで1回だけ並べ直して1つにまとめる
+        merged = self._merged()
+        self._runs = []
+        self._masks = {}
+        self._append_run(merged['review_id'], merged['position'], {name: merged[name] for name in STRING_COLUMNS},
+                         np.flatnonzero(self.parsed))
+        arrays = {'review_id': merged['review_id'], 'position': merged['position'], 'parsed': self.parsed}
+        for name in STRING_COLUMNS:
+            arrays[name] = merged[name]
+            arrays[f'{name}_vocabulary'] = _encode_json(self.vocabularies[name])
+        arrays['meta'] = _encode_json(dict(self.meta, n_reviews=self.n_reviews, version=FORMAT_VERSION))
+        # 同じ表を複数のスクリプトや作品ごとのプロセスが同時に保存することがあるため、
+        # 一時ファイルは保存ごとに別の名前で同じディレクトリに作り、書き終えてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path), suffix='.tmp.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.modified = False
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = _decode_json(data['meta'])
+            columns = {name: data[name] for name in STRING_COLUMNS}
+            vocabularies = {name: _decode_json(data[f'{name}_vocabulary']) for name in STRING_COLUMNS}
+            parsed = data['parsed'] if 'parsed' in data else None
+            return cls(data['review_id'], data['position'], columns, vocabularies, meta['n_reviews'], meta,
+                       parsed, path)
+
+
+def table_path(csv_path, column, table_dir=TOKEN_TABLE_DIR):
+    key = hashlib.sha1(f"{os.path.abspath(csv_path)}\0{column}".encode('utf-8')).hexdigest()[:16]
+    return os.path.join(table_dir, f'{key}.npz')
+
+
+def source_signature(csv_path, column, tagger):
+    """トークン表を使い回せるかを判定するための、入力CSVとMeCab辞書の情報"""
+    stat = os.stat(csv_path)
+    return {
+        'path': os.path.abspath(csv_path),
+        'column': column,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'dictionary': dictionary_identity(tagger),
+    }
+
+
+def open_token_table(csv_path, column, tagger, table_dir=TOKEN_TABLE_DIR):
+    """
+    CSVのレビュー列に対応する保存済みのトークン表を返す。保存済みの表が無いか、
+    CSVや辞書が変わっている場合は空の表を返す。CSVを開けない場合は None。
+    """
+    try:
+        signature = source_signature(csv_path, column, tagger)
+    except OSError as e:
+        print(f"エラー: {csv_path} を開けませんでした: {e}")
+        return None
+
+    path = table_path(csv_path, column, table_dir)
+    if os.path.exists(path):
+        try:
+            table = TokenTable.load(path)
+            if table.meta.get('version') == FORMAT_VERSION and table.meta.get('signature') == signature:
+                return table
+        except Exception as e:
+            # 保存の中断やディスク不足で壊れたファイル (BadZipFile, EOFError など) も作り直す
+            print(f"⚠️ トークン表 {path} を読み込めませんでした ({e})。作り直します。")
+    return TokenTable.empty(meta={'signature': signature}, path=path)
+
+
+def load_token_table(csv_path, column, tagger, texts=None, workers=1, cache=None, table_dir=TOKEN_TABLE_DIR):
+    """
+    トークン表を開き、texts の行をすべて解析済みにして返す (行を追加した場合は保存する)。
+    texts は呼び出し側で読み込んだレビュー列 (CSVの行番号をインデックスとする pandas.Series) で、
+    分析に使う行だけを渡せばよい。省略するとCSVのレビュー列をチャンクごとに読み、すべての行を解析する。
+    CSVが読めない場合は None。
+    """
+    table = open_token_table(csv_path, column, tagger, table_dir)
+    if table is None:
+        return None
+    try:
+        if texts is None:
+            for chunk in iter_csv_chunks(csv_path, usecols=[column]):
+                table.ensure(chunk[column], tagger, workers=workers, cache=cache)
+        else:
+            table.ensure(texts, tagger, workers=workers, cache=cache)
+    except Exception as e:
+        print(f"エラー: {csv_path} のトークン表を作成できませんでした: {e}")
+        return None
+    if table.modified:
+        table.save()
+    return table
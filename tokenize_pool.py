@@ -0,0 +1,101 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from token_cache import filter_pos, parse_many
+
+# ==========================================
+# マルチプロセスでの形態素解析
+# ==========================================
+# MeCab.Tagger はプロセスごとに1つ持たせ、レビューを文字数がほぼ等しい
+# チャンクに分けてワーカーへ配る。結果は入力と同じ順序で返す。
+# キャッシュ (token_cache.TokenCache) の読み書きは親プロセスだけが行い、
+# ワーカーにはキャッシュに無かったレビューだけを渡す。キャッシュには全品詞の形態素を
+# 保存するので、キャッシュを使う場合は全品詞で解析してから品詞フィルタを適用する。
+
+MIN_CHUNK_CHARS = 20000  # 1チャンクあたりの最小文字数 (小さすぎると転送コストが勝つ)
+CHUNKS_PER_WORKER = 8    # ワーカー1つあたりのチャンク数 (長さの偏りをならすため)
+
+_worker_tagger = None
+
+
+def _init_worker(tagger_args):
+    global _worker_tagger
+    import MeCab
+    _worker_tagger = MeCab.Tagger(tagger_args)
+
+
+def _tokenize_chunk(args):
+    texts, target_pos = args
+    # 解析に失敗したレビューは None を返し、呼び出し側で空リストとして扱う
+    return parse_many(_worker_tagger, texts, target_pos)
+
+
+def balanced_chunks(texts, n_chunks):
+    """入力順を保ったまま、合計文字数がほぼ等しくなるようにチャンクへ分割する"""
+    total_chars = sum(len(t) for t in texts)
+    target = max(total_chars / max(n_chunks, 1), MIN_CHUNK_CHARS)
+
+    chunks = []
+    current = []
+    current_chars = 0
+    for text in texts:
+        current.append(text)
+        current_chars += len(text)
+        if current_chars >= target:
+            chunks.append(current)
+            current = []
+            current_chars = 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def tokenize_reviews(texts, tagger, target_pos=None, workers=1, cache=None, tagger_args=''):
+    """
+    複数のレビューを形態素解析し、各レビューの (表層形, 品詞, 原形, 読み) リストを
+    入力順に返す。workers > 1 の場合はプロセスプールで並列に解析する。
+    解析に失敗したレビューは None になる。
+    """
+    results = [None] * len(texts)
+    keys = [None] * len(texts)
+    pending = []
+
+    for i, text in enumerate(texts):
+        if cache is not None:
+            keys[i] = cache.make_key(text, tagger)
+            cached = cache.get(keys[i])
+            if cached is not None:
+                results[i] = filter_pos(cached, target_pos)
+                continue
+        pending.append(i)
+
+    if cache is not None:
+        # 解析の間に書き込みロックを持ち続けないよう、ここまでの更新を確定する
+        # (作品ごとの並行処理では、他のプロセスが同じキャッシュに書き込む)
+        cache.flush()
+    if not pending:
+        return results
+
+    # コピー&ペーストされた同じ文面のレビューは1回だけ解析する
+    unique_texts = list(dict.fromkeys(texts[i] for i in pending))
+    parse_pos = target_pos if cache is None else None
+    if workers <= 1:
+        parsed = parse_many(tagger, unique_texts, parse_pos)
+    else:
+        chunks = balanced_chunks(unique_texts, workers * CHUNKS_PER_WORKER)
+        parsed = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tagger_args,)) as executor:
+            # map は投入順に結果を返すので、チャンクを連結すれば入力順に戻る
+            for chunk_result in executor.map(_tokenize_chunk, [(chunk, parse_pos) for chunk in chunks]):
+                parsed.extend(chunk_result)
+    parsed_by_text = dict(zip(unique_texts, parsed))
+
+    stored = set()
+    for i in pending:
+        morphemes = parsed_by_text[texts[i]]
+        if cache is not None and morphemes is not None and keys[i] not in stored:
+            cache.put(keys[i], morphemes)
+            stored.add(keys[i])
+        results[i] = filter_pos(morphemes, target_pos) if cache is not None else morphemes
+    if cache is not None:
+        cache.flush()
+    return results
@@ -1,13 +1,36 @@
 import pandas as pd
 import MeCab
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import argparse
+from functools import partial
+from plotting import pyplot, set_headless, show
+from csv_reader import force_read_csv
+from incremental_state import IncrementalState, fingerprint
+from instrumentation import PipelineProfiler
+from inverted_index import InvertedIndex
+from lexicon_matcher import LexiconMatcher
+from morpheme_memo import MorphemeMemo
+from near_duplicates import DEFAULT_THRESHOLD, appended_representatives
+from token_corpus import TokenCorpus
+from token_cache import dictionary_identity, get_token_cache
+from token_table import load_token_table
+from tokenize_pool import tokenize_reviews
+from title_pool import run_titles
 
 # ==========================================
 # 0. Windows用フォント設定
 # ==========================================
-plt.rcParams['font.family'] = 'MS Gothic'
+# グラフを描くときに反映する
+CHART_RC = {'font.family': 'MS Gothic'}
+
+# ファイル設定
+file_config = [
+    {'title': 'SV', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\SVシナリオレビュー''.csv', 'review_col': 'シナリオ小文章'},
+    {'title': '剣盾', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\剣盾シナリオ文.csv', 'review_col': 'シナリオ一文'},
+    {'title': 'USUM', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\sm_usumシナリオ文.csv', 'review_col': 'シナリオ文'},
+    {'title': 'XY', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\XYシナリオ文.csv', 'review_col': 'シナリオ'}
+]
 
 # ==========================================
 # 1. 辞書定義（修正版を適用）
@@ -48,19 +71,43 @@ STOP_WORDS = {
     "ゲーム", "ポケモン", "シリーズ", "プレイ",
 }
 
+# 名詞、形容詞、動詞、形状詞、副詞、形容動詞、助動詞 を対象
+TARGET_POS = ["名詞", "形容詞", "動詞", "形状詞", "副詞", "形容動詞", "助動詞"]
+
+# 感情辞書を1つのオートマトンにまとめる
+# 「ヒョウカデキナイ」のように複数の形態素にまたがる語を一致させるために使う
+LEXICON_MATCHER = LexiconMatcher([
+    ("Negative", NEGATIVE_WORDS_SET),
+    ("Positive", POSITIVE_WORDS_SET),
+])
+
+
+# 処理段階ごとの計測 (results/cooccurrence_timings.json に出力)
+profiler = PipelineProfiler('cooccurrence')
+
 
 # ==========================================
 # 2. 分析クラス定義
 # ==========================================
 
 class CooccurrenceAnalyzer:
-    def __init__(self):
+    def __init__(self, workers=1):
+        # workers > 1 の場合、analyze ではプロセス並列で形態素解析する
+        self.workers = workers
         try:
             self.tagger = MeCab.Tagger()
         except Exception as e:
             print(f"Error: MeCabの初期化に失敗しました: {e}")
             import sys
             sys.exit(1)
+        # 形態素解析結果のキャッシュ (他のスクリプトと共有)
+        self.token_cache = get_token_cache()
+        # 異なり形態素ごとの照合候補と対象品詞かどうか (ストップワードの判定済み)
+        self.morpheme_memo = MorphemeMemo(self._morpheme_entry)
+        # 作品ごとに build_index で作る転置インデックスとレビューごとのポジネガ数
+        self.index = None
+        self.pos_counts = None
+        self.neg_counts = None
 
     def _get_tokens(self, text):
         """
@@ -68,37 +115,83 @@ class CooccurrenceAnalyzer:
         """
         if not isinstance(text, str):
             return set()
-        
+
+        # 複数形態素にまたがる辞書語を照合するため、品詞で絞らずに全形態素を取得
+        morphemes = self.token_cache.morphemes(self.tagger, text)
+        return self._tokens_from_morphemes(morphemes)
+
+    def _tokenize_column(self, texts, table=None):
+        """
+        レビュー列をまとめてトークン化し、レビューごとのトークン集合を
+        語彙番号のコーパス (token_corpus.TokenCorpus) として返す (workers > 1 でプロセス並列)。
+        table (token_table.TokenTable) を渡すと、列のインデックスをCSVの行番号として
+        トークン表から形態素を取り出し、MeCabは呼ばない。
+        """
+        row_ids = list(texts.index) if table is not None else None
+        texts = list(texts)
+        targets = [i for i, text in enumerate(texts) if isinstance(text, str)]
+        with profiler.stage('tokenize', items=len(targets)):
+            if table is not None:
+                morphemes_list = table.select([row_ids[i] for i in targets])
+            else:
+                morphemes_list = tokenize_reviews([texts[i] for i in targets], self.tagger,
+                                                  workers=self.workers, cache=self.token_cache)
+        def review_tokens():
+            parsed = iter(morphemes_list)
+            for text in texts:
+                morphemes = next(parsed) if isinstance(text, str) else None
+                yield self._tokens_from_morphemes(morphemes) if morphemes is not None else set()
+
+        with profiler.stage('filter', items=len(targets)):
+            return TokenCorpus.from_token_lists(review_tokens())
+
+    @staticmethod
+    def _morpheme_entry(morpheme):
+        """1つの形態素の (照合候補の集合, 対象品詞かどうか)。ストップワードなら候補は None"""
+        surface, pos, base_form, reading = morpheme
+        is_target = pos in TARGET_POS
+        # ストップワード判定 (照合の区切りとして扱う)
+        if is_target and surface in STOP_WORDS:
+            return None, is_target
+        return frozenset(c for c in (surface, base_form, reading) if c), is_target
+
+    def _tokens_from_morphemes(self, morphemes):
+        """形態素列から表層形・原形・読みのトークンセットを作る"""
         tokens = set()
-        node = self.tagger.parseToNode(text)
-        
-        while node:
-            features = node.feature.split(',')
-            pos = features[0]
+
+        stream = []
+        standalone = []
+        memo = self.morpheme_memo
+        for morpheme in morphemes:
+            candidates, is_target = memo[morpheme]
+            stream.append(candidates)
+            standalone.append(is_target)
+
+        # 複数形態素にまたがる辞書語は、その語自体をトークンとして追加する。
+        # 構成する形態素の原形・読みは追加しない (「ナイ」などの二重カウントを防ぐ)
+        covered = set()
+        for start, end, label, word in LEXICON_MATCHER.find(stream, standalone):
+            if end - start > 1:
+                tokens.add(word)
+                covered.update(range(start, end))
+
+        for i, (surface, pos, base_form, reading) in enumerate(morphemes):
+            if stream[i] is None or not standalone[i]:
+                continue
+
+            # 表層形（漢字など）を追加
+            tokens.add(surface)
+            if i in covered:
+                continue
             
-            # 名詞、形容詞、動詞、形状詞、副詞、形容動詞、助動詞 を対象
-            target_pos = ["名詞", "形容詞", "動詞", "形状詞", "副詞", "形容動詞", "助動詞"]
+            # 原形（基本形）を追加
+            if base_form:
+                tokens.add(base_form)
             
-            if pos in target_pos:
-                surface = node.surface
-                
-                # ストップワード判定
-                if surface in STOP_WORDS:
-                    node = node.next
-                    continue
-
-                # 表層形（漢字など）を追加
-                tokens.add(surface)
-                
-                # 原形（基本形）を追加
-                if len(features) > 6 and features[6] != "*":
-                    tokens.add(features[6])
-                
-                # 読み（カタカナ）を追加 -> これが辞書とのマッチングに重要
-                if len(features) > 7 and features[7] != "*":
-                    tokens.add(features[7])
-
-            node = node.next
+            # 読み（カタカナ）を追加 -> これが辞書とのマッチングに重要
+            if reading:
+                tokens.add(reading)
+
         return tokens
 
     def calculate_sentiment_counts(self, tokens):
@@ -118,91 +211,200 @@ class CooccurrenceAnalyzer:
             
         return pos_count, neg_count
 
-    def analyze(self, df, text_col):
-        cooccurrence_scores = {}
+    def build_index(self, token_sets):
+        """
+        トークン → レビュー番号 の転置インデックスと、レビューごとのポジネガ数を作る。
+        一度作れば、評価語群を変えても score_aspects だけで再計算できる。
+        token_sets はトークン集合の列か、集合を格納した TokenCorpus。
+        """
+        if isinstance(token_sets, TokenCorpus):
+            with profiler.stage('index', items=len(token_sets)):
+                self.index = InvertedIndex.from_corpus(token_sets)
+                # レビュー内のトークンは重複しないので、辞書語の数がそのまま積集合の大きさになる
+                self.pos_counts = token_sets.count_in(POSITIVE_WORDS_SET)
+                self.neg_counts = token_sets.count_in(NEGATIVE_WORDS_SET)
+            return
+
+        token_sets = list(token_sets)
+        with profiler.stage('index', items=len(token_sets)):
+            self.index = InvertedIndex(token_sets)
+            counts = [self.calculate_sentiment_counts(tokens) for tokens in token_sets]
+            self.pos_counts = np.array([c[0] for c in counts], dtype=np.int64)
+            self.neg_counts = np.array([c[1] for c in counts], dtype=np.int64)
+
+    def index_reviews(self, df, text_col, table=None):
+        """レビュー列をトークン化し、転置インデックスを作る"""
+        self.build_index(self._tokenize_column(df[text_col], table))
+
+    def analyze(self, df, text_col, aspects=None, table=None):
         print("\n--- 共起分析を実行中 ---")
         
         # 前処理：各レビューをトークン化しておく
-        df['tokens'] = df[text_col].apply(self._get_tokens)
+        self.index_reviews(df, text_col, table)
 
-        # 4つの評価語群（構成語・人物語・テーマ語・体験語）ごとにループ
-        for aspect_name, aspect_words in ASPECTS.items():
-            
-            # その評価語が含まれているレビューを抽出
-            # トークンセットの中に、評価語のいずれかが含まれているか
-            target_mask = df['tokens'].apply(lambda t: not t.isdisjoint(set(aspect_words)))
-            target_reviews = df[target_mask]
-            
-            total_reviews_count = len(target_reviews)
-            
-            if total_reviews_count == 0:
-                cooccurrence_scores[aspect_name] = 0.0
-                continue
-                
-            total_pos = 0
-            total_neg = 0
-            
+        with profiler.stage('score', items=len(df)):
+            return self.score_aspects(aspects)
+
+    def aspect_totals(self, aspects=None):
+        """
+        評価語群ごとの (評価語を含むレビュー数, ポジティブ総数, ネガティブ総数) を返す。
+        レビューの集合が重ならなければ、別々に求めた値を足し合わせられる。
+        """
+        if aspects is None:
+            aspects = ASPECTS
+        totals = {}
+        for aspect_name, aspect_words in aspects.items():
+            # その評価語のいずれかを含むレビュー (ポスティングリストの和集合)
+            target_ids = self.index.any_of(aspect_words)
             # 対象レビューのポジネガ数を合計
-            for tokens in target_reviews['tokens']:
-                p, n = self.calculate_sentiment_counts(tokens)
-                total_pos += p
-                total_neg += n
-            
-            # 正規化スコア計算: (ポジティブ総数 - ネガティブ総数) / 評価語を含むレビュー総数
-            score = (total_pos - total_neg) / total_reviews_count
-            cooccurrence_scores[aspect_name] = score
-            
-            print(f"項目[{aspect_name}]: 対象レビュー数={total_reviews_count}, Pos={total_pos}, Neg={total_neg}, Score={score:.4f}")
+            totals[aspect_name] = (len(target_ids),
+                                   int(self.pos_counts[target_ids].sum()),
+                                   int(self.neg_counts[target_ids].sum()))
+        return totals
 
-        return cooccurrence_scores
+    def score_aspects(self, aspects=None):
+        """
+        build_index 済みのインデックスに対して評価語群ごとのスコアを計算する。
+        aspects を省略すると ASPECTS (構成語・人物語・テーマ語・体験語) を使う。
+        """
+        return scores_from_totals(self.aspect_totals(aspects))
 
-def force_read_csv(file_path):
-    for encoding in ['utf-8', 'shift_jis', 'cp932']:
-        try:
-            return pd.read_csv(file_path, encoding=encoding)
-        except:
+
+def scores_from_totals(totals):
+    """評価語群ごとの (レビュー数, ポジティブ総数, ネガティブ総数) から正規化スコアを求める"""
+    cooccurrence_scores = {}
+
+    for aspect_name, (total_reviews_count, total_pos, total_neg) in totals.items():
+        if total_reviews_count == 0:
+            cooccurrence_scores[aspect_name] = 0.0
             continue
-    return None
+
+        # 正規化スコア計算: (ポジティブ総数 - ネガティブ総数) / 評価語を含むレビュー総数
+        score = (total_pos - total_neg) / total_reviews_count
+        cooccurrence_scores[aspect_name] = score
+
+        print(f"項目[{aspect_name}]: 対象レビュー数={total_reviews_count}, Pos={total_pos}, Neg={total_neg}, Score={score:.4f}")
+
+    return cooccurrence_scores
 
 # ==========================================
 # 3. 実行メイン処理
 # ==========================================
 
-def main():
+def analyze_title(config, state, workers=1, analyzer=None, dedup_threshold=None):
+    """
+    1作品分のCSVを解析して評価語群ごとのスコアを計算する (作品ごとの並行処理の単位)。
+    state (IncrementalState) を使って追記分だけを解析し、(スコア, 更新後の作品の状態) を返す。
+    CSVが読めなかった場合のスコアは None。analyzer を省略すると新しく作る (子プロセス用)。
+    dedup_threshold を指定すると、類似度がそれ以上のレビューはグループの代表1件だけを数える
+    (代表が処理済みの行なら、そのグループは前回までに数えている)。
+    """
+    if analyzer is None:
+        analyzer = CooccurrenceAnalyzer(workers=workers)
+    title = config['title']
+    path = config['path']
+    col = config['review_col']
+    
+    print(f"\n========== {title} の分析を開始 ==========")
+    
+    # 分析に使うのはレビュー列だけなので、その列のみ読み込む
+    profiler.set_title(title)
+    with profiler.stage('load') as stage:
+        try:
+            df = force_read_csv(path, usecols=[col])
+        except ValueError as e:
+            print(f"エラー: {e}")
+            return None, state.entry(title)
+        stage.items = len(df) if df is not None else 0
+    if df is None:
+        print(f"エラー: {path} が読み込めませんでした。")
+        return None, state.entry(title)
+
+    # 前回までに処理した行はスキップする
+    row_texts = df[col].astype(str).tolist()
+    start = state.start_row(title, row_texts, df.columns)
+    aggregates = state.aggregates(title) if start > 0 else None
+    if aggregates is None:
+        start = 0
+        aggregates = {aspect: [0, 0, 0] for aspect in ASPECTS}
+    else:
+        print(f"処理済み {start} 行をスキップし、追加の {len(df) - start} 行を解析します。")
+
+    # データクリーニング (重複除去では処理済みの行とも比べるため、全行に対して行う)
+    clean_df = df.dropna(subset=[col]).copy()
+    clean_df[col] = clean_df[col].astype(str).replace('nan', '')
+    clean_df = clean_df[clean_df[col].str.len() > 1]
+    new_df = clean_df[clean_df.index >= start]
+
+    # 重複・類似レビューはグループの代表1件だけを数える (形態素解析の前に除く)
+    if dedup_threshold is not None:
+        n_seen = len(clean_df) - len(new_df)
+        with profiler.stage('dedup', items=len(clean_df)):
+            representatives = appended_representatives(clean_df[col].tolist(), n_seen, dedup_threshold)
+        is_representative = representatives == np.arange(n_seen, len(clean_df))
+        n_duplicates = len(new_df) - int(is_representative.sum())
+        print(f"🔁 {title}: 重複・類似レビュー {n_duplicates} / {len(new_df)} 件 "
+              f"({n_duplicates / max(len(new_df), 1):.1%}) をまとめて集計します。")
+        new_df = new_df[is_representative]
+
+    # 形態素解析はトークン表として行い、他の分析と共有する (追加分のうち、まだ表に無い行だけを解析する)
+    table = load_token_table(path, col, analyzer.tagger, texts=new_df[col], workers=analyzer.workers,
+                             cache=analyzer.token_cache)
+
+    # 分析実行 (追加分のみ) し、評価語群ごとの集計に足し込む
+    print("\n--- 共起分析を実行中 ---")
+    analyzer.index_reviews(new_df, col, table)
+    with profiler.stage('score', items=len(new_df)):
+        for aspect, new_totals in analyzer.aspect_totals().items():
+            totals = aggregates.setdefault(aspect, [0, 0, 0])
+            for k, value in enumerate(new_totals):
+                totals[k] += value
+        scores = scores_from_totals({aspect: tuple(aggregates[aspect]) for aspect in ASPECTS})
+
+    state.update(title, row_texts, df.columns, aggregates)
+    return scores, state.entry(title)
+
+
+def main(workers=1, incremental=False, title_workers=1, charts=True, headless=False, dedup_threshold=None):
+    """
+    incremental=True の場合、前回の実行以降にCSVへ追記された行だけを解析し、
+    保存済みの評価語群ごとの集計 (results/state/cooccurrence_state.json) に足し込む。
+    dedup_threshold を指定すると、重複・類似レビューを1件として数える (analyze_title を参照)。
+    title_workers > 1 の場合、作品ごとの解析を別プロセスで並行に実行する。
+    charts=False の場合は棒グラフを作らず (matplotlib を読み込まない)、
+    headless=True の場合は画面を使わずに描画してファイルに保存する (ウィンドウを開かない)。
+    """
+    set_headless(headless)
     if not os.path.exists('results'):
         os.makedirs('results')
 
-    analyzer = CooccurrenceAnalyzer()
+    # プロセスの入れ子を避けるため、作品を並行に処理する場合の形態素解析は各作品の中では並列化しない
+    analyzer = CooccurrenceAnalyzer(workers=workers if title_workers <= 1 else 1)
+    # トークンの絞り込みに使う辞書 (評価語群・感情辞書・ストップワード・対象品詞) や
+    # MeCab辞書が変わった場合は保存済みの集計を使わない
+    # 重複除去の有無で集計が変わる (除去しない場合は従来と同じ値にして、保存済みの集計を使えるようにする)
+    dedup = () if dedup_threshold is None else (('dedup', dedup_threshold),)
+    state = IncrementalState('cooccurrence', fingerprint(
+        ASPECTS, POSITIVE_WORDS_SET, NEGATIVE_WORDS_SET, STOP_WORDS, TARGET_POS,
+        dictionary_identity(analyzer.tagger), *dedup))
+    if not incremental:
+        state.reset()
     all_cooccurrence_scores = {}
 
-    # ファイル設定
-    file_config = [
-    {'title': 'SV', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\SVシナリオレビュー''.csv', 'review_col': 'シナリオ小文章'},
-    {'title': '剣盾', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\剣盾シナリオ文.csv', 'review_col': 'シナリオ一文'},
-    {'title': 'USUM', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\sm_usumシナリオ文.csv', 'review_col': 'シナリオ文'},
-    {'title': 'XY', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\XYシナリオ文.csv', 'review_col': 'シナリオ'}
-]
+    # 子プロセスには MeCab の Tagger を渡せないため、並行時は各プロセスで analyzer を作る
+    title_task = partial(analyze_title, state=state, workers=analyzer.workers,
+                         analyzer=analyzer if title_workers <= 1 else None, dedup_threshold=dedup_threshold)
+    results = run_titles(title_task, file_config, concurrency=title_workers)
 
-    for config in file_config:
-        title = config['title']
-        path = config['path']
-        col = config['review_col']
-        
-        print(f"\n========== {title} の分析を開始 ==========")
-        
-        df = force_read_csv(path)
-        if df is None:
-            print(f"エラー: {path} が読み込めませんでした。")
-            continue
-            
-        # データクリーニング
-        df = df.dropna(subset=[col])
-        df[col] = df[col].astype(str).replace('nan', '')
-        df = df[df[col].str.len() > 1]
+    # 結果は file_config の順に反映する
+    for config, (scores, entry) in zip(file_config, results):
+        state.restore(config['title'], entry)
+        if scores is not None:
+            all_cooccurrence_scores[config['title']] = scores
+
+    state.save()
 
-        # 分析実行
-        scores = analyzer.analyze(df, col)
-        all_cooccurrence_scores[title] = scores
+    profiler.set_title(None)
 
     # グラフ作成
     if all_cooccurrence_scores:
@@ -216,19 +418,39 @@ def main():
         print(df_scores)
         
         # CSV保存
-        df_scores.to_csv('results/cooccurrence_scores_final.csv', encoding='utf-8-sig')
+        with profiler.stage('write_csv', items=len(df_scores)):
+            df_scores.to_csv('results/cooccurrence_scores_final.csv', encoding='utf-8-sig')
 
         # 棒グラフ描画
-        ax = df_scores.plot(kind='bar', figsize=(12, 6), width=0.8)
-        plt.title("作品別 評価語群スコア比較 (修正版)")
-        plt.ylabel("正規化スコア")
-        plt.axhline(0, color='black', linewidth=0.8)
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.tight_layout()
-        plt.savefig('results/cooccurrence_chart_final.png')
-        plt.show()
-        print("  -> グラフ保存完了: results/cooccurrence_chart_final.png")
+        if charts:
+            with profiler.stage('chart', items=len(df_scores)):
+                plt = pyplot(CHART_RC)
+                ax = df_scores.plot(kind='bar', figsize=(12, 6), width=0.8)
+                plt.title("作品別 評価語群スコア比較 (修正版)")
+                plt.ylabel("正規化スコア")
+                plt.axhline(0, color='black', linewidth=0.8)
+                plt.grid(axis='y', linestyle='--', alpha=0.7)
+                plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+                plt.tight_layout()
+                plt.savefig('results/cooccurrence_chart_final.png')
+            print("  -> グラフ保存完了: results/cooccurrence_chart_final.png")
+
+        profiler.print_summary()
+        report_path = profiler.write_report()
+        print(f"  -> 処理時間の計測結果を保存: {report_path}")
+
+        show()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='作品別 評価語群の共起分析')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析に使うプロセス数')
+    parser.add_argument('--incremental', action='store_true',
+                        help='前回の実行以降に追記された行だけを解析し、保存済みの集計に足し込む')
+    parser.add_argument('--title-workers', type=int, default=1, help='作品を並行して処理するプロセス数')
+    parser.add_argument('--no-charts', action='store_true', help='グラフを作らない (matplotlib を読み込まない)')
+    parser.add_argument('--headless', action='store_true', help='画面を使わずにグラフを描画してファイルに保存する')
+    parser.add_argument('--dedup', type=float, nargs='?', const=DEFAULT_THRESHOLD, default=None, metavar='THRESHOLD',
+                        help=f'類似度 THRESHOLD (省略時 {DEFAULT_THRESHOLD}) 以上の重複・類似レビューを1件として数える')
+    args = parser.parse_args()
+    main(workers=args.workers, incremental=args.incremental, title_workers=args.title_workers,
+         charts=not args.no_charts, headless=args.headless, dedup_threshold=args.dedup)
\ No newline at end of file
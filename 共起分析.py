@@ -1,9 +1,22 @@
 import pandas as pd
 import MeCab
 from collections import Counter, defaultdict
-import matplotlib.pyplot as plt
 import os
 import numpy as np
+import argparse
+from functools import partial
+from scipy import sparse
+from plotting import pyplot, set_headless
+from csv_reader import force_read_csv
+from instrumentation import PipelineProfiler, set_trace_rate, should_trace
+from near_duplicates import DEFAULT_THRESHOLD, collapse_duplicates
+from morpheme_memo import MorphemeMemo
+from text_memo import TextMemo
+from token_cache import get_token_cache
+from token_corpus import TokenCorpus
+from token_table import load_token_table
+from tokenize_pool import tokenize_reviews
+from title_pool import run_titles
 
 
 # 複数のレビューファイルの設定 (ユーザーが指定した絶対パスを使用)
@@ -105,30 +118,30 @@ evaluation_aspects = {
     }
 }
 
-try:
-    mecab = MeCab.Tagger() 
-except Exception as e:
-    print(f" MeCabの初期化に失敗しました: {e}")
-    exit()
+# MeCab Taggerと形態素解析結果のキャッシュ (他のスクリプトと共有) は、最初に使うときに初期化する
+# (モジュールを import しただけでは何も実行しない)
+mecab = None
+token_cache = None
 
-plt.rcParams['font.family'] = 'Meiryo' 
-plt.rcParams['font.size'] = 12
+def get_mecab():
+    global mecab
+    if mecab is None:
+        try:
+            mecab = MeCab.Tagger()
+        except Exception as e:
+            print(f" MeCabの初期化に失敗しました: {e}")
+            exit()
+    return mecab
 
+def get_cache():
+    global token_cache
+    if token_cache is None:
+        token_cache = get_token_cache()
+    return token_cache
+
+# グラフの日本語設定 (グラフを描くときに反映する)
+CHART_RC = {'font.family': 'Meiryo', 'font.size': 12}
 
-def force_read_csv(file_path):
-    """複数のエンコーディングを試してCSVを読み込む"""
-    encodings_to_try = ['utf-8', 'shift_jis', 'cp932', 'euc-jp']
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=encoding)
-            return df
-        except Exception:
-            continue
-    try:
-        df = pd.read_csv(file_path, encoding='utf-8', errors='ignore')
-        return df
-    except Exception:
-        return None
 
 def unify_words(word):
     """単語を統一するルール"""
@@ -136,66 +149,170 @@ def unify_words(word):
         return 'キャラクター'
     return word
 
+# 処理段階ごとの計測 (results/cooccurrence_aspects_timings.json に出力)
+profiler = PipelineProfiler('cooccurrence_aspects')
+
+# 形態素解析の対象品詞
+target_hinshi = ('名詞', '動詞', '形容詞', '感動詞')
+
 def preprocess_text(text, mecab_tagger):
-    words = []
     if not isinstance(text, str) or len(text) < 2:
         return []
-    target_hinshi = ('名詞', '動詞', '形容詞', '感動詞')
+    # 同じ文面は1回だけ解析する
+    return list(text_memo.get(text, _preprocess_words, mecab_tagger))
+
+def _preprocess_words(text, mecab_tagger):
     try:
-        node = mecab_tagger.parseToNode(text)
+        # 対象品詞の形態素をキャッシュ経由で取得
+        morphemes = get_cache().morphemes(mecab_tagger, text, target_hinshi)
     except Exception:
-        return []
-    while node:
-        features = node.feature.split(',')
-        hinshi = features[0]
-        
-        # 感情分析の際は「基本形（原形）」の取得を試みる
-        original_form = node.surface 
-        if len(features) >= 7 and features[6] != '*':
-            # 7番目のフィールドが基本形（原形）
-            original_form = features[6] 
-            print(f"Surface: {node.surface}, Hinshi: {hinshi}, BasicForm: {original_form}")
-
-        if hinshi in target_hinshi and original_form not in stop_words:
-            # 抽出する単語は基本形とする
-            processed_word = unify_words(original_form) 
-            words.append(processed_word)
-
-        node = node.next
+        return ()
+    return tuple(select_words(morphemes))
+
+def preprocess_reviews(reviews, mecab_tagger, workers=1):
+    """複数のレビューをまとめて前処理する (workers > 1 でプロセス並列。同じ文面は1回だけ解析する)"""
+    targets = [i for i, text in enumerate(reviews) if isinstance(text, str) and len(text) >= 2]
+    target_texts = [reviews[i] for i in targets]
+
+    def compute(positions):
+        with profiler.stage('tokenize', items=len(positions)):
+            morphemes_list = tokenize_reviews([target_texts[p] for p in positions], mecab_tagger, target_hinshi,
+                                              workers=workers, cache=get_cache())
+        with profiler.stage('filter', items=len(positions)):
+            return [tuple(select_words(m)) if m is not None else () for m in morphemes_list]
+
+    processed = [[] for _ in reviews]
+    for i, words in zip(targets, text_memo.get_many(target_texts, compute)):
+        processed[i] = list(words)
+    return processed
+
+def preprocess_table(table, row_ids, texts):
+    """
+    トークン表 (token_table.TokenTable) から指定した行を取り出して前処理し、
+    語彙番号のコーパス (token_corpus.TokenCorpus) にする。MeCabは呼ばない。
+    texts は各行の本文 (row_ids と同じ順)。同じ文面の行は1回だけ取り出す
+    """
+    # 文字列でない行はトークン表でも空のレビューになっている
+    targets = [i for i, text in enumerate(texts) if isinstance(text, str)]
+
+    def compute(positions):
+        with profiler.stage('filter', items=len(positions)):
+            return [tuple(select_words(m))
+                    for m in table.iter_select([row_ids[targets[p]] for p in positions], target_hinshi)]
+
+    processed = [() for _ in row_ids]
+    for i, words in zip(targets, text_memo.get_many([texts[i] for i in targets], compute)):
+        processed[i] = words
+    return TokenCorpus.from_token_lists(processed)
+
+def select_word(morpheme):
+    """1つの形態素から採用する単語 (ストップワードなら None)"""
+    surface, hinshi, base_form, reading = morpheme
+    # 感情分析の際は「基本形（原形）」の取得を試みる
+    # (7番目のフィールドが基本形（原形）。無ければ表層形)
+    original_form = base_form or surface
+    if original_form in stop_words:
+        return None
+    # 抽出する単語は基本形とする
+    return unify_words(original_form)
+
+# 異なり形態素ごとの select_word の結果 (main の実行ごとに空にする)
+word_memo = MorphemeMemo(select_word)
+
+# 本文 → 前処理結果 の LRU メモ (作品をまたいで共有し、main の実行ごとに空にする)
+text_memo = TextMemo()
+
+def select_words(morphemes):
+    """形態素列からストップワードを除き、基本形の単語リストを作る"""
+    memo = word_memo
+    words = []
+    for morpheme in morphemes:
+        # トークン単位のデバッグ出力は --trace-rate 指定時のみ、サンプリングして行う
+        if morpheme[2] and should_trace():
+            surface, hinshi, base_form, reading = morpheme
+            print(f"Surface: {surface}, Hinshi: {hinshi}, BasicForm: {base_form}")
+
+        word = memo[morpheme]
+        if word is not None:
+            words.append(word)
+
     return words
 
 
-def calculate_co_occurrence_score(processed_words_list):
+def build_aspect_matrices(aspects):
+    """
+    評価観点の定義を 語彙×観点 の疎行列にまとめる。
+    戻り値: (語彙→列番号の辞書, 観点語行列, ポジティブ語行列, ネガティブ語行列)
+    ポジティブ/ネガティブ語行列は、リスト内で重複した語を重複回数として持つ
+    (従来のリスト走査と同じ数え方にするため)。
+    """
+    lexicon = {}
+    entries = {'aspect_words': ([], []), 'positive_eval_words': ([], []), 'negative_eval_words': ([], [])}
+    for k, definitions in enumerate(aspects.values()):
+        for key, (rows, cols) in entries.items():
+            words = definitions[key]
+            if key == 'aspect_words':
+                words = set(words)
+            for w in words:
+                rows.append(lexicon.setdefault(w, len(lexicon)))
+                cols.append(k)
+
+    shape = (len(lexicon), len(aspects))
+    matrices = []
+    for rows, cols in entries.values():
+        matrices.append(sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=shape))
+    return (lexicon, *matrices)
+
+def build_incidence_matrix(processed_words_list, lexicon):
+    """レビュー×語彙 の出現有無 (0/1) の疎行列を作る (TokenCorpus もそのまま受け取る)"""
+    if isinstance(processed_words_list, TokenCorpus):
+        return processed_words_list.incidence_matrix(lexicon)
+
+    indices = []
+    indptr = [0]
+    for words in processed_words_list:
+        indices.extend(lexicon[w] for w in set(words) if w in lexicon)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(processed_words_list), len(lexicon)))
+
+def calculate_aspect_components(processed_words_list, aspects=None):
+    """
+    評価観点ごとの 対象レビュー数・ポジティブ共起数・ネガティブ共起数・正規化スコア を計算する。
+    レビューを一度だけ疎行列にし、全観点を行列積でまとめて求める。
+    """
+    if aspects is None:
+        aspects = evaluation_aspects
+    lexicon, aspect_matrix, positive_matrix, negative_matrix = build_aspect_matrices(aspects)
+    incidence = build_incidence_matrix(processed_words_list, lexicon)
+
+    # 各レビューが観点語を含むか (レビュー×観点)
+    has_aspect = (incidence @ aspect_matrix) > 0
+    # 観点語を含むレビューだけのポジティブ/ネガティブ共起数を合計
+    pos_totals = np.asarray(has_aspect.multiply(incidence @ positive_matrix).sum(axis=0)).ravel()
+    neg_totals = np.asarray(has_aspect.multiply(incidence @ negative_matrix).sum(axis=0)).ravel()
+    review_counts = np.asarray(has_aspect.sum(axis=0)).ravel()
+
+    components = {}
+    for k, aspect_name in enumerate(aspects):
+        count = int(review_counts[k])
+        score = float(pos_totals[k] - neg_totals[k]) / count if count > 0 else 0
+        components[aspect_name] = {
+            'Review_Count': count,
+            'Positive': int(pos_totals[k]),
+            'Negative': int(neg_totals[k]),
+            'Score': score,
+        }
+    return components
+
+def calculate_co_occurrence_score(processed_words_list, aspects=None):
     """4つの評価観点ごとの共起分析スコアを計算する"""
-    
-    aspect_scores = {}
-    
-    for aspect_name, definitions in evaluation_aspects.items():
-        aspect_score = 0
-        aspect_total_count = 0
-        
-        for words in processed_words_list:
-            word_set = set(words)
-            has_aspect_word = any(w in word_set for w in definitions['aspect_words'])
-            
-            if has_aspect_word:
-                pos_co_occurrences = sum(1 for w in definitions['positive_eval_words'] if w in word_set)
-                neg_co_occurrences = sum(1 for w in definitions['negative_eval_words'] if w in word_set)
-                
-                aspect_score += (pos_co_occurrences - neg_co_occurrences)
-                aspect_total_count += 1
-        
-        if aspect_total_count > 0:
-            normalized_score = aspect_score / aspect_total_count
-        else:
-            normalized_score = 0
-        
-        aspect_scores[aspect_name] = normalized_score
-        
-    return aspect_scores
+    components = calculate_aspect_components(processed_words_list, aspects)
+    return {aspect_name: c['Score'] for aspect_name, c in components.items()}
 
 def plot_aspect_comparison(df_aspect_scores, file_name):
     """評価観点別スコアをレーダーチャートで可視化する"""
+    plt = pyplot(CHART_RC)
     
     categories = list(df_aspect_scores.columns)
     N = len(categories)
@@ -236,42 +353,99 @@ def plot_aspect_comparison(df_aspect_scores, file_name):
     plt.close()
     
  
-def main():
+def score_title(config, workers=1, trace_rate=0.0, dedup_threshold=None):
+    """
+    1作品分のCSVを読み込んで観点別スコアを計算する (作品ごとの並行処理の単位)。
+    {観点名: スコア, 'Game_Title': 作品名} を返す。読み込めなかった場合は None。
+    dedup_threshold を指定すると、類似度がそれ以上のレビューはグループの代表1件だけを数える。
+    """
+    set_trace_rate(trace_rate)
+    title = config['title']
+    path = config['path']
+    review_col = config['review_col']
+    
+    print(f"\n==================== 📊 {title} のデータ処理を開始 ====================")
+    profiler.set_title(title)
+    text_memo.reset_stats()
+    
+    # スコア計算に使うのはレビュー列だけなので、その列のみ読み込む
+    with profiler.stage('load') as stage:
+        try:
+            df = force_read_csv(path, usecols=[review_col])
+        except ValueError as e:
+            print(f"エラー: {e} {title} をスキップします。")
+            return None
+        stage.items = len(df) if df is not None else 0
+    if df is None or review_col not in df.columns:
+        print(f"エラー: {title}のファイル読み込みまたは列名'{review_col}'の確認に失敗しました。スキップします。")
+        return None
+
+    df_game = df.copy()
+    df_game = df_game.rename(columns={review_col: 'Original_Review'})
+    df_game['Original_Review'] = df_game['Original_Review'].astype(str).str.strip().replace('nan', '')
+    df_game = df_game[df_game['Original_Review'].str.len() > 1]
+    # トークン表を引くためにCSVの行番号を残してから、番号を振り直す
+    row_ids = df_game.index.tolist()
+    df_game = df_game.reset_index(drop=True)
+    game_reviews = df_game['Original_Review'].tolist()
+
+    # 重複・類似レビューは代表の1件だけを数える (コピー&ペーストによるスコアの偏りを除く)
+    if dedup_threshold is not None:
+        with profiler.stage('dedup', items=len(game_reviews)):
+            unique_positions, _ = collapse_duplicates(game_reviews, dedup_threshold)
+        n_duplicates = len(game_reviews) - len(unique_positions)
+        print(f"🔁 {title}: 重複・類似レビュー {n_duplicates} / {len(game_reviews)} 件 "
+              f"({n_duplicates / max(len(game_reviews), 1):.1%}) を除いて集計します。")
+        row_ids = [row_ids[i] for i in unique_positions]
+        game_reviews = [game_reviews[i] for i in unique_positions]
+    
+    # 形態素解析はトークン表として行い、他の分析と共有する (集計に使う行のうち、まだ表に無い行だけを解析する)
+    row_texts = df[review_col].loc[row_ids]
+    with profiler.stage('tokenize') as stage:
+        table = load_token_table(path, review_col, get_mecab(), texts=row_texts,
+                                 workers=workers, cache=get_cache())
+        stage.items = len(row_ids)
+    if table is not None:
+        processed_words_list = preprocess_table(table, row_ids, row_texts.tolist())
+    else:
+        processed_words_list = preprocess_reviews(game_reviews, get_mecab(), workers=workers)
+    print(f"♻️ {title}: 前処理 {text_memo.summary()}。")
+    
+    # --- 観点別スコアリングの実行 ---
+    with profiler.stage('score', items=len(processed_words_list)):
+        components = calculate_aspect_components(processed_words_list)
+    for aspect_name, c in components.items():
+        print(f"  [{aspect_name}] 対象レビュー数={c['Review_Count']}, Pos={c['Positive']}, Neg={c['Negative']}, Score={c['Score']:.4f}")
+    scores = {aspect_name: c['Score'] for aspect_name, c in components.items()}
+    scores['Game_Title'] = title
+    
+    print(f"✅ {title} の観点別スコアを計算しました。")
+    return scores
+
+
+def main(workers=1, trace_rate=0.0, title_workers=1, charts=True, headless=False, dedup_threshold=None):
+    """
+    charts=False の場合はレーダーチャートを作らない (matplotlib を読み込まない)。
+    headless=True の場合は画面を使わずに描画してファイルに保存する。
+    dedup_threshold を指定すると、重複・類似レビューを1件として数える (score_title を参照)。
+    """
     print("共起分析（評価観点別スコアリング）を開始します...")
+    set_headless(headless)
+    # ストップワードを編集した場合に備え、形態素ごとの判定結果は実行ごとに作り直す
+    word_memo.clear()
+    text_memo.clear()
 
     if not os.path.exists('results'):
         os.makedirs('results')
 
-    aspect_scores_list = []
-
-    for config in file_config:
-        title = config['title']
-        path = config['path']
-        review_col = config['review_col']
-        
-        print(f"\n==================== 📊 {title} のデータ処理を開始 ====================")
-        
-        df = force_read_csv(path)
-        if df is None or review_col not in df.columns:
-            print(f"エラー: {title}のファイル読み込みまたは列名'{review_col}'の確認に失敗しました。スキップします。")
-            continue
-
-        df_game = df.copy()
-        df_game = df_game.rename(columns={review_col: 'Original_Review'})
-        df_game['Original_Review'] = df_game['Original_Review'].astype(str).str.strip().replace('nan', '')
-        df_game = df_game[df_game['Original_Review'].str.len() > 1].reset_index(drop=True)
-        game_reviews = df_game['Original_Review'].tolist()
-        
-        processed_words_list = [preprocess_text(review, mecab) for review in game_reviews]
-        
-        # --- 観点別スコアリングの実行 ---
-        scores = calculate_co_occurrence_score(processed_words_list)
-        scores['Game_Title'] = title
-        aspect_scores_list.append(scores)
-        
-        print(f"✅ {title} の観点別スコアを計算しました。")
-
+    # 作品ごとのスコア計算は互いに独立なので、title_workers > 1 なら作品単位で並行に実行する
+    # (プロセスの入れ子を避けるため、その場合の形態素解析は各作品の中では並列化しない)
+    title_task = partial(score_title, workers=workers if title_workers <= 1 else 1, trace_rate=trace_rate,
+                         dedup_threshold=dedup_threshold)
+    results = run_titles(title_task, file_config, concurrency=title_workers)
+    aspect_scores_list = [scores for scores in results if scores is not None]
   
+    profiler.set_title(None)
     df_aspect_scores = pd.DataFrame(aspect_scores_list)
     df_aspect_scores.set_index('Game_Title', inplace=True)
     df_aspect_scores = df_aspect_scores[list(evaluation_aspects.keys())] 
@@ -281,14 +455,31 @@ def main():
 
     # --- グラフの可視化と保存 ---
 
-    plot_aspect_comparison(df_aspect_scores, 'results/aspect_comparison_radar_chart_optimized.png')
-    print("✅ 評価観点別スコアをレーダーチャートとして保存しました。")
+    if charts:
+        with profiler.stage('chart', items=len(df_aspect_scores)):
+            plot_aspect_comparison(df_aspect_scores, 'results/aspect_comparison_radar_chart_optimized.png')
+        print("✅ 評価観点別スコアをレーダーチャートとして保存しました。")
 
     output_path = 'results/aspect_scores_summary_optimized.csv'
-    df_aspect_scores.to_csv(output_path, encoding='utf-8')
+    with profiler.stage('write_csv', items=len(df_aspect_scores)):
+        df_aspect_scores.to_csv(output_path, encoding='utf-8')
     print(f"✅ 観点スコアのサマリーを '{output_path}' に保存しました。")
 
+    profiler.print_summary()
+    report_path = profiler.write_report()
+    print(f"✅ 処理時間の計測結果を '{report_path}' に保存しました。")
+
     print("\n--- 共起分析スクリプトの全処理を完了しました ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='共起分析（評価観点別スコアリング）')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析に使うプロセス数')
+    parser.add_argument('--trace-rate', type=float, default=0.0, help='トークン単位のデバッグ出力を行う割合 (0〜1)')
+    parser.add_argument('--title-workers', type=int, default=1, help='作品を並行して処理するプロセス数')
+    parser.add_argument('--no-charts', action='store_true', help='グラフを作らない (matplotlib を読み込まない)')
+    parser.add_argument('--headless', action='store_true', help='画面を使わずにグラフを描画してファイルに保存する')
+    parser.add_argument('--dedup', type=float, nargs='?', const=DEFAULT_THRESHOLD, default=None, metavar='THRESHOLD',
+                        help=f'類似度 THRESHOLD (省略時 {DEFAULT_THRESHOLD}) 以上の重複・類似レビューを1件として数える')
+    args = parser.parse_args()
+    main(workers=args.workers, trace_rate=args.trace_rate, title_workers=args.title_workers,
+         charts=not args.no_charts, headless=args.headless, dedup_threshold=args.dedup)
\ No newline at end of file
@@ -1,10 +1,34 @@
 import pandas as pd
 import MeCab
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import argparse
+import itertools
+from functools import partial
+from plotting import pyplot, set_headless, show
+from csv_reader import force_read_csv
+from incremental_state import IncrementalState, fingerprint
+from instrumentation import PipelineProfiler
+from lexicon_matcher import LexiconMatcher
+from morpheme_memo import MorphemeMemo
+from near_duplicates import DEFAULT_THRESHOLD, appended_representatives
+from text_memo import TextMemo
+from token_cache import dictionary_identity, get_token_cache
+from token_table import load_token_table
+from tokenize_pool import tokenize_reviews
+from title_pool import run_titles
+
+# グラフの日本語設定 (グラフを描くときに反映する)
+CHART_RC = {'font.family': 'MS Gothic'}
+
+# ファイル設定
+file_config = [
+    {'title': 'SV', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\SVシナリオレビュー''.csv', 'review_col': 'シナリオ小文章'},
+    {'title': '剣盾', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\剣盾シナリオ文.csv', 'review_col': 'シナリオ一文'},
+    {'title': 'USUM', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\sm_usumシナリオ文.csv', 'review_col': 'シナリオ文'},
+    {'title': 'XY', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\XYシナリオ文.csv', 'review_col': 'シナリオ'}
+]
 
-plt.rcParams['font.family'] = 'MS Gothic'
 POSITIVE_WORDS_SET = {
    "スバラシイ", "カンドウ", "サイコウ", "メイサク", "オモシロイ", "ヨイ", "スキ", "コエル","テイネイ","コセイ","イッパイ",
     "セットクリョク", "ボツニュウ", "タカイ", "ナク", "カミ", "タノシイ", "カイシュウ","オドル",
@@ -30,18 +54,51 @@ STOP_WORDS = {
     "ゲーム", "ポケモン", "シリーズ", "プレイ",
 }
 
+# 全方位マッチング用の品詞フィルタ
+TARGET_POS = ["名詞", "形容詞", "動詞", "形状詞", "副詞", "形容動詞", "助動詞"]
+
+# 感情辞書を1つのオートマトンにまとめる (ネガティブを優先)
+# 「ヒョウカデキナイ」のように複数の形態素にまたがる語もここで一致させる
+LEXICON_MATCHER = LexiconMatcher([
+    ("Negative", NEGATIVE_WORDS_SET),
+    ("Positive", POSITIVE_WORDS_SET),
+])
+
+# 処理段階ごとの計測 (results/sentiment_timings.json に出力)
+profiler = PipelineProfiler('sentiment')
+
+# 判定ラベル。classify_batch が返すラベルコードはこのタプル内の位置
+SENTIMENT_LABELS = ("Positive", "Negative", "Neutral")
+DEFAULT_BATCH_SIZE = 10000  # classify_batch で一度に形態素解析・照合する件数
+
+
+def label_codes(pos_counts, neg_counts):
+    """ポジネガ数の配列から判定ラベルのコード (SENTIMENT_LABELS の位置) を求める"""
+    codes = np.full(len(pos_counts), SENTIMENT_LABELS.index("Neutral"), dtype=np.int8)
+    codes[pos_counts > neg_counts] = SENTIMENT_LABELS.index("Positive")
+    codes[neg_counts > pos_counts] = SENTIMENT_LABELS.index("Negative")
+    return codes
+
 # ==========================================
 # 2. 分析クラス定義
 # ==========================================
 
 class SentimentAnalyzer:
-    def __init__(self):
+    def __init__(self, workers=1):
+        # workers > 1 の場合、analyze_dataset ではプロセス並列で形態素解析する
+        self.workers = workers
         try:
             self.tagger = MeCab.Tagger()
         except Exception as e:
             print(f"Error: MeCabの初期化に失敗しました: {e}")
             import sys
             sys.exit(1)
+        # 形態素解析結果のキャッシュ (他のスクリプトと共有)
+        self.token_cache = get_token_cache()
+        # 異なり形態素ごとの照合候補と対象品詞かどうか (ストップワードの判定済み)
+        self.morpheme_memo = MorphemeMemo(self._morpheme_entry)
+        # 本文 → 判定結果 の LRU メモ (同じ分析器で処理する作品の間で共有する)
+        self.text_memo = TextMemo()
 
     def classify_review(self, text):
         """
@@ -49,42 +106,10 @@ class SentimentAnalyzer:
         """
         if not isinstance(text, str):
             return 0, 0, "Neutral"
-        
-        pos_count = 0
-        neg_count = 0
-        
-        node = self.tagger.parseToNode(text)
-        
-        while node:
-            features = node.feature.split(',')
-            pos = features[0]
-            
-            # 全方位マッチング用の品詞フィルタ
-            target_pos = ["名詞", "形容詞", "動詞", "形状詞", "副詞", "形容動詞", "助動詞"]
-            
-            if pos in target_pos:
-                surface = node.surface
-                candidates = {surface}
-                
-                if len(features) > 6 and features[6] != "*":
-                    candidates.add(features[6]) # 基本形
-                if len(features) > 7 and features[7] != "*":
-                    candidates.add(features[7]) # 読み
-
-                if not candidates.isdisjoint(STOP_WORDS):
-                    node = node.next
-                    continue
-
-                is_match = False
-                
-                if not candidates.isdisjoint(NEGATIVE_WORDS_SET):
-                    neg_count += 1
-                    is_match = True
-                
-                if not is_match and not candidates.isdisjoint(POSITIVE_WORDS_SET):
-                    pos_count += 1
-
-            node = node.next
+
+        # 同じ文面は1回だけ解析する (バッチ処理の _classify_texts とメモを共有する)
+        pos_count, neg_count = self.text_memo.get(text, self._count_text)
+
         if pos_count > neg_count:
             sentiment = "Positive"  # 肯定的
         elif neg_count > pos_count:
@@ -94,43 +119,240 @@ class SentimentAnalyzer:
             
         return pos_count, neg_count, sentiment
 
-    def analyze_dataset(self, df, text_col):
-        # データフレームの各行に対して分析を適用
-        results = df[text_col].apply(lambda x: self.classify_review(x))
-        
-        # 結果を新しい列として追加
-        df['Pos_Count'] = [res[0] for res in results]
-        df['Neg_Count'] = [res[1] for res in results]
-        df['Sentiment'] = [res[2] for res in results]
-        
-        return df
+    def _count_text(self, text):
+        """1つのレビュー文から (ポジティブ数, ネガティブ数) を数える"""
+        # 複数形態素にまたがる辞書語を照合するため、品詞で絞らずに全形態素を取得
+        morphemes = self.token_cache.morphemes(self.tagger, text)
+        return self._count_morphemes(morphemes)
+
+    @staticmethod
+    def _morpheme_entry(morpheme):
+        """1つの形態素の (照合候補の集合, 対象品詞かどうか)。ストップワードなら候補は None"""
+        surface, pos, base_form, reading = morpheme
+        # 表層形・基本形・読みのどれでも辞書と照合できるようにする
+        candidates = frozenset(c for c in (surface, base_form, reading) if c)
+        is_target = pos in TARGET_POS
+
+        # 対象品詞のストップワードは照合の区切りとして扱う
+        if is_target and not candidates.isdisjoint(STOP_WORDS):
+            candidates = None
+        return candidates, is_target
+
+    def _count_morphemes(self, morphemes):
+        """形態素列から (ポジティブ数, ネガティブ数) を数える"""
+        pos_count = 0
+        neg_count = 0
+
+        stream = []
+        standalone = []
+        memo = self.morpheme_memo
+        for morpheme in morphemes:
+            candidates, is_target = memo[morpheme]
+            stream.append(candidates)
+            # 1形態素だけの一致は対象品詞のときのみ数える
+            standalone.append(is_target)
+
+        for start, end, label, word in LEXICON_MATCHER.find(stream, standalone):
+            if label == "Negative":
+                neg_count += 1
+            else:
+                pos_count += 1
+
+        return pos_count, neg_count
+
+    def _classify_texts(self, texts, table=None, row_ids=None):
+        """
+        1バッチ分のテキストを分類し、(ポジティブ数, ネガティブ数, ラベルコード) の配列を返す。
+        同じ文面は1回だけ解析する (バッチや作品をまたいで text_memo を共有する)
+        """
+        pos_counts = np.zeros(len(texts), dtype=np.int32)
+        neg_counts = np.zeros(len(texts), dtype=np.int32)
+        targets = [i for i, text in enumerate(texts) if isinstance(text, str)]
+
+        def compute(positions):
+            with profiler.stage('tokenize', items=len(positions)):
+                if table is not None:
+                    morphemes_list = table.select([row_ids[targets[p]] for p in positions])
+                else:
+                    morphemes_list = tokenize_reviews([texts[targets[p]] for p in positions], self.tagger,
+                                                      workers=self.workers, cache=self.token_cache)
+            with profiler.stage('score', items=len(positions)):
+                return [self._count_morphemes(m) if m else (0, 0) for m in morphemes_list]
+
+        counts = self.text_memo.get_many([texts[i] for i in targets], compute)
+        for i, (pos_count, neg_count) in zip(targets, counts):
+            pos_counts[i] = pos_count
+            neg_counts[i] = neg_count
+        return pos_counts, neg_counts, label_codes(pos_counts, neg_counts)
+
+    def iter_batches(self, texts, batch_size=DEFAULT_BATCH_SIZE, table=None, row_ids=None):
+        """
+        texts (任意のイテラブル) を batch_size 件ずつ分類し、バッチごとに
+        (ポジティブ数, ネガティブ数, ラベルコード) の配列を返すジェネレータ。
+        table (token_table.TokenTable) を渡す場合は、row_ids にCSVの行番号を texts と同じ順で渡す。
+        """
+        texts = iter(texts)
+        row_ids = iter(row_ids) if table is not None else None
+        while True:
+            batch = list(itertools.islice(texts, batch_size))
+            if not batch:
+                return
+            batch_rows = list(itertools.islice(row_ids, len(batch))) if table is not None else None
+            yield self._classify_texts(batch, table, batch_rows)
 
-def force_read_csv(file_path):
-    for encoding in ['utf-8', 'shift_jis', 'cp932']:
+    def classify_batch(self, texts, batch_size=DEFAULT_BATCH_SIZE, table=None, row_ids=None):
+        """
+        複数のレビューをまとめて分類する。戻り値は
+        (ポジティブ数 int32配列, ネガティブ数 int32配列, ラベルコード int8配列) で、
+        ラベルコードは SENTIMENT_LABELS の位置 (pd.Categorical.from_codes でラベルに戻せる)。
+        内部では batch_size 件ずつ処理し、行ごとのタプルは作らない。
+        """
         try:
-            return pd.read_csv(file_path, encoding=encoding)
-        except:
-            continue
-    return None
+            n = len(texts)
+        except TypeError:
+            # 長さの分からないイテラブルは、バッチごとの配列を最後に連結する
+            batches = list(self.iter_batches(texts, batch_size, table, row_ids))
+            if not batches:
+                return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int8)
+            return tuple(np.concatenate(parts) for parts in zip(*batches))
+
+        pos_counts = np.zeros(n, dtype=np.int32)
+        neg_counts = np.zeros(n, dtype=np.int32)
+        codes = np.zeros(n, dtype=np.int8)
+        start = 0
+        for batch_pos, batch_neg, batch_codes in self.iter_batches(texts, batch_size, table, row_ids):
+            end = start + len(batch_pos)
+            pos_counts[start:end] = batch_pos
+            neg_counts[start:end] = batch_neg
+            codes[start:end] = batch_codes
+            start = end
+        return pos_counts, neg_counts, codes
+
+    def analyze_dataset(self, df, text_col, table=None):
+        """
+        データフレームの各行を分類し、Pos_Count / Neg_Count / Sentiment 列を加えた
+        新しいデータフレームを返す (引数の df は変更しない)。
+        table (token_table.TokenTable) を渡すと、df のインデックスをCSVの行番号として
+        トークン表から形態素を取り出し、MeCabは呼ばない。
+        """
+        row_ids = df.index.tolist() if table is not None else None
+        pos_counts, neg_counts, codes = self.classify_batch(df[text_col], table=table, row_ids=row_ids)
+        return df.assign(
+            Pos_Count=pos_counts,
+            Neg_Count=neg_counts,
+            Sentiment=pd.Categorical.from_codes(codes, categories=SENTIMENT_LABELS),
+        )
 
 # ==========================================
 # 3. 実行メイン処理
 # ==========================================
 
-def main():
-    if not os.path.exists('results'):
-        os.makedirs('results')
+def analyze_title(config, state, workers=1, analyzer=None, dedup_threshold=None):
+    """
+    1作品分のCSVを感情分析し、詳細CSVを保存する (作品ごとの並行処理の単位)。
+    state (IncrementalState) を使って追記分だけを解析し、(ラベルごとの件数, 更新後の作品の状態) を返す。
+    CSVが読めなかった場合の件数は None。analyzer を省略すると新しく作る (子プロセス用)。
+    dedup_threshold を指定すると、類似度がそれ以上のレビューはグループの代表1件だけを解析して集計に数え、
+    詳細CSVには全行を代表のラベルと Duplicate_Of 列 (代表のCSVの行番号) 付きで書き出す。
+    """
+    if analyzer is None:
+        analyzer = SentimentAnalyzer(workers=workers)
+    label_order = ['Positive', 'Negative', 'Neutral']
+    title = config['title']
+    path = config['path']
+    col = config['review_col']
+    
+    print(f"\n========== {title} の感情分析を開始 ==========")
+    
+    profiler.set_title(title)
+    analyzer.text_memo.reset_stats()
+    with profiler.stage('load') as stage:
+        df = force_read_csv(path)
+        stage.items = len(df) if df is not None else 0
+    if df is None:
+        print(f"エラー: {path} が読み込めませんでした。")
+        return None, state.entry(title)
+    if col not in df.columns:
+        print(f"エラー: 列 '{col}' が {path} に見つかりません。")
+        return None, state.entry(title)
 
-    analyzer = SentimentAnalyzer()
+    # 前回までに処理した行はスキップする (詳細CSVが無い場合は作り直す)
+    output_csv = f'results/{title}_sentiment_details.csv'
+    row_texts = df[col].astype(str).tolist()
+    source_columns = list(df.columns)
+    start = state.start_row(title, row_texts, source_columns) if os.path.exists(output_csv) else 0
+    aggregates = state.aggregates(title) if start > 0 else None
+    if aggregates is None:
+        start = 0
+        aggregates = {'reviews': 0, 'positive_words': 0, 'negative_words': 0,
+                      'labels': {label: 0 for label in label_order}}
+    else:
+        print(f"処理済み {start} 行をスキップし、追加の {len(df) - start} 行を解析します。")
+
+    # データクリーニング (重複除去では処理済みの行とも比べるため、全行に対して行う)
+    clean_df = df.dropna(subset=[col]).copy()
+    clean_df[col] = clean_df[col].astype(str).replace('nan', '')
+    clean_df = clean_df[clean_df[col].str.len() > 1]
+    df = clean_df[clean_df.index >= start]
+
+    # 重複・類似レビューは代表の1件だけを解析する (代表は処理済みの行のこともある)
+    df_analyze = df
+    if dedup_threshold is not None:
+        n_seen = len(clean_df) - len(df)
+        with profiler.stage('dedup', items=len(clean_df)):
+            representatives = appended_representatives(clean_df[col].tolist(), n_seen, dedup_threshold)
+        is_representative = representatives == np.arange(n_seen, len(clean_df))
+        n_duplicates = len(df) - int(is_representative.sum())
+        print(f"🔁 {title}: 重複・類似レビュー {n_duplicates} / {len(df)} 件 "
+              f"({n_duplicates / max(len(df), 1):.1%}) をまとめて解析します。")
+        analyzed = np.unique(representatives)
+        df_analyze = clean_df.iloc[analyzed]
+
+    # 形態素解析はトークン表として行い、他の分析と共有する (解析する行のうち、まだ表に無い行だけを解析する)
+    table = load_token_table(path, col, analyzer.tagger, texts=df_analyze[col], workers=analyzer.workers,
+                             cache=analyzer.token_cache)
+
+    # 分析実行 (追加分のみ)
+    df_result = analyzer.analyze_dataset(df_analyze, col, table)
+    print(f"♻️ {title}: 判定 {analyzer.text_memo.summary()}。")
+    df_counted = df_result
+    if dedup_threshold is not None:
+        # 代表の結果を同じグループの行に戻し、代表以外の行には代表のCSVの行番号を入れる
+        fanned = df_result.iloc[np.searchsorted(analyzed, representatives)].set_axis(df.index)
+        duplicate_of = pd.Series(clean_df.index.to_numpy()[representatives], index=df.index, dtype='Int64')
+        duplicate_of[is_representative] = pd.NA
+        df_result = df.assign(Pos_Count=fanned['Pos_Count'], Neg_Count=fanned['Neg_Count'],
+                              Sentiment=fanned['Sentiment'], Duplicate_Of=duplicate_of)
+        # 集計ではグループを1件として数える (処理済みの代表のグループは前回までに数えている)
+        df_counted = df_result[is_representative]
+
+    # 集計値に追加分を足し込む
+    aggregates['reviews'] += len(df_counted)
+    aggregates['positive_words'] += int(df_counted['Pos_Count'].sum())
+    aggregates['negative_words'] += int(df_counted['Neg_Count'].sum())
+    for label, count in df_counted['Sentiment'].value_counts().items():
+        aggregates['labels'][label] = aggregates['labels'].get(label, 0) + int(count)
+
+    # 存在しないラベルも0として、グラフ描画用に並べる
+    sentiment_counts = pd.Series({label: aggregates['labels'].get(label, 0) for label in label_order})
+
+    print(f"集計結果:\n{sentiment_counts}")
+
+    # CSV保存 (追加分だけを追記する)
+    with profiler.stage('write_csv', items=len(df_result)):
+        if start > 0:
+            df_result.to_csv(output_csv, mode='a', header=False, index=False, encoding='utf-8')
+        else:
+            df_result.to_csv(output_csv, index=False, encoding='utf-8-sig')
+    print(f"詳細データを保存しました: {output_csv}")
+
+    state.update(title, row_texts, source_columns, aggregates)
+    return sentiment_counts, state.entry(title)
 
-    # ファイル設定
-    file_config = [
-    {'title': 'SV', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\SVシナリオレビュー''.csv', 'review_col': 'シナリオ小文章'},
-    {'title': '剣盾', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\剣盾シナリオ文.csv', 'review_col': 'シナリオ一文'},
-    {'title': 'USUM', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\sm_usumシナリオ文.csv', 'review_col': 'シナリオ文'},
-    {'title': 'XY', 'path': r'C:\Users\masat\OneDrive\デスクトップ\deep learning\パワポ\-2161015New\XYシナリオ文.csv', 'review_col': 'シナリオ'}
-]
 
+def plot_sentiment_pies(titles, sentiment_counts_list, file_name):
+    """作品ごとのラベル件数を2×2の円グラフにまとめて保存する (件数が None の作品は空欄)"""
+    plt = pyplot(CHART_RC)
 
     # グラフ描画用の設定
     fig, axes = plt.subplots(2, 2, figsize=(12, 10))
@@ -138,45 +360,10 @@ def main():
     
     # グラフの色設定
     colors = {'Positive': '#66b3ff', 'Negative': '#ff9999', 'Neutral': '#99ff99'}
-    label_order = ['Positive', 'Negative', 'Neutral']
 
-    for i, config in enumerate(file_config):
-        title = config['title']
-        path = config['path']
-        col = config['review_col']
-        
-        print(f"\n========== {title} の感情分析を開始 ==========")
-        
-        df = force_read_csv(path)
-        if df is None:
-            print(f"エラー: {path} が読み込めませんでした。")
+    for i, (title, sentiment_counts) in enumerate(zip(titles, sentiment_counts_list)):
+        if sentiment_counts is None:
             continue
-            
-        # データクリーニング
-        df = df.dropna(subset=[col])
-        df[col] = df[col].astype(str).replace('nan', '')
-        df = df[df[col].str.len() > 1]
-
-        # 分析実行
-        df_result = analyzer.analyze_dataset(df, col)
-        
-        # 集計
-        sentiment_counts = df_result['Sentiment'].value_counts()
-        
-        # 存在しないラベルを0で埋める（グラフ描画のため）
-        for label in label_order:
-            if label not in sentiment_counts:
-                sentiment_counts[label] = 0
-        
-        # 並び替え
-        sentiment_counts = sentiment_counts[label_order]
-        
-        print(f"集計結果:\n{sentiment_counts}")
-        
-        # CSV保存
-        output_csv = f'results/{title}_sentiment_details.csv'
-        df_result.to_csv(output_csv, index=False, encoding='utf-8-sig')
-        print(f"詳細データを保存しました: {output_csv}")
 
         # 円グラフ描画
         ax = axes[i]
@@ -198,9 +385,69 @@ def main():
             ax.set_title(f"{title} (データなし)")
 
     plt.tight_layout()
-    plt.savefig('results/sentiment_pie_charts.png')
-    plt.show()
-    print("\n全処理完了: 感情分析結果の円グラフを 'results/sentiment_pie_charts.png' に保存しました。")
+    plt.savefig(file_name)
+
+
+def main(workers=1, incremental=False, title_workers=1, charts=True, headless=False, dedup_threshold=None):
+    """
+    incremental=True の場合、前回の実行以降にCSVへ追記された行だけを解析し、
+    保存済みの集計 (results/state/sentiment_state.json) に足し込む。
+    dedup_threshold を指定すると、重複・類似レビューを1件として数える (analyze_title を参照)。
+    title_workers > 1 の場合、作品ごとの解析を別プロセスで並行に実行する。
+    charts=False の場合は円グラフを作らず (matplotlib を読み込まない)、
+    headless=True の場合は画面を使わずに描画してファイルに保存する (ウィンドウを開かない)。
+    """
+    set_headless(headless)
+    if not os.path.exists('results'):
+        os.makedirs('results')
+
+    # プロセスの入れ子を避けるため、作品を並行に処理する場合の形態素解析は各作品の中では並列化しない
+    analyzer = SentimentAnalyzer(workers=workers if title_workers <= 1 else 1)
+    # 辞書やMeCab辞書が変わった場合は保存済みの集計を使わない
+    # 重複除去の有無で集計が変わる (除去しない場合は従来と同じ値にして、保存済みの集計を使えるようにする)
+    dedup = () if dedup_threshold is None else (('dedup', dedup_threshold),)
+    state = IncrementalState('sentiment', fingerprint(
+        POSITIVE_WORDS_SET, NEGATIVE_WORDS_SET, STOP_WORDS, TARGET_POS, dictionary_identity(analyzer.tagger), *dedup))
+    if not incremental:
+        state.reset()
+
+    # 子プロセスには MeCab の Tagger を渡せないため、並行時は各プロセスで analyzer を作る
+    title_task = partial(analyze_title, state=state, workers=analyzer.workers,
+                         analyzer=analyzer if title_workers <= 1 else None, dedup_threshold=dedup_threshold)
+    results = run_titles(title_task, file_config, concurrency=title_workers)
+
+    # 結果は file_config の順に反映する
+    for config, (sentiment_counts, entry) in zip(file_config, results):
+        state.restore(config['title'], entry)
+
+    state.save()
+
+    profiler.set_title(None)
+    if charts:
+        with profiler.stage('chart', items=len(file_config)):
+            plot_sentiment_pies([config['title'] for config in file_config],
+                                [sentiment_counts for sentiment_counts, _ in results],
+                                'results/sentiment_pie_charts.png')
+        print("\n全処理完了: 感情分析結果の円グラフを 'results/sentiment_pie_charts.png' に保存しました。")
+    else:
+        print("\n全処理完了")
+
+    profiler.print_summary()
+    report_path = profiler.write_report()
+    print(f"処理時間の計測結果を保存しました: {report_path}")
+
+    show()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='作品別 感情分析 (円グラフ)')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析に使うプロセス数')
+    parser.add_argument('--incremental', action='store_true',
+                        help='前回の実行以降に追記された行だけを解析し、保存済みの集計に足し込む')
+    parser.add_argument('--title-workers', type=int, default=1, help='作品を並行して処理するプロセス数')
+    parser.add_argument('--no-charts', action='store_true', help='グラフを作らない (matplotlib を読み込まない)')
+    parser.add_argument('--headless', action='store_true', help='画面を使わずにグラフを描画してファイルに保存する')
+    parser.add_argument('--dedup', type=float, nargs='?', const=DEFAULT_THRESHOLD, default=None, metavar='THRESHOLD',
+                        help=f'類似度 THRESHOLD (省略時 {DEFAULT_THRESHOLD}) 以上の重複・類似レビューを1件として数える')
+    args = parser.parse_args()
+    main(workers=args.workers, incremental=args.incremental, title_workers=args.title_workers,
+         charts=not args.no_charts, headless=args.headless, dedup_threshold=args.dedup)
\ No newline at end of file
@@ -1,9 +1,21 @@
 import pandas as pd
 import MeCab
 from collections import Counter
-import matplotlib.pyplot as plt
 import os
 import numpy as np
+import argparse
+from functools import partial
+from plotting import pyplot, set_headless
+from csv_reader import force_read_csv
+from instrumentation import PipelineProfiler, set_trace_rate, should_trace
+from near_duplicates import DEFAULT_THRESHOLD, collapse_duplicates
+from morpheme_memo import MorphemeMemo
+from text_memo import TextMemo
+from token_cache import get_token_cache
+from token_corpus import TokenCorpus
+from token_table import load_token_table
+from tokenize_pool import tokenize_reviews
+from title_pool import run_titles
 
 
 # 複数のレビューファイルの設定 (ユーザー指定の絶対パスを含む)
@@ -41,61 +53,123 @@ negative_words = {
     "カッテ", "フカンゼン", "アサイ", "セッキョウクサイ", "サイテイ","アキル","ウスッペライ","モノタリナイ","デキナイ",
 }
 
-try:
-    mecab = MeCab.Tagger() 
-except Exception as e:
-    print(f" MeCabの初期化に失敗しました: {e}")
-    exit()
+# MeCab Taggerと形態素解析結果のキャッシュ (他のスクリプトと共有) は、最初に使うときに初期化する
+# (モジュールを import しただけでは何も実行しない)
+mecab = None
+token_cache = None
 
-plt.rcParams['font.family'] = 'Meiryo' 
-plt.rcParams['font.size'] = 12
+def get_mecab():
+    global mecab
+    if mecab is None:
+        try:
+            mecab = MeCab.Tagger()
+        except Exception as e:
+            print(f" MeCabの初期化に失敗しました: {e}")
+            exit()
+    return mecab
 
+def get_cache():
+    global token_cache
+    if token_cache is None:
+        token_cache = get_token_cache()
+    return token_cache
+
+# グラフの日本語設定 (グラフを描くときに反映する)
+CHART_RC = {'font.family': 'Meiryo', 'font.size': 12}
 
-def force_read_csv(file_path):
-    encodings_to_try = ['utf-8', 'shift_jis', 'cp932', 'euc-jp']
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=encoding)
-            return df
-        except Exception:
-            continue
-    try:
-        df = pd.read_csv(file_path, encoding='utf-8', errors='ignore')
-        return df
-    except Exception:
-        return None
 
 def unify_words(word):
     if word == 'キャラ':
         return 'キャラクター'
     return word
 
+# 処理段階ごとの計測 (results/sentiment_analysis_timings.json に出力)
+profiler = PipelineProfiler('sentiment_analysis')
+
+# 形態素解析の対象品詞
+target_hinshi = ('名詞', '動詞', '形容詞', '感動詞')
+
 def preprocess_text(text, mecab_tagger):
-    words = []
     if not isinstance(text, str) or len(text) < 2:
         return []
-    target_hinshi = ('名詞', '動詞', '形容詞', '感動詞')
+    # 同じ文面は1回だけ解析する
+    return list(text_memo.get(text, _preprocess_words, mecab_tagger))
+
+def _preprocess_words(text, mecab_tagger):
     try:
-        node = mecab_tagger.parseToNode(text)
+        # 対象品詞の形態素をキャッシュ経由で取得
+        morphemes = get_cache().morphemes(mecab_tagger, text, target_hinshi)
     except Exception:
-        return []
-    while node:
-        features = node.feature.split(',')
-        hinshi = features[0]
-        
-        # 感情分析の際は「基本形（原形）」の取得を試みる
-        original_form = node.surface 
-        if len(features) >= 7 and features[6] != '*':
-            # 7番目のフィールドが基本形（原形）
-            original_form = features[6] 
-            print(f"Surface: {node.surface}, Hinshi: {hinshi}, BasicForm: {original_form}")
-
-        if hinshi in target_hinshi and original_form not in stop_words:
-            # 抽出する単語は基本形とする
-            processed_word = unify_words(original_form) 
-            words.append(processed_word)
-
-        node = node.next
+        return ()
+    return tuple(select_words(morphemes))
+
+def preprocess_reviews(reviews, mecab_tagger, workers=1):
+    """複数のレビューをまとめて前処理する (workers > 1 でプロセス並列。同じ文面は1回だけ解析する)"""
+    targets = [i for i, text in enumerate(reviews) if isinstance(text, str) and len(text) >= 2]
+    target_texts = [reviews[i] for i in targets]
+
+    def compute(positions):
+        with profiler.stage('tokenize', items=len(positions)):
+            morphemes_list = tokenize_reviews([target_texts[p] for p in positions], mecab_tagger, target_hinshi,
+                                              workers=workers, cache=get_cache())
+        with profiler.stage('filter', items=len(positions)):
+            return [tuple(select_words(m)) if m is not None else () for m in morphemes_list]
+
+    processed = [[] for _ in reviews]
+    for i, words in zip(targets, text_memo.get_many(target_texts, compute)):
+        processed[i] = list(words)
+    return processed
+
+def preprocess_table(table, row_ids, texts):
+    """
+    トークン表 (token_table.TokenTable) から指定した行を取り出して前処理し、
+    語彙番号のコーパス (token_corpus.TokenCorpus) にする。MeCabは呼ばない。
+    texts は各行の本文 (row_ids と同じ順)。同じ文面の行は1回だけ取り出す
+    """
+    # 文字列でない行はトークン表でも空のレビューになっている
+    targets = [i for i, text in enumerate(texts) if isinstance(text, str)]
+
+    def compute(positions):
+        with profiler.stage('filter', items=len(positions)):
+            return [tuple(select_words(m))
+                    for m in table.iter_select([row_ids[targets[p]] for p in positions], target_hinshi)]
+
+    processed = [() for _ in row_ids]
+    for i, words in zip(targets, text_memo.get_many([texts[i] for i in targets], compute)):
+        processed[i] = words
+    return TokenCorpus.from_token_lists(processed)
+
+def select_word(morpheme):
+    """1つの形態素から採用する単語 (ストップワードなら None)"""
+    surface, hinshi, base_form, reading = morpheme
+    # 感情分析の際は「基本形（原形）」の取得を試みる
+    # (7番目のフィールドが基本形（原形）。無ければ表層形)
+    original_form = base_form or surface
+    if original_form in stop_words:
+        return None
+    # 抽出する単語は基本形とする
+    return unify_words(original_form)
+
+# 異なり形態素ごとの select_word の結果 (main の実行ごとに空にする)
+word_memo = MorphemeMemo(select_word)
+
+# 本文 → 前処理結果 の LRU メモ (作品をまたいで共有し、main の実行ごとに空にする)
+text_memo = TextMemo()
+
+def select_words(morphemes):
+    """形態素列からストップワードを除き、基本形の単語リストを作る"""
+    memo = word_memo
+    words = []
+    for morpheme in morphemes:
+        # トークン単位のデバッグ出力は --trace-rate 指定時のみ、サンプリングして行う
+        if morpheme[2] and should_trace():
+            surface, hinshi, base_form, reading = morpheme
+            print(f"Surface: {surface}, Hinshi: {hinshi}, BasicForm: {base_form}")
+
+        word = memo[morpheme]
+        if word is not None:
+            words.append(word)
+
     return words
 
 def analyze_sentiment(words):
@@ -111,6 +185,17 @@ def analyze_sentiment(words):
         
     return sentiment, positive_score, negative_score
 
+def analyze_sentiment_batch(processed_reviews):
+    """レビューごとの analyze_sentiment の結果をまとめて返す。TokenCorpus なら配列演算で数える"""
+    if not isinstance(processed_reviews, TokenCorpus):
+        return [analyze_sentiment(words) for words in processed_reviews]
+
+    positive_scores = processed_reviews.count_in(positive_words)
+    negative_scores = processed_reviews.count_in(negative_words)
+    sentiments = np.where(positive_scores > negative_scores, 'Positive',
+                          np.where(negative_scores > positive_scores, 'Negative', 'Neutral'))
+    return list(zip(sentiments.tolist(), positive_scores.tolist(), negative_scores.tolist()))
+
 def plot_sentiment_distribution(df_data, file_name, title): 
     """感情極性の分布を円グラフで可視化する (色の対応を固定)"""
     fixed_order = ['Positive', 'Negative', 'Neutral'] 
@@ -119,6 +204,7 @@ def plot_sentiment_distribution(df_data, file_name, title):
     sentiment_counts = df_data['Sentiment'].value_counts().reindex(fixed_order, fill_value=0) 
     
     if not sentiment_counts.empty:
+        plt = pyplot(CHART_RC)
         plt.figure(figsize=(6, 6))
         plt.pie(
             sentiment_counts, 
@@ -132,55 +218,135 @@ def plot_sentiment_distribution(df_data, file_name, title):
         plt.savefig(file_name)
         plt.close()
 
-def main():
-    print("作品別 感情分析を開始します...")
-
-    if not os.path.exists('results'):
-        os.makedirs('results')
+def analyze_title(config, workers=1, trace_rate=0.0, charts=True, dedup_threshold=None):
+    """
+    1作品分のCSVを感情分析し、円グラフ (charts=True の場合) と詳細CSVを保存する
+    (作品ごとの並行処理の単位)。保存したCSVのパスを返す。読み込めなかった場合は None。
+    dedup_threshold を指定すると、類似度がそれ以上のレビューをまとめて代表の1件だけを解析し、
+    結果を同じグループの行に戻す (円グラフはグループを1件として数える)。
+    """
+    set_trace_rate(trace_rate)
+    title = config['title']
+    path = config['path']
+    review_col = config['review_col']
+    
+    print(f"\n==================== 📈 {title} の処理を開始 ====================")
+    profiler.set_title(title)
+    text_memo.reset_stats()
+    
+    with profiler.stage('load') as stage:
+        df = force_read_csv(path)
+        stage.items = len(df) if df is not None else 0
+    if df is None or review_col not in df.columns:
+        print(f"エラー: {title}のファイル読み込みまたは列名'{review_col}'の確認に失敗しました。スキップします。")
+        return None
 
-    all_analyzed_dfs = []
+    df_game = df.copy()
+    df_game['Game_Title'] = title 
+    df_game = df_game.rename(columns={review_col: 'Original_Review'})
+    df_game['Original_Review'] = df_game['Original_Review'].astype(str).str.strip().replace('nan', '')
+    df_game = df_game[df_game['Original_Review'].str.len() > 1]
+    # トークン表を引くためにCSVの行番号を残してから、番号を振り直す
+    row_ids = df_game.index.tolist()
+    df_game = df_game.reset_index(drop=True)
+    game_reviews = df_game['Original_Review'].tolist()
 
-    # --- 作品ごとの分析ループ ---
-    for config in file_config:
-        title = config['title']
-        path = config['path']
-        review_col = config['review_col']
-        
-        print(f"\n==================== 📈 {title} の処理を開始 ====================")
-        
-        df = force_read_csv(path)
-        if df is None or review_col not in df.columns:
-            print(f"エラー: {title}のファイル読み込みまたは列名'{review_col}'の確認に失敗しました。スキップします。")
-            continue
-
-        df_game = df.copy()
-        df_game['Game_Title'] = title 
-        df_game = df_game.rename(columns={review_col: 'Original_Review'})
-        df_game['Original_Review'] = df_game['Original_Review'].astype(str).str.strip().replace('nan', '')
-        df_game = df_game[df_game['Original_Review'].str.len() > 1].reset_index(drop=True)
-        game_reviews = df_game['Original_Review'].tolist()
-        
-        processed_reviews = [preprocess_text(review, mecab) for review in game_reviews]
-        
-        # 感情分析の実行
-        sentiment_results = [analyze_sentiment(words) for words in processed_reviews]
+    # 重複・類似レビューは代表の1件だけを解析する
+    unique_positions = np.arange(len(game_reviews))
+    inverse = None
+    if dedup_threshold is not None:
+        with profiler.stage('dedup', items=len(game_reviews)):
+            unique_positions, inverse = collapse_duplicates(game_reviews, dedup_threshold)
+        n_duplicates = len(game_reviews) - len(unique_positions)
+        print(f"🔁 {title}: 重複・類似レビュー {n_duplicates} / {len(game_reviews)} 件 "
+              f"({n_duplicates / max(len(game_reviews), 1):.1%}) をまとめて解析します。")
+    
+    # 形態素解析はトークン表として行い、他の分析と共有する (解析する行のうち、まだ表に無い行だけを解析する)
+    table_rows = [row_ids[i] for i in unique_positions]
+    table_texts = df[review_col].loc[table_rows]
+    with profiler.stage('tokenize') as stage:
+        table = load_token_table(path, review_col, get_mecab(), texts=table_texts,
+                                 workers=workers, cache=get_cache())
+        stage.items = len(table_rows)
+    if table is not None:
+        processed_reviews = preprocess_table(table, table_rows, table_texts.tolist())
+    else:
+        processed_reviews = preprocess_reviews([game_reviews[i] for i in unique_positions], get_mecab(),
+                                               workers=workers)
+    print(f"♻️ {title}: 前処理 {text_memo.summary()}。")
+    
+    # 感情分析の実行
+    with profiler.stage('score', items=len(processed_reviews)):
+        sentiment_results = analyze_sentiment_batch(processed_reviews)
         sentiment_df = pd.DataFrame(sentiment_results, columns=['Sentiment', 'Positive_Score', 'Negative_Score'])
+    if inverse is not None:
+        # 代表の結果を同じグループの行に戻す
+        sentiment_df = sentiment_df.iloc[inverse].reset_index(drop=True)
 
-        df_game['Sentiment'] = sentiment_df['Sentiment']
-        df_game['Positive_Score'] = sentiment_df['Positive_Score']
-        df_game['Negative_Score'] = sentiment_df['Negative_Score']
-        
-        # 感情極性の分布を可視化
+    df_game['Sentiment'] = sentiment_df['Sentiment']
+    df_game['Positive_Score'] = sentiment_df['Positive_Score']
+    df_game['Negative_Score'] = sentiment_df['Negative_Score']
+    if inverse is not None:
+        # 代表以外の行には、代表レビューのCSVの行番号を入れる
+        representatives = unique_positions[inverse]
+        duplicate_of = pd.Series(np.asarray(row_ids)[representatives], dtype='Int64')
+        duplicate_of[representatives == np.arange(len(df_game))] = pd.NA
+        df_game['Duplicate_Of'] = duplicate_of
+    
+    # 感情極性の分布を可視化
+    if charts:
         filename = f'results/{title}_sentiment_distribution_pie_chart.png'
-        plot_sentiment_distribution(df_game, filename, title=f'{title} レビュー感情極性の分布')
+        df_chart = df_game if inverse is None else df_game[df_game['Duplicate_Of'].isna()]
+        with profiler.stage('chart', items=1):
+            plot_sentiment_distribution(df_chart, filename, title=f'{title} レビュー感情極性の分布')
         print(f"✅ 感情分析結果を円グラフ '{filename}' として保存しました。")
 
-        # 結果をCSVに保存
-        output_path = f'results/{title}_sentiment_analysis_results.csv'
+    # 結果をCSVに保存
+    output_path = f'results/{title}_sentiment_analysis_results.csv'
+    with profiler.stage('write_csv', items=len(df_game)):
         df_game.to_csv(output_path, index=False, encoding='utf-8')
-        print(f"✅ 詳細結果を '{output_path}' に保存しました。")
+    print(f"✅ 詳細結果を '{output_path}' に保存しました。")
+    return output_path
+
+
+def main(workers=1, trace_rate=0.0, title_workers=1, charts=True, headless=False, dedup_threshold=None):
+    """
+    charts=False の場合は円グラフを作らない (matplotlib を読み込まない)。
+    headless=True の場合は画面を使わずに描画してファイルに保存する。
+    dedup_threshold を指定すると、重複・類似レビューを代表の1件だけ解析する (analyze_title を参照)。
+    """
+    print("作品別 感情分析を開始します...")
+    set_headless(headless)
+    # ストップワードを編集した場合に備え、形態素ごとの判定結果は実行ごとに作り直す
+    word_memo.clear()
+    text_memo.clear()
+
+    if not os.path.exists('results'):
+        os.makedirs('results')
+
+    # --- 作品ごとの分析 ---
+    # 作品ごとの処理は互いに独立なので、title_workers > 1 なら作品単位で並行に実行する
+    # (プロセスの入れ子を避けるため、その場合の形態素解析は各作品の中では並列化しない)
+    title_task = partial(analyze_title, workers=workers if title_workers <= 1 else 1, trace_rate=trace_rate,
+                         charts=charts, dedup_threshold=dedup_threshold)
+    run_titles(title_task, file_config, concurrency=title_workers)
+    profiler.set_title(None)
+
+    profiler.print_summary()
+    report_path = profiler.write_report()
+    print(f"✅ 処理時間の計測結果を '{report_path}' に保存しました。")
 
     print("\n--- 感情分析スクリプトの全処理を完了しました ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='作品別 感情分析')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析に使うプロセス数')
+    parser.add_argument('--trace-rate', type=float, default=0.0, help='トークン単位のデバッグ出力を行う割合 (0〜1)')
+    parser.add_argument('--title-workers', type=int, default=1, help='作品を並行して処理するプロセス数')
+    parser.add_argument('--no-charts', action='store_true', help='グラフを作らない (matplotlib を読み込まない)')
+    parser.add_argument('--headless', action='store_true', help='画面を使わずにグラフを描画してファイルに保存する')
+    parser.add_argument('--dedup', type=float, nargs='?', const=DEFAULT_THRESHOLD, default=None, metavar='THRESHOLD',
+                        help=f'類似度 THRESHOLD (省略時 {DEFAULT_THRESHOLD}) 以上の重複・類似レビューを1件として解析する')
+    args = parser.parse_args()
+    main(workers=args.workers, trace_rate=args.trace_rate, title_workers=args.title_workers,
+         charts=not args.no_charts, headless=args.headless, dedup_threshold=args.dedup)
\ No newline at end of file